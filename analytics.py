@@ -0,0 +1,444 @@
+# Intake history analytics and export. Reads water_reminder.db through its
+# own read-only connection, one chat at a time and in fixed size chunks, so
+# it can run next to the bot and memory stays flat however long the history
+# gets. Chunks are processed as NumPy arrays when NumPy is installed and as
+# plain lists otherwise, with the same results.
+#
+#   python -m analytics summary --db water_reminder.db
+#   python -m analytics export events --format csv --output events.csv
+#   python -m analytics export daily --format jsonl
+import argparse
+import bisect
+import csv
+import datetime
+import json
+import pathlib
+import sqlite3
+import sys
+from typing import Iterator, Optional
+
+try:
+    import numpy as np
+except ImportError:  # Optional; the list code below gives the same answers
+    np = None
+
+from user_settings import get_zone
+from water_reminder import DEFAULT_DAILY_GOAL
+
+CHUNK_SIZE = 65536  # Rows fetched from SQLite at a time
+ROLLING_WINDOWS = (7, 30)  # Days in the rolling averages
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+EVENTS_SQL = 'SELECT ts, amount FROM intake_events WHERE chat_id = ? ORDER BY ts'
+EXPORT_EVENTS_SQL = 'SELECT chat_id, ts, amount FROM intake_events ORDER BY chat_id, ts'
+EVENT_FIELDS = ('chat_id', 'timestamp', 'local_time', 'amount')
+DAILY_FIELDS = ('chat_id', 'day', 'total', 'entries', 'goal', 'goal_met')
+
+
+def connect(db_name: str) -> sqlite3.Connection:
+    # Read-only, so a running bot never waits on an export
+    return sqlite3.connect(pathlib.Path(db_name).absolute().as_uri() + '?mode=ro', uri=True)
+
+
+def day_label(day: int) -> str:
+    return datetime.date.fromordinal(EPOCH_ORDINAL + int(day)).isoformat()
+
+
+class ZoneOffsets:
+    # A zone's UTC offset only changes a couple of times a year, so the
+    # transitions are found once (sampled daily, then bisected to the
+    # second) and a whole chunk of timestamps is shifted with one sorted
+    # lookup instead of a datetime per row.
+    def __init__(self, timezone: Optional[str]):
+        self.zone = get_zone(timezone)
+        self.first_day = None
+        self.last_day = None
+        self.points = []
+        self.starts = []
+        self.offsets = []
+
+    def offset_at(self, ts: float) -> int:
+        moment = datetime.datetime.fromtimestamp(ts, self.zone)
+        return int((moment if self.zone else moment.astimezone()).utcoffset().total_seconds())
+
+    def transition(self, before: int, after: int) -> int:
+        offset = self.offset_at(before)
+        while after - before > 1:
+            middle = (before + after) // 2
+            if self.offset_at(middle) == offset:
+                before = middle
+            else:
+                after = middle
+        return after
+
+    def cover(self, first: float, last: float):
+        first_day, last_day = int(first // 86400), int(last // 86400) + 1
+        if self.first_day is None:
+            ranges = [(first_day, last_day)]
+        else:
+            ranges = [(start, end) for start, end in
+                      ((first_day, self.first_day), (self.last_day, last_day)) if start < end]
+        if not ranges:
+            return
+        for start, end in ranges:
+            offset = self.offset_at(start * 86400)
+            self.points.append((start * 86400, offset))
+            for day in range(start + 1, end + 1):
+                next_offset = self.offset_at(day * 86400)
+                if next_offset != offset:
+                    self.points.append((self.transition((day - 1) * 86400, day * 86400), next_offset))
+                    offset = next_offset
+        self.points.sort()
+        self.first_day = first_day if self.first_day is None else min(first_day, self.first_day)
+        self.last_day = last_day if self.last_day is None else max(last_day, self.last_day)
+        self.starts = [start for start, _ in self.points]
+        self.offsets = [offset for _, offset in self.points]
+        if np is not None:
+            self.starts = np.array(self.starts, dtype=float)
+            self.offsets = np.array(self.offsets, dtype=float)
+
+    def shift(self, ts):
+        # UTC timestamps -> seconds since the epoch on the local wall clock
+        if np is not None:
+            self.cover(ts.min(), ts.max())
+            return ts + self.offsets[np.searchsorted(self.starts, ts, side='right') - 1]
+        self.cover(min(ts), max(ts))
+        return [t + self.offsets[bisect.bisect_right(self.starts, t) - 1] for t in ts]
+
+
+def columns(rows: list[tuple]) -> tuple:
+    ts, amounts = zip(*rows)
+    if np is not None:
+        return np.array(ts, dtype=float), np.array(amounts, dtype=float)
+    return ts, amounts
+
+
+def days_and_hours(local) -> tuple:
+    if np is not None:
+        return (local // 86400).astype(np.int64), ((local % 86400) // 3600).astype(np.int64)
+    return [int(t // 86400) for t in local], [int(t % 86400 // 3600) for t in local]
+
+
+def wall_clock_labels(local) -> list[str]:
+    # ISO local times to the second
+    if np is not None:
+        return local.astype('datetime64[s]').astype(str).tolist()
+    return [(EPOCH + datetime.timedelta(seconds=int(t))).isoformat() for t in local]
+
+
+def reduce_days(days, totals, entries) -> tuple:
+    # Sorted day numbers -> one (day, total, entries) per distinct day
+    if np is not None:
+        if len(days) == 0:
+            return days, totals, entries
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        return days[starts], np.add.reduceat(totals, starts), np.add.reduceat(entries, starts)
+    out_days, out_totals, out_entries = [], [], []
+    for day, total, count in zip(days, totals, entries):
+        if out_days and out_days[-1] == day:
+            out_totals[-1] += total
+            out_entries[-1] += count
+        else:
+            out_days.append(day)
+            out_totals.append(total)
+            out_entries.append(count)
+    return out_days, out_totals, out_entries
+
+
+def concat(parts: list) -> list:
+    if np is not None:
+        return np.concatenate(parts) if parts else np.array([])
+    return [value for part in parts for value in part]
+
+
+def calendar(days, values, first_day: int, span: int, fill: float = 0.0):
+    # Per-day values with the days nothing was logged filled in
+    if np is not None:
+        series = np.full(span, fill)
+        series[np.asarray(days) - first_day] = values
+        return series
+    series = [fill] * span
+    for day, value in zip(days, values):
+        series[day - first_day] = value
+    return series
+
+
+def rolling_means(series, window: int):
+    # Mean of the last `window` days at each day; shorter at the start
+    if np is not None:
+        sums = np.cumsum(np.r_[0.0, series])
+        ends = np.arange(1, len(series) + 1)
+        starts = np.maximum(ends - window, 0)
+        return (sums[ends] - sums[starts]) / (ends - starts)
+    means, running = [], 0.0
+    for i, value in enumerate(series):
+        running += value - (series[i - window] if i >= window else 0.0)
+        means.append(running / min(i + 1, window))
+    return means
+
+
+def streaks(hits) -> tuple[int, int]:
+    # (streak ending on the last day, best streak) of consecutive True days
+    if np is not None:
+        misses = np.flatnonzero(~np.asarray(hits, dtype=bool))
+        edges = np.r_[-1, misses, len(hits)]
+        return int(len(hits) - 1 - edges[-2]), int((np.diff(edges) - 1).max())
+    current = best = 0
+    for hit in hits:
+        current = current + 1 if hit else 0
+        best = max(best, current)
+    return current, best
+
+
+class ChatHistory:
+    # One chat's intake history reduced to per-day totals and an hour of day
+    # histogram, built from chunks of raw events. Each day is scored against
+    # the goal it was logged with (`day_goals`, by day number); `goal` is
+    # the chat's current one, used for days without a recorded goal.
+    def __init__(self, chat_id: str, goal: float, day_goals: Optional[dict[int, float]] = None):
+        self.chat_id = chat_id
+        self.goal = goal
+        self.day_goals = day_goals or {}
+        self.days = []
+        self.totals = []
+        self.entries = []
+        self.goals = []
+        self.hour_counts = [0] * 24 if np is None else np.zeros(24, dtype=np.int64)
+        self.hour_totals = [0.0] * 24 if np is None else np.zeros(24)
+
+    def add_chunk(self, local, amounts):
+        days, hours = days_and_hours(local)
+        ones = [1] * len(amounts) if np is None else np.ones(len(amounts), dtype=np.int64)
+        days, totals, entries = reduce_days(days, amounts, ones)
+        self.days.append(days)
+        self.totals.append(totals)
+        self.entries.append(entries)
+        if np is not None:
+            self.hour_counts += np.bincount(hours, minlength=24)
+            self.hour_totals += np.bincount(hours, weights=amounts, minlength=24)
+        else:
+            for hour, amount in zip(hours, amounts):
+                self.hour_counts[hour] += 1
+                self.hour_totals[hour] += amount
+
+    def finish(self):
+        # A day can straddle two chunks, so the pieces are reduced once more
+        self.days, self.totals, self.entries = reduce_days(
+            concat(self.days), concat(self.totals), concat(self.entries)
+        )
+        self.goals = [self.day_goals.get(int(day), self.goal) for day in self.days]
+        if np is not None:
+            self.goals = np.array(self.goals, dtype=float)
+
+    def daily_rows(self) -> Iterator[tuple]:
+        for day, total, entries, goal in zip(self.days, self.totals, self.entries, self.goals):
+            yield (self.chat_id, day_label(day), round(float(total), 3), int(entries), float(goal),
+                   bool(total >= goal))
+
+    def summary(self) -> dict:
+        if len(self.days) == 0:
+            return {'chat_id': self.chat_id, 'days': 0, 'entries': 0, 'total': 0.0}
+        first_day, last_day = int(self.days[0]), int(self.days[-1])
+        span = last_day - first_day + 1
+        series = calendar(self.days, self.totals, first_day, span)
+        goals = calendar(self.days, self.goals, first_day, span, fill=self.goal)
+        hits = [total >= goal for total, goal in zip(series, goals)] if np is None else series >= goals
+        current, best = streaks(hits)
+        total = float(sum(series))
+        summary = {
+            'chat_id': self.chat_id,
+            'first_day': day_label(first_day),
+            'last_day': day_label(last_day),
+            'days': span,
+            'active_days': len(self.days),
+            'entries': int(sum(self.entries)),
+            'total': round(total, 3),
+            'daily_average': round(total / span, 3),
+            'goal': self.goal,
+            'goal_hit_rate': round(float(sum(hits)) / span, 4),
+            'current_streak': current,
+            'best_streak': best,
+        }
+        for window in ROLLING_WINDOWS:
+            means = rolling_means(series, window)
+            summary[f'rolling_{window}d'] = round(float(means[-1]), 3)
+            summary[f'best_{window}d'] = round(float(max(means)), 3)
+        summary['hour_histogram'] = [int(count) for count in self.hour_counts]
+        summary['hour_totals'] = [round(float(total), 3) for total in self.hour_totals]
+        return summary
+
+
+class Household:
+    # Adds up finished chats day by day; only per-day sums are kept
+    def __init__(self):
+        self.totals = {}
+        self.members = {}
+        self.hits = {}
+        self.chats = 0
+        self.entries = 0
+        self.hour_counts = [0] * 24
+
+    def add(self, history: ChatHistory):
+        self.chats += 1
+        self.entries += int(sum(history.entries))
+        for day, total, goal in zip(history.days, history.totals, history.goals):
+            day = int(day)
+            self.totals[day] = self.totals.get(day, 0.0) + float(total)
+            self.members[day] = self.members.get(day, 0) + 1
+            self.hits[day] = self.hits.get(day, 0) + (total >= goal)
+        for hour, count in enumerate(history.hour_counts):
+            self.hour_counts[hour] += int(count)
+
+    def summary(self) -> dict:
+        if not self.totals:
+            return {'chats': self.chats, 'days': 0, 'entries': 0, 'total': 0.0}
+        days = sorted(self.totals)
+        first_day, span = days[0], days[-1] - days[0] + 1
+        series = calendar(days, [self.totals[day] for day in days], first_day, span)
+        member_days = sum(self.members.values())
+        total = float(sum(series))
+        summary = {
+            'chats': self.chats,
+            'first_day': day_label(days[0]),
+            'last_day': day_label(days[-1]),
+            'days': span,
+            'entries': self.entries,
+            'total': round(total, 3),
+            'daily_average': round(total / span, 3),
+            'active_members_per_day': round(member_days / span, 3),
+            'goal_hit_rate': round(sum(self.hits.values()) / member_days, 4),
+        }
+        for window in ROLLING_WINDOWS:
+            means = rolling_means(series, window)
+            summary[f'rolling_{window}d'] = round(float(means[-1]), 3)
+            summary[f'best_{window}d'] = round(float(max(means)), 3)
+        summary['hour_histogram'] = self.hour_counts
+        return summary
+
+
+class IntakeAnalytics:
+    def __init__(self, db_name: str, chunk_size: int = CHUNK_SIZE, default_goal: float = DEFAULT_DAILY_GOAL):
+        self.conn = connect(db_name)
+        self.chunk_size = chunk_size
+        self.default_goal = default_goal
+        self.zones = {}
+
+    def close(self):
+        self.conn.close()
+
+    def optional_map(self, sql: str) -> dict:
+        # Databases from before a table existed are still readable
+        try:
+            return dict(self.conn.execute(sql).fetchall())
+        except sqlite3.OperationalError:
+            return {}
+
+    def day_goals(self, chat_id: str) -> dict[int, float]:
+        # The goal each day was logged with, as intake_daily recorded it
+        try:
+            rows = self.conn.execute('SELECT day, goal FROM intake_daily WHERE chat_id = ?', (chat_id,)).fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        return {datetime.date.fromisoformat(day).toordinal() - EPOCH_ORDINAL: goal for day, goal in rows}
+
+    def chat_ids(self) -> list[str]:
+        return [row[0] for row in self.conn.execute('SELECT DISTINCT chat_id FROM intake_events ORDER BY chat_id')]
+
+    def zone_offsets(self, timezone: Optional[str]) -> ZoneOffsets:
+        offsets = self.zones.get(timezone)
+        if offsets is None:
+            offsets = self.zones[timezone] = ZoneOffsets(timezone)
+        return offsets
+
+    def histories(self, chat_ids: Optional[list[str]] = None) -> Iterator[ChatHistory]:
+        # One finished ChatHistory per chat; only that chat's days are held
+        timezones = self.optional_map('SELECT chat_id, timezone FROM user_settings')
+        goals = self.optional_map('SELECT chat_id, daily_goal FROM user_sessions')
+        for chat_id in chat_ids or self.chat_ids():
+            history = ChatHistory(chat_id, goals.get(chat_id) or self.default_goal, self.day_goals(chat_id))
+            offsets = self.zone_offsets(timezones.get(chat_id))
+            cursor = self.conn.execute(EVENTS_SQL, (chat_id,))
+            while rows := cursor.fetchmany(self.chunk_size):
+                ts, amounts = columns(rows)
+                history.add_chunk(offsets.shift(ts), amounts)
+            history.finish()
+            yield history
+
+    def summary(self, chat_ids: Optional[list[str]] = None) -> dict:
+        household = Household()
+        chats = []
+        for history in self.histories(chat_ids):
+            household.add(history)
+            chats.append(history.summary())
+        return {'household': household.summary(), 'chats': chats}
+
+    def event_rows(self) -> Iterator[tuple]:
+        timezones = self.optional_map('SELECT chat_id, timezone FROM user_settings')
+        cursor = self.conn.execute(EXPORT_EVENTS_SQL)
+        while rows := cursor.fetchmany(self.chunk_size):
+            start = 0
+            while start < len(rows):
+                # Rows come sorted by chat, so each run shares one zone
+                chat_id = rows[start][0]
+                end = start
+                while end < len(rows) and rows[end][0] == chat_id:
+                    end += 1
+                run = rows[start:end]
+                ts, _ = columns([row[1:] for row in run])
+                labels = wall_clock_labels(self.zone_offsets(timezones.get(chat_id)).shift(ts))
+                for (_, t, amount), label in zip(run, labels):
+                    yield chat_id, t, label, amount
+                start = end
+
+    def daily_rows(self) -> Iterator[tuple]:
+        for history in self.histories():
+            yield from history.daily_rows()
+
+
+def write_rows(rows: Iterator[tuple], fields: tuple, out, fmt: str) -> int:
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(dict(zip(fields, row))) + '\n')
+            count += 1
+    return count
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(prog='analytics')
+    parser.add_argument('--db', default='water_reminder.db')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary = commands.add_parser('summary', help='per-chat and household aggregates as JSON')
+    summary.add_argument('--chat', action='append', help='only these chats (repeatable)')
+    summary.add_argument('--output', help='write here instead of stdout')
+    export = commands.add_parser('export', help='stream intake events or daily totals')
+    export.add_argument('table', choices=('events', 'daily'))
+    export.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    export.add_argument('--output', help='write here instead of stdout')
+    args = parser.parse_args(argv)
+
+    analytics = IntakeAnalytics(args.db, args.chunk_size)
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.command == 'summary':
+            out.write(json.dumps(analytics.summary(args.chat), indent=2) + '\n')
+        elif args.table == 'events':
+            write_rows(analytics.event_rows(), EVENT_FIELDS, out, args.format)
+        else:
+            write_rows(analytics.daily_rows(), DAILY_FIELDS, out, args.format)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        analytics.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+
+import requests
+
+
+class AsyncRunner:
+    # Runs a WaterReminder with update polling, update handling and reminder
+    # scheduling as independent asyncio tasks. The blocking WaterReminder
+    # methods run in worker threads so a slow sendMessage or a long poll
+    # never holds up the other tasks; replies go out through the outbox.
+    def __init__(self, reminder, poll_timeout: int = 30, tick_interval: float = 10,
+                 queue_size: int = 1000, retry_interval: float = 10):
+        self.reminder = reminder
+        self.poll_timeout = poll_timeout
+        self.tick_interval = tick_interval
+        self.queue_size = queue_size
+        self.retry_interval = retry_interval
+        self.update_offset = 0
+        self.updates = None
+
+    async def run(self):
+        reminder = self.reminder
+        self.updates = asyncio.Queue(self.queue_size)
+
+        await asyncio.to_thread(reminder.startup)
+        self.update_offset = reminder.update_offset
+        tasks = [
+            asyncio.create_task(self.poll_updates(), name='poll-updates'),
+            asyncio.create_task(self.handle_updates(), name='handle-updates'),
+            asyncio.create_task(self.schedule_reminders(), name='schedule-reminders'),
+        ]
+
+        try:
+            while not reminder.shutdown_flag:
+                await asyncio.sleep(0.2)
+        finally:
+            # Stop taking new work, then finish the updates already fetched
+            tasks[0].cancel()
+            await self.updates.join()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.to_thread(reminder.shutdown)
+
+    async def poll_updates(self):
+        while True:
+            # Only confirm what has been applied, so updates still waiting in
+            # the queue are fetched again after a crash; ones already queued
+            # are skipped here.
+            try:
+                updates = await asyncio.to_thread(
+                    self.reminder.get_updates, self.reminder.update_offset, self.poll_timeout
+                )
+            except requests.RequestException as e:
+                self.reminder.log_message(f"Error getting updates: {e}", 'error')
+                await asyncio.sleep(5)
+                continue
+
+            fresh = [update for update in updates if update["update_id"] >= self.update_offset]
+            if updates and not fresh:
+                # Everything returned is already queued; let the handler catch up
+                await self.updates.join()
+                if self.reminder.update_offset < self.update_offset:
+                    # The handler let some go; queue them again after a pause
+                    # instead of asking for the same updates over and over
+                    self.update_offset = self.reminder.update_offset
+                    await asyncio.sleep(self.tick_interval)
+            if fresh:
+                await self.updates.put(fresh)
+                self.update_offset = fresh[-1]["update_id"] + 1
+
+    async def handle_updates(self):
+        # A single consumer keeps updates in arrival order, which is what
+        # process_user_input relies on for per-chat totals. Each item is a
+        # getUpdates page, applied as one batch.
+        while True:
+            page = await self.updates.get()
+            try:
+                # Like WaterReminder.run(), keep at the same updates until they
+                # go through; apply_updates already skips ones that can't be
+                # applied, and the checkpoint keeps the rest from being applied
+                # twice. At shutdown they are left for the next start.
+                while True:
+                    try:
+                        await asyncio.to_thread(self.reminder.apply_updates, page)
+                        break
+                    except Exception as e:
+                        self.reminder.log_message(
+                            f"Error handling updates from {page[0].get('update_id')}: {e}", 'error'
+                        )
+                    if self.reminder.shutdown_flag:
+                        break
+                    await asyncio.sleep(self.retry_interval)
+            finally:
+                self.updates.task_done()
+
+    async def schedule_reminders(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.reminder.run_scheduled)
+            except Exception as e:
+                self.reminder.log_message(f"Error in reminder task: {e}", 'error')
+            # Sleep until the next deadline; tick_interval bounds how long a
+            # newly scheduled event can wait to be noticed
+            delay = self.reminder.seconds_until_next_due()
+            await asyncio.sleep(self.tick_interval if delay is None else min(delay, self.tick_interval))
@@ -0,0 +1,120 @@
+# Analytics summary and export over a multi-year synthetic intake history.
+#
+#   python -m bench.analytics_bench --chats 200 --years 3
+#
+# Summaries are timed with NumPy (when installed) and with the list
+# fallback; the events export is run again under tracemalloc and compared
+# with loading the whole table, to show memory stays flat.
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import analytics
+from analytics import IntakeAnalytics, write_rows
+from intake_log import IntakeLog
+from user_settings import UserSettings
+from water_reminder import QUIET_HOURS_END, QUIET_HOURS_START, WaterReminderDB
+
+TIMEZONES = (None, 'Europe/Athens', 'America/New_York', 'Asia/Tokyo', 'Australia/Adelaide')
+
+
+def synthetic_events(chats: int, start: float, days: int, per_day: int):
+    # A few drinks a day between 07:00 and 23:00, chat by chat
+    rng = random.Random(42)
+    for chat in range(chats):
+        chat_id = str(100000 + chat)
+        for day in range(days):
+            day_start = start + day * 86400
+            for _ in range(rng.randint(per_day - 3, per_day + 3)):
+                yield chat_id, day_start + rng.uniform(7 * 3600, 23 * 3600), rng.choice((0.1, 0.25, 0.33, 0.5))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def peak_memory(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--per-day', type=int, default=8, help='average entries per chat per day')
+    parser.add_argument('--chunk-size', type=int, default=analytics.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    days = int(args.years * 365)
+    start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days), datetime.time()).timestamp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, 'bench.db')
+        db = WaterReminderDB(db_name)
+        IntakeLog(db)
+        settings = UserSettings(db, QUIET_HOURS_START, QUIET_HOURS_END)
+        for chat in range(args.chats):
+            timezone = TIMEZONES[chat % len(TIMEZONES)]
+            if timezone:
+                settings.set_timezone(str(100000 + chat), timezone)
+        with db.lock, db.conn:
+            db.conn.executemany('INSERT INTO intake_events (chat_id, ts, amount) VALUES (?, ?, ?)',
+                                synthetic_events(args.chats, start, days, args.per_day))
+            events = db.conn.execute('SELECT COUNT(*) FROM intake_events').fetchone()[0]
+        db.close()
+
+        reader = IntakeAnalytics(db_name, args.chunk_size)
+        results = []
+        backends = ['numpy', 'lists'] if analytics.np is not None else ['lists']
+        np = analytics.np
+        for backend in backends:
+            analytics.np = np if backend == 'numpy' else None
+            reader.zones.clear()
+            elapsed, summary = timed(reader.summary)
+            results.append((f'summary ({backend})', elapsed))
+        analytics.np = np
+        reader.zones.clear()
+
+        export_path = os.path.join(tmp, 'events.csv')
+
+        def export_events():
+            with open(export_path, 'w', newline='') as out:
+                return write_rows(reader.event_rows(), analytics.EVENT_FIELDS, out, 'csv')
+
+        def export_daily():
+            with open(os.path.join(tmp, 'daily.jsonl'), 'w') as out:
+                return write_rows(reader.daily_rows(), analytics.DAILY_FIELDS, out, 'jsonl')
+
+        def load_everything():
+            return reader.conn.execute('SELECT chat_id, ts, amount FROM intake_events').fetchall()
+
+        results.append(('export events (csv)', timed(export_events)[0]))
+        results.append(('export daily (jsonl)', timed(export_daily)[0]))
+        export_peak = peak_memory(export_events)
+        fetchall_peak = peak_memory(load_everything)
+        export_size = os.path.getsize(export_path) / 1024 / 1024
+        reader.close()
+
+    household = summary['household']
+    print(f"events: {events:,}  chats: {args.chats:,}  days: {days}  chunk: {args.chunk_size:,}")
+    for name, elapsed in results:
+        print(f"  {name:22}: {elapsed:7.2f} s ({events / elapsed:,.0f} events/s)")
+    print(f"  export peak memory    : {export_peak:7.1f} MiB for a {export_size:.0f} MiB file")
+    print(f"  fetchall peak memory  : {fetchall_peak:7.1f} MiB")
+    print(f"  household: {household['daily_average']:.1f} L/day, goal hit rate {household['goal_hit_rate']:.0%}, "
+          f"best 7 days {household['best_7d']:.1f} L/day")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Bursty getUpdates pages of 100 updates: applying them one update per
+# transaction against one transaction per page with per-chat coalescing.
+# Outbox delivery is switched off so only processing is timed; the number
+# of messages each path queues is reported instead.
+#
+#   python -m bench.batch_bench --pages 50 --chats-per-page 10
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from fake_bot_api import FakeBotAPI
+from water_reminder import WaterReminder
+
+
+def make_pages(pages: int, chats_per_page: int, seed: int = 1) -> list[list[dict]]:
+    rng = random.Random(seed)
+    update_id = 1
+    result = []
+    for _ in range(pages):
+        chats = rng.sample(range(1000, 1000 + chats_per_page * 20), chats_per_page)
+        page = []
+        for _ in range(100):
+            text = rng.choice(('0.25', '250ml', '1 cup', '0.1', '/status'))
+            page.append({"update_id": update_id, "message": {"chat": {"id": rng.choice(chats)}, "text": text}})
+            update_id += 1
+        result.append(page)
+    return result
+
+
+def run(pages: list[list[dict]], batched: bool, household: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+        chat_ids = [str(1000 + i) for i in range(household)]
+        reminder = WaterReminder('BENCH', chat_ids, db_name=os.path.join(tmp, 'bench.db'), api_base=api.base_url)
+        reminder.log_message = lambda message, level='info': None
+        reminder.outbox.log = reminder.log_message
+        reminder.outbox.dispatch = lambda: {}
+        reminder.metrics.enabled = False
+
+        commits = 0
+
+        def trace(statement):
+            nonlocal commits
+            commits += statement == 'COMMIT'
+        reminder.db.conn.set_trace_callback(trace)
+
+        start = time.perf_counter()
+        for page in pages:
+            if batched:
+                reminder.apply_updates(page)
+            else:
+                for update in page:
+                    reminder.apply_update(update)
+        elapsed = time.perf_counter() - start
+        messages = reminder.outbox.stats()['depth']
+        reminder.telegram.close()
+        reminder.db.close()
+    updates = sum(len(page) for page in pages)
+    return {'updates_per_second': updates / elapsed, 'commits': commits, 'messages': messages}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--chats-per-page', type=int, default=10)
+    parser.add_argument('--household', type=int, default=3, help="chats that get each other's updates")
+    args = parser.parse_args()
+    pages = make_pages(args.pages, args.chats_per_page)
+
+    print(f"pages: {args.pages} x 100 updates from {args.chats_per_page} chats each")
+    results = {}
+    for batched in (False, True):
+        results[batched] = result = run(pages, batched, args.household)
+        print(f"  {'per page' if batched else 'per update':>10}: {result['updates_per_second']:8,.0f} updates/s, "
+              f"{result['commits']:6,} commits, {result['messages']:6,} messages queued")
+    print(f"  speedup: {results[True]['updates_per_second'] / results[False]['updates_per_second']:.1f}x, "
+          f"messages: {results[False]['messages'] / max(1, results[True]['messages']):.1f}x fewer")
+
+
+if __name__ == '__main__':
+    main()
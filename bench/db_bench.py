@@ -0,0 +1,73 @@
+# Micro-benchmark for WaterReminderDB session access.
+#
+#   python -m bench.db_bench --users 10000
+#
+# Compares the old connect-per-call access pattern against the pooled WAL
+# connection for the get/save/reset mix that WaterReminder.run performs.
+import argparse
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+
+from water_reminder import UserSession, WaterReminderDB
+
+
+class ConnectPerCallDB(WaterReminderDB):
+    # Mirrors the original implementation: a fresh connection and commit
+    # for every single operation, default rollback journal.
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_name, check_same_thread=False)
+
+    def get_user_session(self, chat_id: str) -> UserSession:
+        with sqlite3.connect(self.db_name) as conn:
+            row = conn.execute(self.SELECT_SESSION_SQL, (chat_id,)).fetchone()
+        if row is None:
+            session = UserSession(chat_id, 0.0, 2.5, datetime.datetime.now(), False)
+            self.save_user_session(session)
+            return session
+        return UserSession(row[0], row[1], row[2],
+                           datetime.datetime.fromisoformat(row[3]), bool(row[4]))
+
+    def save_user_session(self, session: UserSession):
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute(self.SAVE_SESSION_SQL, (
+                session.chat_id, session.current_intake, session.daily_goal,
+                session.last_update_time.isoformat(), int(session.goal_reached_notified)
+            ))
+            conn.commit()
+
+
+def run_workload(db: WaterReminderDB, users: int) -> tuple[int, float]:
+    chat_ids = [str(100000 + i) for i in range(users)]
+    ops = 0
+    start = time.perf_counter()
+    for chat_id in chat_ids:
+        session = db.get_user_session(chat_id)       # insert on first access
+        session.current_intake += 0.25
+        db.save_user_session(session)
+        db.get_user_session(chat_id)                 # /status
+        db.get_user_session(chat_id)                 # reminder scan
+        ops += 5
+    for chat_id in chat_ids[::10]:
+        db.reset_user_session(chat_id)
+        ops += 2
+    return ops, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, cls in (('connect-per-call', ConnectPerCallDB), ('pooled-wal', WaterReminderDB)):
+            db = cls(os.path.join(tmp, f'{label}.db'))
+            ops, elapsed = run_workload(db, args.users)
+            db.close()
+            print(f"{label:>18}: {ops} ops in {elapsed:.2f}s -> {ops / elapsed:,.0f} ops/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Fan-out latency for sendMessage against a local fake Bot API server.
+#
+#   python -m bench.fanout_bench --latency 0.02 --workers 8
+#
+# "sequential" repeats the original loop of requests.get calls without a
+# Session; "client" is TelegramClient.send_many over pooled connections.
+import argparse
+import time
+
+import requests
+
+from fake_bot_api import FakeBotAPI
+from telegram_client import TelegramClient
+
+
+def send_sequential(base_url: str, chat_ids: list[str], text: str):
+    url = f"{base_url}/botBENCH/sendMessage"
+    for chat_id in chat_ids:
+        response = requests.get(url, params={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
+        response.raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated server latency per send (s)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    with FakeBotAPI(latency=args.latency) as api:
+        client = TelegramClient('BENCH', api.base_url, max_workers=args.workers)
+        print(f"{'recipients':>10} {'sequential':>12} {'client':>12} {'speedup':>8}")
+        for size in args.sizes:
+            chat_ids = [str(1000 + i) for i in range(size)]
+
+            start = time.perf_counter()
+            send_sequential(api.base_url, chat_ids, 'benchmark')
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = client.send_many(chat_ids, 'benchmark')
+            pooled = time.perf_counter() - start
+            assert not any(isinstance(r, Exception) for r in results)
+
+            print(f"{size:>10} {sequential * 1000:>10.1f}ms {pooled * 1000:>10.1f}ms {sequential / pooled:>7.1f}x")
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
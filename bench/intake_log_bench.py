@@ -0,0 +1,107 @@
+# /history and /stats query cost on a large synthetic intake event log.
+#
+#   python -m bench.intake_log_bench --events 20000000 --chats 2000
+#
+# Events are bulk loaded and rollups rebuilt once; then the rollup-backed
+# queries are timed against the equivalent aggregation over raw events.
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from intake_log import IntakeLog
+from water_reminder import WaterReminderDB
+
+
+def synthetic_events(count: int, chats: int, start: float, span_days: int):
+    rng = random.Random(42)
+    span = span_days * 86400
+    for _ in range(count):
+        yield (str(100000 + rng.randrange(chats)), start + rng.random() * span,
+               rng.choice((0.1, 0.25, 0.33, 0.5, 0.75)))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+    start = datetime.datetime.combine(today - datetime.timedelta(days=args.days - 1), datetime.time()).timestamp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WaterReminderDB(os.path.join(tmp, 'bench.db'))
+        log = IntakeLog(db)
+
+        began = time.perf_counter()
+        with db.lock, db.conn:
+            db.conn.executemany(
+                'INSERT INTO intake_events (chat_id, ts, amount) VALUES (?, ?, ?)',
+                synthetic_events(args.events, args.chats, start, args.days)
+            )
+        load = time.perf_counter() - began
+
+        began = time.perf_counter()
+        log.rebuild_rollups(2.5)
+        rebuild = time.perf_counter() - began
+
+        began = time.perf_counter()
+        for i in range(1000):
+            log.record(str(100000 + i % args.chats), 0.25, datetime.datetime.now(), 2.5)
+        record = time.perf_counter() - began  # seconds per 1000 entries == ms per entry
+
+        chat_ids = [str(100000 + i) for i in range(args.chats)]
+        rng = random.Random(7)
+
+        def rollup_query():
+            chat_id = rng.choice(chat_ids)
+            log.summary(chat_id, today, 7)
+            log.summary(chat_id, today, 30)
+            log.streak(chat_id, today)
+
+        def raw_query():
+            chat_id = rng.choice(chat_ids)
+            since = datetime.datetime.combine(today - datetime.timedelta(days=29), datetime.time()).timestamp()
+            with db.lock:
+                db.conn.execute(
+                    "SELECT date(ts, 'unixepoch', 'localtime') AS day, SUM(amount) FROM intake_events "
+                    "WHERE chat_id = ? AND ts >= ? GROUP BY day", (chat_id, since)
+                ).fetchall()
+
+        def raw_streak():
+            # A streak needs every day since the chat started
+            chat_id = rng.choice(chat_ids)
+            with db.lock:
+                db.conn.execute(
+                    "SELECT date(ts, 'unixepoch', 'localtime') AS day, SUM(amount) FROM intake_events "
+                    "WHERE chat_id = ? GROUP BY day ORDER BY day DESC", (chat_id,)
+                ).fetchall()
+
+        rollup = timed(rollup_query, args.repeat)
+        raw = timed(raw_query, args.repeat)
+        streak = timed(raw_streak, max(1, args.repeat // 10))
+        db.close()
+
+    print(f"events: {args.events:,}  chats: {args.chats:,}  days: {args.days}")
+    print(f"  bulk load             : {load:8.2f} s ({args.events / load:,.0f} events/s)")
+    print(f"  rebuild rollups       : {rebuild:8.2f} s")
+    print(f"  record() incl. rollups: {record:8.2f} ms per entry")
+    print(f"  /stats from rollups   : {rollup:8.3f} ms")
+    print(f"  30-day scan of events : {raw:8.3f} ms")
+    print(f"  streak scan of events : {streak:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# End-to-end load benchmark: drives a WaterReminder against FakeBotAPI with
+# simulated chats and reports throughput, reply latency, DB statements and
+# memory as JSON, so runs can be diffed across commits.
+#
+#   python -m bench.load_bench --chats 200 --rate 50 --duration 20 --output run.json
+#   python -m bench.load_bench --mode async --error-rate 0.01 --rate-limit-rate 0.01
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from async_runner import AsyncRunner
+from fake_bot_api import FakeBotAPI
+from water_reminder import WaterReminder
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class LoadDriver:
+    # Pushes intake updates from simulated chats at a fixed total rate and
+    # remembers when each was sent, so replies can be matched per chat in
+    # FIFO order.
+    def __init__(self, api: FakeBotAPI, chat_ids: list[str], rate: float, seed: int = 1):
+        self.api = api
+        self.chat_ids = chat_ids
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.pushed = defaultdict(deque)
+        self.total = 0
+
+    def run(self, duration: float):
+        interval = 1.0 / self.rate
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            chat_id = self.random.choice(self.chat_ids)
+            self.pushed[chat_id].append(time.monotonic())
+            self.api.push_update(int(chat_id), self.random.choice(('0.1', '0.2', '0.25')))
+            self.total += 1
+            next_at = start + self.total * interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    def reply_latencies(self) -> list[float]:
+        pushed = {chat_id: deque(times) for chat_id, times in self.pushed.items()}
+        latencies = []
+        with self.api.condition:
+            sent = list(self.api.sent)
+        for message in sent:
+            queue = pushed.get(str(message["chat_id"]))
+            if queue and message["text"].startswith("Update:"):
+                latencies.append(message["sent_at"] - queue.popleft())
+        return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--chats', type=int, default=100, help='simulated chats sending updates')
+    parser.add_argument('--household', type=int, default=2, help='configured chat_ids receiving shared updates')
+    parser.add_argument('--rate', type=float, default=20, help='incoming messages per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load')
+    parser.add_argument('--drain', type=float, default=30, help='seconds to wait for outstanding replies')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake sendMessage latency (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--digest-window', type=float, help='debounce window for household digests')
+    parser.add_argument('--digest-max-delay', type=float, help='longest a household digest may wait')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    household = [str(1000 + i) for i in range(args.household)]
+    senders = [str(2000 + i) for i in range(args.chats)]
+
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI(
+            latency=args.latency, error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate, seed=1) as api:
+        reminder = WaterReminder('BENCH', household, db_name=os.path.join(tmp, 'bench.db'),
+                                 api_base=api.base_url)
+        reminder.max_poll_timeout = 1
+        if args.digest_window is not None:
+            reminder.notifications.window = args.digest_window
+        if args.digest_max_delay is not None:
+            reminder.notifications.max_delay = args.digest_max_delay
+        # Keep the benchmark quiet and count every statement SQLite runs
+        reminder.log_message = lambda message, level='info': None
+        reminder.outbox.log = reminder.log_message
+        statements = Counter()
+        reminder.db.conn.set_trace_callback(lambda sql: statements.update([sql.split(None, 1)[0].upper()]))
+
+        if args.mode == 'async':
+            runner = AsyncRunner(reminder, poll_timeout=1, tick_interval=1)
+            target = lambda: asyncio.run(runner.run())
+        else:
+            target = reminder.run
+        thread = threading.Thread(target=target, name='bot')
+        thread.start()
+
+        driver = LoadDriver(api, senders, args.rate)
+        started = time.monotonic()
+        driver.run(args.duration)
+        deadline = time.monotonic() + args.drain
+        while len(driver.reply_latencies()) < driver.total and time.monotonic() < deadline:
+            time.sleep(0.1)
+        elapsed = time.monotonic() - started
+
+        outbox_stats = reminder.outbox.stats()
+        notification_stats = reminder.notifications.stats()
+        reminder.shutdown_flag = True
+        thread.join()
+        latencies = driver.reply_latencies()
+
+        report = {
+            'benchmark': 'load',
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'config': vars(args),
+            'results': {
+                'updates_sent': driver.total,
+                'replies': len(latencies),
+                'elapsed_s': elapsed,
+                'throughput_per_s': len(latencies) / elapsed if elapsed else 0.0,
+                'reply_latency_ms': {
+                    'p50': percentile(latencies, 0.50) * 1000,
+                    'p90': percentile(latencies, 0.90) * 1000,
+                    'p99': percentile(latencies, 0.99) * 1000,
+                    'max': max(latencies, default=0.0) * 1000,
+                },
+                'db_statements': dict(statements),
+                'db_statements_per_update': sum(statements.values()) / driver.total if driver.total else 0.0,
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                'api': api.stats(),
+                'outbox': outbox_stats,
+                'notifications': notification_stats,
+                'session_cache': reminder.sessions.stats(),
+            },
+        }
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Cost of the metrics layer on the hot path.
+#
+#   python -m bench.metrics_bench --iterations 200000
+import argparse
+import os
+import tempfile
+import time
+
+from fake_bot_api import FakeBotAPI
+from metrics import MetricsRegistry
+from water_reminder import WaterReminder
+
+
+def per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    enabled = MetricsRegistry()
+    disabled = MetricsRegistry(enabled=False)
+
+    def timed_block(metrics):
+        def run():
+            with metrics.time('bench_seconds', method='x'):
+                pass
+        return run
+
+    baseline = per_call(lambda: None, args.iterations)
+    print(f"empty call                 : {baseline:6.2f} us")
+    print(f"time() disabled            : {per_call(timed_block(disabled), args.iterations):6.2f} us")
+    print(f"time() enabled             : {per_call(timed_block(enabled), args.iterations):6.2f} us")
+    print(f"inc() enabled              : {per_call(lambda: enabled.inc('bench_total', method='x'), args.iterations):6.2f} us")
+
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+        reminder = WaterReminder('BENCH', ['1'], db_name=os.path.join(tmp, 'bench.db'), api_base=api.base_url)
+        reminder.log_message = lambda message, level='info': None
+        reminder.outbox.log = reminder.log_message
+        iterations = max(1, args.iterations // 10)
+        for text in ('/status', '0.25'):
+            reminder.metrics.enabled = True
+            with_metrics = per_call(lambda: reminder.process_user_input(text, '1'), iterations)
+            reminder.metrics.enabled = False
+            without_metrics = per_call(lambda: reminder.process_user_input(text, '1'), iterations)
+            print(f"{text!r:>8} without metrics : {without_metrics:8.2f} us")
+            print(f"{text!r:>8} with metrics    : {with_metrics:8.2f} us "
+                  f"({(with_metrics - without_metrics) / without_metrics * 100:+.1f}%)")
+        reminder.telegram.close()
+        reminder.db.close()
+
+
+if __name__ == '__main__':
+    main()
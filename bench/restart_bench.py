@@ -0,0 +1,79 @@
+# Time to first reply after a restart with a backlog of pending updates:
+# a cold start (no checkpoint, so every chat is greeted again) against a
+# warm restart from the checkpoint.
+#
+#   python -m bench.restart_bench --chats 300 --backlog 2000
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from fake_bot_api import FakeBotAPI
+from water_reminder import WaterReminder
+
+
+def replies(api: FakeBotAPI) -> list[float]:
+    with api.condition:
+        return [m["sent_at"] for m in api.sent if m["text"].startswith("Current intake")]
+
+
+def restart(db_name: str, api: FakeBotAPI, chat_ids: list[str], backlog: int, warm: bool) -> dict:
+    reminder = WaterReminder('BENCH', chat_ids, db_name=db_name, api_base=api.base_url)
+    with reminder.db.lock, reminder.db.conn:
+        # Pretend the previous run delivered everything it queued
+        reminder.db.conn.execute('DELETE FROM outbox')
+        if not warm:
+            reminder.db.conn.execute('DELETE FROM bot_state')
+    reminder.db.close()
+    reminder.telegram.close()
+
+    with api.condition:
+        api.sent.clear()
+    for i in range(backlog):
+        api.push_update(5000 + i % 100, "/status")
+
+    start = time.monotonic()
+    reminder = WaterReminder('BENCH', chat_ids, db_name=db_name, api_base=api.base_url)
+    reminder.log_message = lambda message, level='info': None
+    reminder.outbox.log = reminder.log_message
+    reminder.max_poll_timeout = 1
+    thread = threading.Thread(target=reminder.run)
+    thread.start()
+    applied = None
+    try:
+        while len(replies(api)) < backlog:
+            if applied is None and api.stats()['pending_updates'] == 0 and reminder.update_offset:
+                applied = time.monotonic() - start
+            time.sleep(0.01)
+    finally:
+        reminder.shutdown_flag = True
+        thread.join()
+    sent = sorted(replies(api))
+    return {
+        'first_reply': sent[0] - start,
+        'applied': applied or sent[-1] - start,
+        'all_replies': sent[-1] - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--backlog', type=int, default=2000)
+    args = parser.parse_args()
+    chat_ids = [str(1000 + i) for i in range(args.chats)]
+
+    print(f"chats: {args.chats}  backlog: {args.backlog} updates")
+    for warm in (False, True):
+        with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+            db_name = os.path.join(tmp, 'bench.db')
+            # First run leaves a checkpoint, sessions and schedule behind
+            restart(db_name, api, chat_ids, 1, warm=False)
+            result = restart(db_name, api, chat_ids, args.backlog, warm)
+        print(f"  {'warm' if warm else 'cold'} start: first reply {result['first_reply'] * 1000:8.1f} ms, "
+              f"backlog applied {result['applied']:6.2f} s, last reply {result['all_replies']:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Dispatch cost per command: the router against the old "load the session,
+# then walk an if/elif chain of text.lower()" approach.
+#
+#   python -m bench.router_bench --iterations 200000
+import argparse
+import os
+import tempfile
+import time
+
+from command_router import CommandRouter, parse_amounts
+from fake_bot_api import FakeBotAPI
+from water_reminder import WaterReminder
+
+TEXTS = ('/start', '/status', '/history 7', '/stats', '/unknown', '0.5', '500ml + 2 cups')
+
+
+def per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def chain_dispatch(load_session, text: str, chat_id: str) -> str:
+    session = load_session(chat_id)
+    if text.lower() == "/clear":
+        return 'clear'
+    elif text.lower() == "/reset":
+        return 'reset'
+    elif text.lower() == "/start":
+        return 'start'
+    elif text.lower() == "/status":
+        return 'status'
+    elif text.lower().split()[:1] == ["/history"]:
+        return 'history'
+    elif text.lower() == "/stats":
+        return 'stats'
+    elif text.lower() == "/metrics":
+        return 'metrics'
+    try:
+        return str(float(text) + session)
+    except ValueError:
+        return 'invalid'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    # Pure dispatch: handlers and session loads are stubs, so only routing is timed
+    def load_session(chat_id):
+        return 0.0
+
+    def intake(chat_id, text, session):
+        try:
+            return str(sum(parse_amounts(text)) + session)
+        except ValueError:
+            return 'invalid'
+
+    router = CommandRouter(load_session)
+    for name in ('/clear', '/reset', '/start', '/history', '/stats', '/metrics'):
+        router.register(name, lambda chat_id, rest, name=name: name)
+    router.register('/status', lambda chat_id, rest, session: 'status', needs_session=True)
+    router.set_fallback(intake, needs_session=True)
+
+    print(f"{'input':>16} {'if/elif':>10} {'router':>10}")
+    for text in TEXTS:
+        chain = per_call(lambda: chain_dispatch(load_session, text, '1'), args.iterations)
+        routed = per_call(lambda: router.handle(text, '1'), args.iterations)
+        print(f"{text!r:>16} {chain:>8.2f}us {routed:>8.2f}us")
+
+    # End to end through WaterReminder with the session cache cold, so commands
+    # that need a session pay for a SQLite read
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+        reminder = WaterReminder('BENCH', ['1'], db_name=os.path.join(tmp, 'bench.db'), api_base=api.base_url)
+        reminder.log_message = lambda message, level='info': None
+        reminder.outbox.log = reminder.log_message
+        reminder.metrics.enabled = False
+        iterations = max(1, args.iterations // 20)
+
+        def cold_load():
+            reminder.sessions.invalidate(['1'])
+            reminder.sessions.get_user_session('1')
+        print(f"\ncold session load (paid by every command before): {per_call(cold_load, iterations):.2f}us")
+        print(f"{'input':>16} {'cold cache':>12} {'session loads':>14}")
+        for text in ('/start', '/history 7', '/stats', '/status'):
+            def cold():
+                reminder.sessions.invalidate(['1'])
+                reminder.process_user_input(text, '1')
+            misses = reminder.sessions.stats()['misses']
+            cost = per_call(cold, iterations)
+            loads = reminder.sessions.stats()['misses'] - misses
+            print(f"{text!r:>16} {cost:>10.2f}us {loads:>14,}")
+        reminder.telegram.close()
+        reminder.db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Per-tick reminder cost with many chats: the old full scan versus the
+# heap-backed ReminderScheduler.
+#
+#   python -m bench.scheduler_bench --chats 100000
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from scheduler import ReminderScheduler
+from session_cache import SessionCache
+from water_reminder import WaterReminderDB
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=100000)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--due-fraction', type=float, default=0.001,
+                        help='share of chats that become due on each tick')
+    args = parser.parse_args()
+
+    chat_ids = [str(1000000 + i) for i in range(args.chats)]
+    now = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WaterReminderDB(os.path.join(tmp, 'bench.db'))
+        sessions = SessionCache(db, max_size=args.chats)
+        for chat_id in chat_ids:
+            sessions.get_user_session(chat_id)
+
+        # Old loop: every tick loads every session and checks its timer
+        last_reminder_times = {chat_id: now - random.uniform(0, 3600) for chat_id in chat_ids}
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            tick_now = now + tick * 10
+            for chat_id in chat_ids:
+                session = sessions.get_user_session(chat_id)
+                if (tick_now - last_reminder_times[chat_id] >= 3600 and
+                        session.current_intake < session.daily_goal):
+                    last_reminder_times[chat_id] = tick_now
+        scan = (time.perf_counter() - start) / args.ticks
+
+        scheduler = ReminderScheduler(db)
+        start = time.perf_counter()
+        for chat_id in chat_ids:
+            scheduler.schedule(chat_id, 'reminder', now + random.uniform(0, 3600))
+            scheduler.schedule(chat_id, 'reset', now + 86400)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scheduler.save()
+        save = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scheduler.load()
+        load = time.perf_counter() - start
+
+        # Heap loop: each tick only pops the chats that are due
+        step = 3600 * args.due_fraction
+        fired = 0
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            tick_now = now + tick * step
+            for chat_id, kind, due in scheduler.pop_due(tick_now):
+                session = sessions.get_user_session(chat_id)
+                if session.current_intake < session.daily_goal:
+                    scheduler.schedule(chat_id, kind, tick_now + 3600)
+                fired += 1
+        heap = (time.perf_counter() - start) / args.ticks
+
+        db.close()
+
+    print(f"chats: {args.chats:,}  ticks: {args.ticks}  events fired: {fired:,}")
+    print(f"  full scan tick      : {scan * 1000:9.2f} ms")
+    print(f"  heap tick           : {heap * 1000:9.2f} ms  ({scan / heap:,.0f}x faster)")
+    print(f"  build {len(scheduler):,} entries : {build * 1000:9.2f} ms")
+    print(f"  persist / restore   : {save * 1000:9.2f} ms / {load * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
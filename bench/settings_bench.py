@@ -0,0 +1,75 @@
+# Quiet-hours check cost with many chats in mixed timezones: cached
+# transition timestamps against working it out from the wall clock each time.
+#
+#   python -m bench.settings_bench --chats 100000
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from user_settings import UserSettings
+from water_reminder import QUIET_HOURS_END, QUIET_HOURS_START, WaterReminderDB
+
+TIMEZONES = ('Europe/Athens', 'Europe/London', 'America/New_York', 'America/Los_Angeles',
+             'Asia/Tokyo', 'Asia/Kolkata', 'Australia/Sydney', 'Pacific/Auckland', None)
+
+
+def wall_clock_is_quiet(settings) -> bool:
+    # What is_quiet_hours did, per chat
+    current_time = datetime.datetime.now(settings.zone).time()
+    if settings.quiet_start <= settings.quiet_end:
+        return settings.quiet_start <= current_time <= settings.quiet_end
+    return current_time >= settings.quiet_start or current_time <= settings.quiet_end
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WaterReminderDB(os.path.join(tmp, 'bench.db'))
+        settings = UserSettings(db, QUIET_HOURS_START, QUIET_HOURS_END)
+        chat_ids = [str(i) for i in range(args.chats)]
+        with db.lock, db.conn:
+            db.conn.executemany(
+                'INSERT INTO user_settings (chat_id, timezone, quiet_start, quiet_end) VALUES (?, ?, ?, ?)',
+                [(chat_id, rng.choice(TIMEZONES), f"{rng.randrange(20, 24)}:00", f"0{rng.randrange(5, 9)}:30")
+                 for chat_id in chat_ids]
+            )
+
+        start = time.perf_counter()
+        settings.load()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for chat_id in chat_ids:
+            settings.is_quiet(chat_id, time.time())
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            now = time.time()
+            quiet = sum(settings.is_quiet(chat_id, now) for chat_id in chat_ids)
+        cached = (time.perf_counter() - start) / args.rounds
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            sum(wall_clock_is_quiet(settings.settings[chat_id]) for chat_id in chat_ids)
+        wall_clock = (time.perf_counter() - start) / args.rounds
+        db.close()
+
+    per_chat = 1e9 / args.chats
+    print(f"chats: {args.chats:,}  timezones: {len(TIMEZONES)}  quiet right now: {quiet:,}")
+    print(f"  load settings          : {load:8.3f} s")
+    print(f"  first check (compute)  : {first * per_chat:8.0f} ns/chat")
+    print(f"  cached check           : {cached * per_chat:8.0f} ns/chat ({cached * 1000:.1f} ms per sweep)")
+    print(f"  wall clock per check   : {wall_clock * per_chat:8.0f} ns/chat ({wall_clock * 1000:.1f} ms per sweep)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Sharded update processing throughput against FakeBotAPI for different
+# worker counts.
+#
+#   python -m bench.shard_bench --workers 1 2 4 --updates 20000 --chats 2000
+#
+# The whole backlog is queued on the fake API first, then timed from the
+# first routed update until every worker has applied its share. The outbox
+# rate limit is lifted so replies don't cap the numbers.
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from fake_bot_api import FakeBotAPI
+from sharding import ShardedRunner
+
+
+def run(workers: int, updates: int, chats: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    senders = [2000 + i for i in range(chats)]
+    with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+        for _ in range(updates):
+            api.push_update(rng.choice(senders), rng.choice(('0.1', '0.2', '250ml', '/status')))
+        runner = ShardedRunner('BENCH', ['1000', '1001'], workers, db_name=os.path.join(tmp, 'bench.db'),
+                               api_base=api.base_url, poll_timeout=1, tick_interval=0.2, outbox_rate=1e9)
+        thread = threading.Thread(target=runner.run, name='sharded-runner')
+        thread.start()
+
+        while runner.routed == 0 and thread.is_alive():
+            time.sleep(0.001)
+        started = time.perf_counter()
+        while runner.applied < updates and thread.is_alive():
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - started
+
+        runner.shutdown_flag = True
+        thread.join()
+        sent = api.stats()['sent']
+    return {'workers': workers, 'elapsed': elapsed, 'rate': updates / elapsed, 'sent': sent}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--chats', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"updates: {args.updates:,}  chats: {args.chats:,}  cpus: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        result = run(workers, args.updates, args.chats)
+        baseline = baseline or result['rate']
+        print(f"  {workers:2d} workers: {result['rate']:8,.0f} updates/s ({result['elapsed']:6.2f} s, "
+              f"{result['rate'] / baseline:4.2f}x, {result['sent']:,} messages sent)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import datetime
+import time
+from typing import Optional
+
+
+class SystemClock:
+    # The real wall clock, used unless something else is passed in
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    # Only moves when told to, so a simulation can jump straight to the
+    # next thing that happens instead of waiting for it
+    def __init__(self, start: Optional[float] = None):
+        self.current = time.time() if start is None else start
+
+    def time(self) -> float:
+        return self.current
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.current)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        self.current += max(0.0, seconds)
+
+    def advance_to(self, timestamp: float):
+        self.current = max(self.current, timestamp)
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,96 @@
+import contextlib
+import re
+from typing import Callable, Optional
+
+# Litres per unit; bare numbers are litres
+UNITS = {
+    'ml': 0.001, 'milliliter': 0.001, 'milliliters': 0.001, 'millilitre': 0.001, 'millilitres': 0.001,
+    'l': 1.0, 'liter': 1.0, 'liters': 1.0, 'litre': 1.0, 'litres': 1.0,
+    'cup': 0.25, 'cups': 0.25,
+    'oz': 0.0295735, 'floz': 0.0295735,
+}
+
+# One entry: signed number, optional unit (never "and"), optional separator before the next one
+AMOUNT_RE = re.compile(
+    r'\s*([-+]?(?:\d+(?:[.,]\d+)?\.?|\.\d+))\s*(?!and\b)([a-z]+)?\s*(?:[;+&]|,(?!\d)|and\b)?',
+    re.IGNORECASE
+)
+
+
+def parse_amounts(text: str) -> list[float]:
+    # Single left-to-right pass over e.g. "500ml", "2 cups" or "0.5, 250ml + 8oz"
+    amounts = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        match = AMOUNT_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Could not parse amount: {text!r}")
+        number, unit = match.groups()
+        factor = 1.0
+        if unit is not None:
+            factor = UNITS.get(unit.lower())
+            if factor is None:
+                raise ValueError(f"Unknown unit: {unit!r}")
+        amounts.append(float(number.replace(',', '.')) * factor)
+        pos = match.end()
+    if not amounts:
+        raise ValueError("No amount given")
+    return amounts
+
+
+class Command:
+    __slots__ = ('name', 'handler', 'needs_session')
+
+    def __init__(self, name: str, handler: Callable, needs_session: bool):
+        self.name = name
+        self.handler = handler
+        self.needs_session = needs_session
+
+
+class CommandRouter:
+    # Maps "/command" to its handler. Only handlers registered with
+    # needs_session get the chat's session loaded for them, so commands
+    # like /start or /clear never touch the session store. `timer` wraps
+    # each handler call and gets the command's metric label.
+    def __init__(self, load_session: Callable[[str], object],
+                 timer: Callable[[str], contextlib.AbstractContextManager] = lambda label: contextlib.nullcontext()):
+        self.load_session = load_session
+        self.timer = timer
+        self.commands = {}
+        self.fallback = None
+
+    def register(self, name: str, handler: Callable, needs_session: bool = False):
+        self.commands[name] = Command(name, handler, needs_session)
+
+    def set_fallback(self, handler: Callable, needs_session: bool = False, name: str = 'intake'):
+        # Used for anything that isn't a registered command; gets the whole text
+        self.fallback = Command(name, handler, needs_session)
+
+    def resolve(self, text: str) -> tuple[Optional[Command], str]:
+        text = text.strip()
+        if text.startswith('/'):
+            word, _, args = text.partition(' ')
+            # Group chats address commands as /status@SomeBot
+            command = self.commands.get(word.partition('@')[0].lower())
+            if command is not None:
+                return command, args.strip()
+        return self.fallback, text
+
+    def label(self, command: Optional[Command], text: str) -> str:
+        # Bounded set of metric labels, whatever users type
+        if command is None or (command is self.fallback and text.startswith('/')):
+            return 'unknown'
+        return command.name.lstrip('/')
+
+    def dispatch(self, command: Optional[Command], args: str, chat_id: str) -> Optional[str]:
+        if command is None:
+            return None
+        if command.needs_session:
+            return command.handler(chat_id, args, self.load_session(chat_id))
+        return command.handler(chat_id, args)
+
+    def handle(self, text: str, chat_id: str) -> Optional[str]:
+        command, args = self.resolve(text)
+        with self.timer(self.label(command, text)):
+            return self.dispatch(command, args, chat_id)
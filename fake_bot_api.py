@@ -0,0 +1,203 @@
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+def error_payload(status: int, retry_after: Optional[int] = None) -> dict:
+    descriptions = {429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway"}
+    payload = {"ok": False, "error_code": status, "description": descriptions.get(status, "Error")}
+    if retry_after is not None:
+        payload["description"] += f": retry after {retry_after}"
+        payload["parameters"] = {"retry_after": retry_after}
+    return payload
+
+
+class FakeBotAPI:
+    # Local stand-in for the parts of the Telegram Bot API the bot uses
+    # (getUpdates and sendMessage), for tests and benchmarks. sendMessage can
+    # be slowed down with `latency` and made to fail: randomly with
+    # `error_rate` (500) and `rate_limit_rate` (429 with `retry_after`), or
+    # deterministically with inject_error().
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: int = 1,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.injected = deque()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.updates = []
+        self.sent = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.condition = threading.Condition()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.condition:
+            self.condition.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def push_update(self, chat_id, text: str) -> dict:
+        with self.condition:
+            update = {
+                "update_id": self.next_update_id,
+                "message": {
+                    "message_id": self.next_update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": text,
+                },
+            }
+            self.next_update_id += 1
+            self.updates.append(update)
+            self.condition.notify_all()
+            return update
+
+    def wait_for_messages(self, count: int, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.sent) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def messages_for(self, chat_id) -> list[str]:
+        with self.condition:
+            return [m["text"] for m in self.sent if str(m["chat_id"]) == str(chat_id)]
+
+    def get_updates(self, params: dict) -> dict:
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            # getUpdates confirms everything below the offset
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return {"ok": True, "result": list(self.updates[:100])}
+
+    def send_message(self, params: dict) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.condition:
+            message = {
+                "message_id": self.next_message_id,
+                "chat_id": params.get("chat_id"),
+                "text": params.get("text", ""),
+                "sent_at": time.monotonic(),
+            }
+            self.next_message_id += 1
+            self.sent.append(message)
+            self.condition.notify_all()
+        return {"ok": True, "result": {
+            "message_id": message["message_id"],
+            "chat": {"id": message["chat_id"]},
+            "text": message["text"],
+        }}
+
+    def inject_error(self, status: int = 500, count: int = 1, retry_after: Optional[int] = None):
+        with self.condition:
+            self.injected.extend([(status, retry_after)] * count)
+
+    def injected_error(self) -> Optional[tuple[int, dict]]:
+        with self.condition:
+            if self.injected:
+                status, retry_after = self.injected.popleft()
+            elif self.rate_limit_rate and self.random.random() < self.rate_limit_rate:
+                status, retry_after = 429, self.retry_after
+            elif self.error_rate and self.random.random() < self.error_rate:
+                status, retry_after = 500, None
+            else:
+                return None
+            self.errors[status] += 1
+        return status, error_payload(status, retry_after)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'calls': dict(self.calls),
+                'errors': {str(status): count for status, count in self.errors.items()},
+                'sent': len(self.sent),
+                'pending_updates': len(self.updates),
+            }
+
+    def handle(self, method: str, params: dict) -> tuple[int, dict]:
+        with self.condition:
+            self.calls[method] += 1
+        if method == "getUpdates":
+            return 200, self.get_updates(params)
+        if method == "sendMessage":
+            error = self.injected_error()
+            if error is not None:
+                return error
+            return 200, self.send_message(params)
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.respond(url.path, dict(parse_qsl(url.query)))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode() if length else ''
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or '{}')
+                else:
+                    params = dict(parse_qsl(body))
+                params.update(parse_qsl(url.query))
+                self.respond(url.path, params)
+
+            def respond(self, path: str, params: dict):
+                status, payload = api.handle(path.rsplit('/', 1)[-1], params)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
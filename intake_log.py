@@ -0,0 +1,168 @@
+import datetime
+
+
+def week_key(day: datetime.date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class IntakeLog:
+    # Append-only log of every intake entry plus daily/weekly rollups and
+    # goal streaks that are updated in the same transaction, so history and
+    # stats queries read a handful of rollup rows instead of the events.
+    def __init__(self, db):
+        self.db = db
+        self.init_tables()
+
+    def init_tables(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS intake_events (
+                    id INTEGER PRIMARY KEY,
+                    chat_id TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    amount REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_intake_events_chat_ts
+                    ON intake_events (chat_id, ts, amount);
+                CREATE TABLE IF NOT EXISTS intake_daily (
+                    chat_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    total REAL NOT NULL,
+                    entries INTEGER NOT NULL,
+                    goal REAL NOT NULL,
+                    PRIMARY KEY (chat_id, day)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS intake_weekly (
+                    chat_id TEXT NOT NULL,
+                    week TEXT NOT NULL,
+                    total REAL NOT NULL,
+                    entries INTEGER NOT NULL,
+                    PRIMARY KEY (chat_id, week)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS intake_streaks (
+                    chat_id TEXT PRIMARY KEY,
+                    current INTEGER NOT NULL,
+                    best INTEGER NOT NULL,
+                    last_day TEXT NOT NULL
+                ) WITHOUT ROWID;
+            ''')
+
+    def record(self, chat_id: str, amount: float, when: datetime.datetime, goal: float):
+        day = when.date()
+        with self.db.lock, self.db.conn:
+            conn = self.db.conn
+            conn.execute(
+                'INSERT INTO intake_events (chat_id, ts, amount) VALUES (?, ?, ?)',
+                (chat_id, when.timestamp(), amount)
+            )
+            conn.execute('''
+                INSERT INTO intake_daily (chat_id, day, total, entries, goal) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (chat_id, day) DO UPDATE
+                SET total = total + excluded.total, entries = entries + 1, goal = excluded.goal
+            ''', (chat_id, day.isoformat(), amount, goal))
+            conn.execute('''
+                INSERT INTO intake_weekly (chat_id, week, total, entries) VALUES (?, ?, ?, 1)
+                ON CONFLICT (chat_id, week) DO UPDATE
+                SET total = total + excluded.total, entries = entries + 1
+            ''', (chat_id, week_key(day), amount))
+
+            total = conn.execute(
+                'SELECT total FROM intake_daily WHERE chat_id = ? AND day = ?', (chat_id, day.isoformat())
+            ).fetchone()[0]
+            # Only the entry that crosses the goal extends the streak
+            if total - amount < goal <= total:
+                self.extend_streak(chat_id, day)
+
+    def extend_streak(self, chat_id: str, day: datetime.date):
+        row = self.db.conn.execute(
+            'SELECT current, best, last_day FROM intake_streaks WHERE chat_id = ?', (chat_id,)
+        ).fetchone()
+        current, best = 1, 1
+        if row is not None:
+            last_day = datetime.date.fromisoformat(row[2])
+            if last_day == day:
+                return
+            current = row[0] + 1 if last_day == day - datetime.timedelta(days=1) else 1
+            best = max(row[1], current)
+        self.db.conn.execute(
+            'INSERT OR REPLACE INTO intake_streaks (chat_id, current, best, last_day) VALUES (?, ?, ?, ?)',
+            (chat_id, current, best, day.isoformat())
+        )
+
+    def daily_totals(self, chat_id: str, today: datetime.date, days: int) -> list[tuple[str, float, float]]:
+        # (day, total, goal) for each of the last `days` days that has entries
+        since = today - datetime.timedelta(days=days - 1)
+        with self.db.lock:
+            return self.db.conn.execute(
+                'SELECT day, total, goal FROM intake_daily '
+                'WHERE chat_id = ? AND day BETWEEN ? AND ? ORDER BY day',
+                (chat_id, since.isoformat(), today.isoformat())
+            ).fetchall()
+
+    def weekly_totals(self, chat_id: str, weeks: int) -> list[tuple[str, float]]:
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT week, total FROM intake_weekly WHERE chat_id = ? ORDER BY week DESC LIMIT ?',
+                (chat_id, weeks)
+            ).fetchall()
+        return rows[::-1]
+
+    def streak(self, chat_id: str, today: datetime.date) -> tuple[int, int]:
+        # (current, best) number of consecutive days the goal was reached. A
+        # streak is still alive until a full day passes without reaching it.
+        with self.db.lock:
+            row = self.db.conn.execute(
+                'SELECT current, best, last_day FROM intake_streaks WHERE chat_id = ?', (chat_id,)
+            ).fetchone()
+        if row is None:
+            return 0, 0
+        last_day = datetime.date.fromisoformat(row[2])
+        alive = last_day >= today - datetime.timedelta(days=1)
+        return (row[0] if alive else 0), row[1]
+
+    def summary(self, chat_id: str, today: datetime.date, days: int) -> dict:
+        rows = self.daily_totals(chat_id, today, days)
+        total = sum(row[1] for row in rows)
+        return {
+            'days': days,
+            'total': total,
+            'average': total / days,
+            'goal_days': sum(1 for _, day_total, goal in rows if day_total >= goal),
+            'active_days': len(rows),
+        }
+
+    def rebuild_rollups(self, default_goal: float):
+        # Recomputes rollups and streaks from the event log, e.g. after a bulk
+        # import. Each day is measured against the chat's current goal.
+        with self.db.lock, self.db.conn:
+            conn = self.db.conn
+            conn.execute('DELETE FROM intake_daily')
+            conn.execute('DELETE FROM intake_weekly')
+            conn.execute('''
+                INSERT INTO intake_daily (chat_id, day, total, entries, goal)
+                SELECT e.chat_id, date(e.ts, 'unixepoch', 'localtime') AS day, SUM(e.amount), COUNT(*),
+                       COALESCE(s.daily_goal, ?)
+                FROM intake_events e LEFT JOIN user_sessions s ON s.chat_id = e.chat_id
+                GROUP BY e.chat_id, day
+            ''', (default_goal,))
+            conn.execute('''
+                INSERT INTO intake_weekly (chat_id, week, total, entries)
+                SELECT chat_id, strftime('%Y', day, '-3 days', 'weekday 4') || '-W' ||
+                       printf('%02d', (strftime('%j', day, '-3 days', 'weekday 4') - 1) / 7 + 1),
+                       SUM(total), SUM(entries)
+                FROM intake_daily GROUP BY 1, 2
+            ''')
+
+            conn.execute('DELETE FROM intake_streaks')
+            streaks = {}
+            for chat_id, day in conn.execute(
+                    'SELECT chat_id, day FROM intake_daily WHERE total >= goal ORDER BY chat_id, day'):
+                day = datetime.date.fromisoformat(day)
+                current, best, last_day = streaks.get(chat_id, (0, 0, None))
+                current = current + 1 if last_day == day - datetime.timedelta(days=1) else 1
+                streaks[chat_id] = (current, max(best, current), day)
+            conn.executemany(
+                'INSERT INTO intake_streaks (chat_id, current, best, last_day) VALUES (?, ?, ?, ?)',
+                [(chat_id, current, best, day.isoformat()) for chat_id, (current, best, day) in streaks.items()]
+            )
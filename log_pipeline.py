@@ -0,0 +1,206 @@
+import datetime
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from typing import Optional
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the caller: once the queue holds max_size records, new
+    # records are counted and dropped instead.
+    def __init__(self, log_queue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogPipeline:
+    # Callers only put records on a queue; a background thread formats them
+    # in batches into a buffered file that is flushed every flush_interval
+    # seconds and rotated by size and age, with old files gzipped. Fewer,
+    # larger writes are much kinder to an SD card than a write per record.
+    def __init__(self, filename: str, max_queue: int = 10000, max_bytes: int = 5 * 1024 * 1024,
+                 rotate_interval: float = 86400, backup_count: int = 7, compress: bool = True,
+                 flush_interval: float = 5.0, batch_size: int = 500, buffer_size: int = 64 * 1024,
+                 level: int = logging.INFO, console: bool = False,
+                 formatter: Optional[logging.Formatter] = None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.level = level
+        self.console = console
+        self.formatter = formatter or JsonLinesFormatter()
+        self.console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+        # SimpleQueue.put is reentrant, so logging from a signal handler
+        # can't deadlock against the interrupted thread
+        self.queue = queue.SimpleQueue()
+        self.handler = DroppingQueueHandler(self.queue, max_queue)
+        self.handler.setLevel(level)
+        self.logger = None
+        self.thread = None
+        self.file = None
+        self.opened_at = 0.0
+
+        self.written = 0
+        self.rotations = 0
+        self.reported_drops = 0
+
+    def start(self, logger_name: str = 'water_reminder'):
+        self.open()
+        self.logger = logging.getLogger(logger_name)
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(self.level)
+        self.logger.propagate = False
+        self.thread = threading.Thread(target=self.write_loop, name='log-writer', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.logger.removeHandler(self.handler)
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Waits until everything queued before this call is on disk
+        if self.thread is None:
+            return True
+        request = FlushRequest()
+        self.queue.put(request)
+        return request.done.wait(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'written': self.written,
+            'dropped': self.handler.dropped,
+            'queued': self.queue.qsize(),
+            'rotations': self.rotations,
+        }
+
+    def open(self):
+        self.file = open(self.filename, 'a', encoding='utf-8', buffering=self.buffer_size)
+        self.opened_at = time.time()
+
+    def write_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            flush_requests = []
+            records = []
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, FlushRequest):
+                    flush_requests.append(item)
+                else:
+                    records.append(item)
+
+            if records and self.should_rotate():
+                self.rotate()
+            self.write(records)
+            self.report_drops()
+            if stop or flush_requests or time.monotonic() - last_flush >= self.flush_interval:
+                self.file.flush()
+                last_flush = time.monotonic()
+                for request in flush_requests:
+                    request.done.set()
+            if stop:
+                self.file.close()
+                return
+
+    def write(self, records: list[logging.LogRecord]):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                continue
+        self.file.write('\n'.join(lines) + '\n')
+        if self.console:
+            sys.stdout.write('\n'.join(self.console_formatter.format(r) for r in records) + '\n')
+            sys.stdout.flush()
+        self.written += len(lines)
+
+    def report_drops(self):
+        dropped = self.handler.dropped
+        if dropped > self.reported_drops:
+            record = logging.LogRecord(
+                'water_reminder', logging.WARNING, __file__, 0,
+                f"Log queue overflowed, dropped {dropped - self.reported_drops} records", None, None
+            )
+            self.reported_drops = dropped
+            self.write([record])
+
+    def should_rotate(self) -> bool:
+        size = self.file.tell()
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and size > 0 and time.time() - self.opened_at >= self.rotate_interval
+
+    def rotate(self):
+        self.file.close()
+        suffix = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        rotated = f"{self.filename}.{suffix}"
+        os.replace(self.filename, rotated)
+        if self.compress:
+            with open(rotated, 'rb') as source, gzip.open(rotated + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        self.rotations += 1
+
+        backups = sorted(glob.glob(glob.escape(self.filename) + '.*'))
+        for old in backups[:max(0, len(backups) - self.backup_count)]:
+            os.remove(old)
+        self.open()
@@ -0,0 +1,240 @@
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def label_key(labels: dict) -> tuple:
+    if len(labels) < 2:
+        return tuple(labels.items())
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Timer:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class MetricsRegistry:
+    # In-process counters and latency histograms, rendered in the Prometheus
+    # text format. Recording is a dict lookup and a bisect under one lock.
+    def __init__(self, enabled: bool = True, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def gauge(self, name: str, callback: Callable[[], float]):
+        # Gauges are read when rendering, so they cost nothing in between
+        self.gauges[name] = callback
+
+    def time(self, name: str, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def timed(self, name: str, **labels):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument(self, obj, method_names: list[str], name: str):
+        # Replaces each bound method on `obj` with a timed wrapper labelled
+        # by method name; internal self.method() calls are timed too.
+        for method_name in method_names:
+            method = getattr(obj, method_name)
+            setattr(obj, method_name, self.timed(name, method=method_name)(method))
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self.histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            self.render_header(lines, name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            self.render_header(lines, name, 'histogram')
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{format_labels(key)} {total}")
+                lines.append(f"{name}_count{format_labels(key)} {count}")
+
+        for name, callback in sorted(self.gauges.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            self.render_header(lines, name, 'gauge')
+            lines.append(f"{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def render_header(self, lines: list, name: str, kind: str):
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def summary(self) -> list[str]:
+        # One human readable line per histogram series, for the /metrics command
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                for key, histogram in sorted(series.items()):
+                    if not histogram.count:
+                        continue
+                    label = ','.join(str(v) for _, v in key)
+                    lines.append(
+                        f"{name}{'[' + label + ']' if label else ''}: n={histogram.count} "
+                        f"avg={histogram.sum / histogram.count * 1000:.1f}ms "
+                        f"p99<={histogram.quantile(0.99) * 1000:.0f}ms"
+                    )
+            for name, series in sorted(self.counters.items()):
+                for key, value in sorted(series.items()):
+                    label = ','.join(str(v) for _, v in key)
+                    lines.append(f"{name}{'[' + label + ']' if label else ''}: {value:g}")
+        return lines
+
+
+class MetricsServer:
+    # Serves GET /metrics in the Prometheus text format
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,108 @@
+from typing import Optional
+
+from clock import SYSTEM_CLOCK
+
+
+class NotificationAggregator:
+    # Debounces the "Update: ... added" messages other chats get about an
+    # entry. Entries wait in a table and each recipient gets one digest once
+    # no new entry arrived for `window` seconds, or at most `max_delay`
+    # seconds after the first. The flush is a 'digest' event in the
+    # scheduler and the first entry's time comes from the table, so pending
+    # digests survive a restart.
+    def __init__(self, db, scheduler, window: float = 60, max_delay: float = 300, clock=SYSTEM_CLOCK):
+        self.db = db
+        self.scheduler = scheduler
+        self.clock = clock
+        self.window = window
+        self.max_delay = max_delay
+
+        self.entries = 0
+        self.flushed = 0
+        self.digests = 0
+        self.init_table()
+
+    def init_table(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_notifications (
+                    id INTEGER PRIMARY KEY,
+                    recipient TEXT NOT NULL,
+                    from_chat_id TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    total REAL NOT NULL,
+                    goal REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_pending_notifications_recipient '
+                'ON pending_notifications (recipient, id)'
+            )
+
+    def add(self, recipients: list[str], from_chat_id: str, amount: float, total: float, goal: float):
+        now = self.clock.time()
+        with self.db.lock, self.db.conn:
+            self.db.conn.executemany(
+                'INSERT INTO pending_notifications (recipient, from_chat_id, amount, total, goal, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(recipient, from_chat_id, amount, total, goal, now) for recipient in recipients]
+            )
+            firsts = [self.db.conn.execute(
+                'SELECT MIN(created_at) FROM pending_notifications WHERE recipient = ?', (recipient,)
+            ).fetchone()[0] for recipient in recipients]
+        for recipient, first in zip(recipients, firsts):
+            self.scheduler.schedule(recipient, 'digest', min(now + self.window, first + self.max_delay))
+        self.entries += len(recipients)
+
+    def flush_soon(self, recipients: list[str]):
+        # Deliver what is pending on the next tick, e.g. once a goal is reached
+        now = self.clock.time()
+        for recipient in recipients:
+            if self.scheduler.get(recipient, 'digest') is not None:
+                self.scheduler.schedule(recipient, 'digest', now)
+
+    def flush(self, recipient: str) -> Optional[str]:
+        # Removes the recipient's pending entries and returns their digest
+        with self.db.lock, self.db.conn:
+            rows = self.db.conn.execute(
+                'SELECT from_chat_id, amount, total, goal FROM pending_notifications '
+                'WHERE recipient = ? ORDER BY id', (recipient,)
+            ).fetchall()
+            if not rows:
+                return None
+            self.db.conn.execute('DELETE FROM pending_notifications WHERE recipient = ?', (recipient,))
+        self.flushed += len(rows)
+        self.digests += 1
+        return self.format_digest(rows)
+
+    def format_digest(self, rows: list[tuple]) -> str:
+        senders = {}
+        for from_chat_id, amount, total, goal in rows:
+            added, count, _, _ = senders.get(from_chat_id, (0.0, 0, 0.0, 0.0))
+            senders[from_chat_id] = (added + amount, count + 1, total, goal)
+
+        lines = []
+        for from_chat_id, (added, count, total, goal) in senders.items():
+            entries = f" in {count} entries" if count > 1 else ""
+            line = f"Update: {round(added, 3)}L added{entries}. Total intake: {total:.1f}L"
+            remaining = goal - total
+            if remaining > 0:
+                line += f". Remaining: {remaining:.1f}L"
+            else:
+                line += f". Exceeded goal by: {-remaining:.1f}L"
+            if len(senders) > 1:
+                line = f"Chat {from_chat_id}: {line}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        with self.db.lock:
+            pending = self.db.conn.execute('SELECT COUNT(*) FROM pending_notifications').fetchone()[0]
+        return {
+            'entries': self.entries,
+            'pending': pending,
+            'digests': self.digests,
+            # Messages a message-per-entry fan-out would have sent per digest
+            'reduction': self.flushed / self.digests if self.digests else 0.0,
+        }
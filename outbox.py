@@ -0,0 +1,267 @@
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+import requests
+
+from clock import SYSTEM_CLOCK
+from telegram_client import TelegramAPIError
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    def refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self.refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        # Drain the bucket so the next token only arrives after `seconds`
+        self.refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+class Outbox:
+    # Durable outbound message queue. Messages are written to the outbox
+    # table first and removed once Telegram accepts them, so nothing is lost
+    # on failures, 429s or restarts. Sends are limited by a global token
+    # bucket and one bucket per chat.
+    # Only the oldest message of each chat is a candidate, so a chat that is
+    # being rate limited can't hide other chats' messages behind it. A
+    # message waiting to be retried holds its chat back until it is sent,
+    # which keeps the chat's order; one deferred to the end of quiet hours
+    # and not tried yet doesn't, so replies aren't held up until morning.
+    SELECT_DUE_SQL = '''
+        SELECT id, chat_id, text, parse_mode, attempts, created_at
+        FROM outbox WHERE id IN (
+            SELECT MIN(id) FROM outbox WHERE not_before <= ? OR attempts > 0 GROUP BY chat_id
+        ) AND not_before <= ?
+        ORDER BY id LIMIT ?
+    '''
+
+    def __init__(self, db, client, global_rate: float = 30, per_chat_rate: float = 1,
+                 per_chat_burst: float = 3, max_attempts: int = 5, batch_size: int = 200,
+                 idle_interval: float = 1.0, log: Optional[Callable] = None, clock=SYSTEM_CLOCK):
+        self.db = db
+        self.client = client
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets = {}
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.log = log or (lambda message, level='info': None)
+
+        self.dispatch_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.next_wait = None
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=1000)
+        self.init_table()
+
+    def init_table(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    parse_mode TEXT,
+                    not_before REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_error TEXT
+                )
+            ''')
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (not_before, id)'
+            )
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_outbox_chat_due ON outbox (chat_id, not_before, id)'
+            )
+
+    def enqueue(self, chat_ids: list[str], text: str, not_before: Optional[float] = None,
+                parse_mode: Optional[str] = "Markdown") -> list[int]:
+        now = self.clock.time()
+        not_before = now if not_before is None else not_before
+        ids = []
+        with self.db.lock, self.db.conn:
+            for chat_id in chat_ids:
+                cursor = self.db.conn.execute(
+                    'INSERT INTO outbox (chat_id, text, parse_mode, not_before, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (chat_id, text, parse_mode, not_before, now)
+                )
+                ids.append(cursor.lastrowid)
+        self.wakeup.set()
+        return ids
+
+    def chat_bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= 10000:
+                # Idle chats have full buckets and can be recreated on demand
+                self.chat_buckets = {
+                    c: b for c, b in self.chat_buckets.items() if not b.is_full(now)
+                }
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def dispatch(self) -> dict:
+        # Sends every due message the rate limits allow right now and returns
+        # {outbox id: response or exception} for the messages attempted.
+        with self.dispatch_lock:
+            now = self.clock.time()
+            with self.db.lock:
+                rows = self.db.conn.execute(self.SELECT_DUE_SQL, (now, now, self.batch_size)).fetchall()
+
+            # Batches are sent concurrently, so sending one message per chat
+            # per pass is what keeps each chat's messages in order
+            batch = []
+            self.next_wait = None
+            for row in rows:
+                bucket = self.chat_bucket(row[1], now)
+                wait = max(bucket.delay(now), self.global_bucket.delay(now))
+                if wait > 0:
+                    self.next_wait = wait if self.next_wait is None else min(self.next_wait, wait)
+                    if self.global_bucket.delay(now) > 0:
+                        break
+                    continue
+                bucket.take(now)
+                self.global_bucket.take(now)
+                batch.append(row)
+
+            if not batch:
+                return {}
+            # Chats in this batch may have more messages waiting
+            self.next_wait = 0.0
+
+            results = self.client.send_batch([(row[1], row[2], row[3]) for row in batch])
+            finished_at = self.clock.time()
+            done, retry = [], []
+            for row, result in zip(batch, results):
+                message_id, chat_id, text, _, attempts, created_at = row
+                if not isinstance(result, Exception):
+                    done.append((message_id,))
+                    self.sent += 1
+                    self.latencies.append(finished_at - created_at)
+                    self.log(f"Sent message to {chat_id}: {text}")
+                    continue
+
+                attempts += 1
+                delay = self.retry_delay(result, attempts)
+                if isinstance(result, TelegramAPIError) and result.retry_after:
+                    self.chat_bucket(chat_id, finished_at).pause(finished_at, result.retry_after)
+                if delay is None:
+                    done.append((message_id,))
+                    self.failed += 1
+                    self.log(f"Error sending message to {chat_id}, giving up: {result}", 'error')
+                else:
+                    retry.append((finished_at + delay, attempts, str(result), message_id))
+                    self.retried += 1
+                    self.log(f"Error sending message to {chat_id}, retrying in {delay:.0f}s: {result}", 'warning')
+
+            with self.db.lock, self.db.conn:
+                self.db.conn.executemany('DELETE FROM outbox WHERE id = ?', done)
+                self.db.conn.executemany(
+                    'UPDATE outbox SET not_before = ?, attempts = ?, last_error = ? WHERE id = ?', retry
+                )
+            return {row[0]: result for row, result in zip(batch, results)}
+
+    def retry_delay(self, error: requests.RequestException, attempts: int) -> Optional[float]:
+        if isinstance(error, TelegramAPIError):
+            if error.retry_after:
+                return float(error.retry_after)
+            # Other 4xx answers (chat not found, bot blocked, bad markup) won't
+            # get better by retrying
+            if error.error_code and 400 <= error.error_code < 500:
+                return None
+        if attempts >= self.max_attempts:
+            return None
+        return min(300.0, 2.0 ** attempts)
+
+    def next_send_at(self, now: float) -> Optional[float]:
+        # Earliest time another dispatch could send something, None when
+        # nothing is waiting for rate limits or a later not_before
+        candidates = [] if self.next_wait is None else [now + self.next_wait]
+        with self.db.lock:
+            row = self.db.conn.execute(
+                'SELECT MIN(not_before) FROM outbox WHERE not_before > ?', (now,)
+            ).fetchone()
+        if row[0] is not None:
+            candidates.append(row[0])
+        return min(candidates, default=None)
+
+    def next_delay(self) -> float:
+        now = self.clock.time()
+        send_at = self.next_send_at(now)
+        delay = self.idle_interval if send_at is None else min(self.idle_interval, send_at - now)
+        return max(delay, 0.01)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.dispatch_loop, name='outbox-dispatch', daemon=True)
+        self.thread.start()
+
+    def dispatch_loop(self):
+        while not self.stop_event.is_set():
+            self.wakeup.clear()
+            try:
+                self.dispatch()
+            except Exception as e:
+                self.log(f"Error in outbox dispatcher: {e}", 'error')
+            self.wakeup.wait(self.next_delay())
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        # Whatever is still queued stays in the table for the next start
+        self.dispatch()
+
+    def stats(self) -> dict:
+        now = self.clock.time()
+        with self.db.lock:
+            depth, due = self.db.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(not_before <= ?), 0) FROM outbox', (now,)
+            ).fetchone()
+        latencies = sorted(self.latencies)
+        return {
+            'depth': depth,
+            'due': due,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
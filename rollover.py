@@ -0,0 +1,50 @@
+import datetime
+import zoneinfo
+from typing import Optional
+
+
+class DayRollover:
+    # Resets every stale user_sessions row in one set-based transaction at
+    # the day boundary. Each day's final total and goal are already in
+    # IntakeLog's intake_daily. With user settings, each timezone rolls over
+    # at its own midnight.
+    STALE_SQL = 'last_update_time < ?'
+
+    def __init__(self, db, sessions, settings=None):
+        self.db = db
+        self.sessions = sessions
+        self.settings = settings
+
+    def run(self, today: datetime.date, reset_time: datetime.datetime,
+            timezone: Optional[str] = None) -> list[str]:
+        # Returns the chat ids that were reset. `today` is the date in
+        # `timezone` (None for the Pi's local time). Sessions last updated
+        # before its midnight are stale; last_update_time is stored as ISO
+        # local time, so that is a string comparison.
+        zone = zoneinfo.ZoneInfo(timezone) if timezone else None
+        midnight = datetime.datetime.combine(today, datetime.time(0, 0), tzinfo=zone)
+        cutoff = datetime.datetime.fromtimestamp(midnight.timestamp())
+
+        where = self.STALE_SQL
+        params = (cutoff.isoformat(),)
+        if self.settings is not None:
+            group_sql, group_params = self.settings.chat_filter_sql(timezone)
+            where = f'{where} AND {group_sql}'
+            params += group_params
+
+        with self.sessions.lock:
+            # Buffered intake has to reach the table before it is reset
+            self.sessions.flush()
+            with self.db.lock, self.db.conn:
+                chat_ids = [row[0] for row in self.db.conn.execute(
+                    f'SELECT chat_id FROM user_sessions WHERE {where}', params
+                )]
+                if not chat_ids:
+                    return []
+                self.db.conn.execute(f'''
+                    UPDATE user_sessions
+                    SET current_intake = 0, goal_reached_notified = 0, last_update_time = ?
+                    WHERE {where}
+                ''', (reset_time.isoformat(),) + params)
+            self.sessions.invalidate(chat_ids)
+        return chat_ids
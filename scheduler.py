@@ -0,0 +1,133 @@
+import heapq
+import threading
+from typing import Optional
+
+
+class ReminderScheduler:
+    # Priority queue of next-due timestamps keyed by (chat_id, kind), so a
+    # tick only touches chats that are actually due. Rescheduling pushes a
+    # new heap entry and leaves the old one to be skipped when popped.
+    def __init__(self, db):
+        self.db = db
+        self.heap = []
+        self.due = {}
+        self.dirty = set()
+        self.journal = None
+        self.lock = threading.RLock()
+        self.init_table()
+
+    def init_table(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS schedule (
+                    chat_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    due REAL NOT NULL,
+                    PRIMARY KEY (chat_id, kind)
+                ) WITHOUT ROWID
+            ''')
+
+    def __len__(self) -> int:
+        return len(self.due)
+
+    def load(self):
+        with self.lock:
+            with self.db.lock:
+                rows = self.db.conn.execute('SELECT chat_id, kind, due FROM schedule').fetchall()
+            self.due = {(chat_id, kind): due for chat_id, kind, due in rows}
+            self.compact()
+            self.dirty.clear()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            upserts, deletes = [], []
+            for key in self.dirty:
+                if key in self.due:
+                    upserts.append((key[0], key[1], self.due[key]))
+                else:
+                    deletes.append(key)
+            with self.db.lock, self.db.conn:
+                self.db.conn.executemany(
+                    'INSERT OR REPLACE INTO schedule (chat_id, kind, due) VALUES (?, ?, ?)', upserts
+                )
+                self.db.conn.executemany('DELETE FROM schedule WHERE chat_id = ? AND kind = ?', deletes)
+            self.dirty.clear()
+
+    def begin(self):
+        # Saves, then remembers the old due time of every key changed until
+        # commit() or rollback()
+        with self.lock:
+            self.save()
+            self.journal = {}
+
+    def commit(self):
+        self.journal = None
+
+    def rollback(self):
+        # The table is back where it was at begin(), so put the same times back
+        with self.lock:
+            journal, self.journal = self.journal or {}, None
+            for key, due in journal.items():
+                if due is None:
+                    self.due.pop(key, None)
+                else:
+                    self.due[key] = due
+                    heapq.heappush(self.heap, (due,) + key)
+                self.dirty.discard(key)
+
+    def change(self, key: tuple[str, str]):
+        if self.journal is not None:
+            self.journal.setdefault(key, self.due.get(key))
+        self.dirty.add(key)
+
+    def get(self, chat_id: str, kind: str) -> Optional[float]:
+        return self.due.get((chat_id, kind))
+
+    def schedule(self, chat_id: str, kind: str, due: float):
+        with self.lock:
+            key = (chat_id, kind)
+            if self.due.get(key) == due:
+                return
+            self.change(key)
+            self.due[key] = due
+            heapq.heappush(self.heap, (due, chat_id, kind))
+            if len(self.heap) > 2 * len(self.due) + 1024:
+                self.compact()
+
+    def cancel(self, chat_id: str, kind: str):
+        with self.lock:
+            if (chat_id, kind) in self.due:
+                self.change((chat_id, kind))
+                del self.due[(chat_id, kind)]
+
+    def compact(self):
+        self.heap = [(due, chat_id, kind) for (chat_id, kind), due in self.due.items()]
+        heapq.heapify(self.heap)
+
+    def discard_stale(self):
+        while self.heap:
+            due, chat_id, kind = self.heap[0]
+            if self.due.get((chat_id, kind)) == due:
+                return
+            heapq.heappop(self.heap)
+
+    def next_due(self) -> Optional[float]:
+        with self.lock:
+            self.discard_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> list[tuple[str, str, float]]:
+        # Removes and returns every (chat_id, kind, due) with due <= now; the
+        # caller reschedules whatever should fire again.
+        events = []
+        with self.lock:
+            while True:
+                self.discard_stale()
+                if not self.heap or self.heap[0][0] > now:
+                    return events
+                due, chat_id, kind = heapq.heappop(self.heap)
+                self.change((chat_id, kind))
+                del self.due[(chat_id, kind)]
+                events.append((chat_id, kind, due))
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionCache:
+    # Write-behind cache in front of WaterReminderDB. This process is the only
+    # writer of user_sessions, so sessions are served from memory and dirty
+    # ones are written back in batches instead of on every change.
+    def __init__(self, db, max_size: int = 10000, flush_interval: float = 5.0,
+                 flush_threshold: int = 100):
+        self.db = db
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.sessions = OrderedDict()
+        self.dirty = set()
+        self.touched = None
+        self.lock = threading.RLock()
+        self.last_flush = time.monotonic()
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_sessions = 0
+        self.evictions = 0
+
+    def get_user_session(self, chat_id: str):
+        with self.lock:
+            session = self.sessions.get(chat_id)
+            if session is not None:
+                self.sessions.move_to_end(chat_id)
+                self.hits += 1
+                return session
+
+            self.misses += 1
+            session = self.db.get_user_session(chat_id)
+            self.store(session)
+            return session
+
+    def save_user_session(self, session):
+        with self.lock:
+            self.store(session)
+            self.dirty.add(session.chat_id)
+            if len(self.dirty) >= self.flush_threshold:
+                self.flush()
+
+    def reset_user_session(self, chat_id: str):
+        with self.lock:
+            session = self.get_user_session(chat_id)
+            session.current_intake = 0
+            session.goal_reached_notified = False
+            session.last_update_time = self.db.clock.now()
+            self.save_user_session(session)
+            return session
+
+    def invalidate(self, chat_ids):
+        # Forget cached copies after the table was changed behind our back;
+        # callers flush first so no dirty state is dropped.
+        with self.lock:
+            for chat_id in chat_ids:
+                self.sessions.pop(chat_id, None)
+                self.dirty.discard(chat_id)
+
+    def begin(self):
+        # Track every session loaded or saved until commit() or rollback().
+        # Called with nothing dirty, so the table matches the cache here.
+        with self.lock:
+            self.touched = set()
+
+    def commit(self):
+        self.touched = None
+
+    def rollback(self):
+        # The table is back where it was at begin(), including sessions
+        # flushed since; drop every cached copy that may have changed
+        with self.lock:
+            touched, self.touched = self.touched or set(), None
+            self.invalidate(touched)
+
+    def store(self, session):
+        if self.touched is not None:
+            self.touched.add(session.chat_id)
+        self.sessions[session.chat_id] = session
+        self.sessions.move_to_end(session.chat_id)
+        while len(self.sessions) > self.max_size:
+            chat_id, evicted = self.sessions.popitem(last=False)
+            self.evictions += 1
+            # Never drop unsaved changes on eviction
+            if chat_id in self.dirty:
+                self.dirty.discard(chat_id)
+                self.db.save_user_session(evicted)
+
+    def flush(self) -> int:
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.dirty:
+                return 0
+            batch = [self.sessions[chat_id] for chat_id in self.dirty]
+            self.db.save_user_sessions(batch)
+            self.dirty.clear()
+            self.flushes += 1
+            self.flushed_sessions += len(batch)
+            return len(batch)
+
+    def maybe_flush(self) -> int:
+        with self.lock:
+            if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+                return self.flush()
+            return 0
+
+    def start(self):
+        if self.flush_thread is not None:
+            return
+        self.stop_event.clear()
+        self.flush_thread = threading.Thread(target=self.flush_loop, name='session-flush', daemon=True)
+        self.flush_thread.start()
+
+    def flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.maybe_flush()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.sessions),
+                'dirty': len(self.dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'flushes': self.flushes,
+                'flushed_sessions': self.flushed_sessions,
+                'evictions': self.evictions,
+            }
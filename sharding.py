@@ -0,0 +1,245 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from collections import deque
+from typing import Optional
+
+import requests
+
+from outbox import TokenBucket
+from telegram_client import TelegramClient
+
+logger = logging.getLogger('water_reminder')
+
+
+def shard_for(chat_id, shards: int) -> int:
+    # crc32 rather than hash(), which changes between processes and runs
+    return zlib.crc32(str(chat_id).encode()) % shards
+
+
+def shard_db_name(db_name: str, shard: int) -> str:
+    root, ext = os.path.splitext(db_name)
+    return f"{root}.shard{shard}{ext}"
+
+
+def update_chat_id(update: dict) -> Optional[str]:
+    chat = update.get("message", {}).get("chat")
+    return None if chat is None else str(chat["id"])
+
+
+def run_shard(shard: int, shards: int, bot_token: str, chat_ids: list[str], db_name: str, api_base: str,
+              outbox_rate: float, tick_interval: float, updates, acks, log_queue, retry_interval: float = 10):
+    # Worker process: a complete WaterReminder for the chats that hash to
+    # this shard, with its own database, scheduler and outbox. Pages arrive
+    # on `updates`; after each one the shard's checkpoint goes back on `acks`.
+    # Imported here because water_reminder imports this module
+    from water_reminder import WaterReminder
+
+    # Only the dispatcher reacts to signals; it stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if log_queue is not None:
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    own = [chat_id for chat_id in chat_ids if shard_for(chat_id, shards) == shard]
+    reminder = WaterReminder(bot_token, own, db_name=shard_db_name(db_name, shard), api_base=api_base)
+    reminder.household = chat_ids
+    reminder.metrics_port = None
+    # The Bot API limit is global, so each shard gets its share of it
+    reminder.outbox.global_bucket = TokenBucket(outbox_rate / shards, outbox_rate / shards)
+    reminder.startup()
+    acks.put((shard, reminder.update_offset))
+
+    parent = multiprocessing.parent_process()
+    pending = deque()
+    while True:
+        try:
+            reminder.run_scheduled()
+        except Exception as e:
+            reminder.log_message(f"Error in shard {shard} scheduler: {e}", 'error')
+        if not pending:
+            delay = reminder.seconds_until_next_due()
+            try:
+                page = updates.get(timeout=tick_interval if delay is None else min(delay, tick_interval))
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if page is None:
+                break
+            pending.append(page)
+        # Like run(), keep at the same updates until they go through;
+        # apply_updates already skips ones that can't be applied, and the
+        # checkpoint makes sure none of them is applied twice
+        try:
+            reminder.apply_updates(pending[0])
+        except Exception as e:
+            reminder.log_message(f"Error applying updates in shard {shard}: {e}", 'error')
+            if wait_to_retry(updates, pending, parent, retry_interval):
+                break  # What wasn't applied is fetched again after the restart
+            continue
+        pending.popleft()
+        acks.put((shard, reminder.update_offset))
+    reminder.shutdown()
+
+
+def wait_to_retry(updates, pending: deque, parent, delay: float) -> bool:
+    # Sleeps before a retry while still taking pages (kept in `pending`), so
+    # a stop or a dead dispatcher is noticed. Returns True when it's time to stop.
+    deadline = time.monotonic() + delay
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            page = updates.get(timeout=min(remaining, 1.0))
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                return True
+            continue
+        if page is None:
+            return True
+        pending.append(page)
+    return False
+
+
+class ShardedRunner:
+    # Polls getUpdates in this process and routes each update by crc32 of
+    # its chat id to one of `shards` worker processes, so a chat's updates
+    # always go to the same worker, in order, and workers use separate cores
+    # and SQLite files. getUpdates is only confirmed up to the oldest update
+    # a worker hasn't applied yet; each worker also checkpoints its own
+    # offset, so after a restart nothing is lost or applied twice.
+    def __init__(self, bot_token: str, chat_ids: list[str], shards: int, db_name: str = 'water_reminder.db',
+                 api_base: str = 'https://api.telegram.org', poll_timeout: int = 30, tick_interval: float = 1.0,
+                 queue_size: int = 100, outbox_rate: float = 30, log_handler: Optional[logging.Handler] = None):
+        self.bot_token = bot_token
+        self.chat_ids = chat_ids
+        self.shards = shards
+        self.db_name = db_name
+        self.api_base = api_base
+        self.poll_timeout = poll_timeout
+        self.tick_interval = tick_interval
+        self.queue_size = queue_size
+        self.outbox_rate = outbox_rate
+        self.log_handler = log_handler
+        self.telegram = TelegramClient(bot_token, api_base)
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = []
+        self.queues = []
+        self.acks = None
+        self.log_listener = None
+        # (first update id, last update id, count) of pages each shard hasn't acked
+        self.inflight = [deque() for _ in range(shards)]
+        self.next_offset = 0
+        self.routed = 0
+        self.applied = 0
+        self.shutdown_flag = False
+
+    def start(self):
+        log_queue = None
+        if self.log_handler is not None:
+            log_queue = self.context.Queue()
+            self.log_listener = logging.handlers.QueueListener(log_queue, self.log_handler,
+                                                               respect_handler_level=True)
+            self.log_listener.start()
+        self.acks = self.context.Queue()
+        self.queues = [self.context.Queue(self.queue_size) for _ in range(self.shards)]
+        self.processes = [
+            self.context.Process(
+                target=run_shard,
+                args=(shard, self.shards, self.bot_token, self.chat_ids, self.db_name, self.api_base,
+                      self.outbox_rate, self.tick_interval, self.queues[shard], self.acks, log_queue),
+                name=f'shard-{shard}'
+            )
+            for shard in range(self.shards)
+        ]
+        for process in self.processes:
+            process.start()
+
+        # Each worker reports its checkpoint once it is up; polling resumes
+        # from the oldest, and workers skip what they have already applied
+        checkpoints = {}
+        while len(checkpoints) < self.shards:
+            try:
+                shard, offset = self.acks.get(timeout=self.tick_interval)
+            except queue.Empty:
+                self.check_workers()
+                continue
+            checkpoints[shard] = offset
+        self.next_offset = min(checkpoints.values())
+        logger.info(f"Started {self.shards} shards, resuming from update {self.next_offset}")
+
+    def check_workers(self):
+        # A dead worker's updates would never be confirmed; stop and let the
+        # restart pick them up again from its checkpoint
+        for process in self.processes:
+            if not process.is_alive():
+                raise RuntimeError(f"Worker {process.name} exited with code {process.exitcode}")
+
+    def confirmed_offset(self) -> int:
+        # Everything below this has been applied by its shard
+        return min((pages[0][0] for pages in self.inflight if pages), default=self.next_offset)
+
+    def route(self, updates: list) -> int:
+        pages = {}
+        for update in updates:
+            if update["update_id"] < self.next_offset:
+                continue  # Already with a worker
+            chat_id = update_chat_id(update)
+            shard = 0 if chat_id is None else shard_for(chat_id, self.shards)
+            pages.setdefault(shard, []).append(update)
+        for shard, page in pages.items():
+            self.inflight[shard].append((page[0]["update_id"], page[-1]["update_id"], len(page)))
+            self.queues[shard].put(page)
+            self.routed += len(page)
+        if updates:
+            self.next_offset = max(self.next_offset, updates[-1]["update_id"] + 1)
+        return sum(len(page) for page in pages.values())
+
+    def collect_acks(self, timeout: Optional[float] = None):
+        # Takes every ack that is waiting, blocking up to `timeout` for the first
+        try:
+            ack = self.acks.get(timeout=timeout) if timeout else self.acks.get_nowait()
+            while True:
+                shard, offset = ack
+                pages = self.inflight[shard]
+                while pages and pages[0][1] < offset:
+                    self.applied += pages.popleft()[2]
+                ack = self.acks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def run(self):
+        try:
+            self.start()
+            while not self.shutdown_flag:
+                self.collect_acks()
+                self.check_workers()
+                try:
+                    updates = self.telegram.get_updates(self.confirmed_offset(), self.poll_timeout)
+                except requests.RequestException as e:
+                    logger.error(f"Error getting updates: {e}")
+                    time.sleep(10)
+                    continue
+                if updates and not self.route(updates):
+                    # Everything returned is still being applied; wait for a
+                    # worker instead of asking for the same updates again
+                    self.collect_acks(timeout=self.tick_interval)
+        finally:
+            self.stop()
+
+    def stop(self):
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join()
+        self.collect_acks()
+        self.telegram.close()
+        if self.log_listener is not None:
+            self.log_listener.stop()
+        logger.info(f"Sharded runner stopped: {self.routed} updates routed, {self.applied} applied")
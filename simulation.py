@@ -0,0 +1,246 @@
+# Replays an update stream against a WaterReminder running on a VirtualClock,
+# so days of reminders, quiet hours and daily resets take seconds. Time
+# jumps straight to the next update, scheduled event or outbox send.
+#
+#   python -m simulation --chats 2000 --days 3
+#   python -m simulation --chats 50 --days 1 --record day.jsonl
+#   python -m simulation --script day.jsonl --days 2
+#
+# A script is JSON lines, either {"at": seconds from start, "chat_id": ...,
+# "text": ...} or raw getUpdates updates, replayed by their message dates.
+import argparse
+import datetime
+import json
+import random
+import time
+from collections import Counter
+from typing import Optional
+
+from clock import VirtualClock
+from water_reminder import WaterReminder
+
+PAGE_SIZE = 100  # Updates per getUpdates page, as Telegram returns them
+OUTBOX_STEP = 1.0  # Shortest jump while the outbox drains under rate limits
+MESSAGE_KINDS = (
+    ('Reminder:', 'reminder'),
+    ('New day started!', 'reset'),
+    ('🎉 Congratulations', 'goal'),
+)
+INTAKE_TEXTS = ('0.25', '0.3', '0.5', '250ml', '330ml', '1 cup', '2 cups', '8oz')
+
+
+def message_kind(text: str) -> str:
+    for prefix, kind in MESSAGE_KINDS:
+        if text.startswith(prefix):
+            return kind
+    return 'reply'
+
+
+class RecordingClient:
+    # Stands in for TelegramClient: accepts every message and remembers
+    # when it went out
+    def __init__(self, clock):
+        self.clock = clock
+        self.messages = []
+
+    def send_batch(self, messages: list[tuple[str, str, Optional[str]]]) -> list:
+        results = []
+        for chat_id, text, _ in messages:
+            self.messages.append((self.clock.time(), chat_id, message_kind(text)))
+            results.append({"ok": True, "result": {"message_id": len(self.messages), "text": text}})
+        return results
+
+    def get_updates(self, offset: int, timeout: int = 30) -> list:
+        return []
+
+    def close(self):
+        pass
+
+
+def generate_updates(chat_ids: list[str], start: float, days: int, entries_per_day: int = 8,
+                     timezones: Optional[list[str]] = None, seed: int = 1) -> list[tuple[float, str, str]]:
+    # Each chat logs a few drinks between 08:00 and 22:00 and sometimes asks
+    # for its status; with timezones, chats pick one round-robin first.
+    rng = random.Random(seed)
+    events = []
+    if timezones:
+        for i, chat_id in enumerate(chat_ids):
+            events.append((start + 1, chat_id, f"/timezone {timezones[i % len(timezones)]}"))
+    for day in range(days):
+        day_start = start + day * 86400
+        for chat_id in chat_ids:
+            for _ in range(entries_per_day):
+                at = day_start + rng.uniform(8 * 3600, 22 * 3600)
+                text = '/status' if rng.random() < 0.05 else rng.choice(INTAKE_TEXTS)
+                events.append((at, chat_id, text))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def load_updates(path: str, start: float) -> list[tuple[float, str, str]]:
+    events, first_date = [], None
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            message = item.get("message")
+            if message is None:
+                events.append((start + float(item["at"]), str(item["chat_id"]), item["text"]))
+            elif "text" in message:
+                first_date = message["date"] if first_date is None else first_date
+                events.append((start + message["date"] - first_date, str(message["chat"]["id"]), message["text"]))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def save_updates(path: str, events: list[tuple[float, str, str]], start: float):
+    with open(path, 'w') as f:
+        for at, chat_id, text in events:
+            f.write(json.dumps({"at": round(at - start, 3), "chat_id": chat_id, "text": text}) + '\n')
+
+
+class Simulation:
+    def __init__(self, chat_ids: list[str], db_name: str, start: float, share_updates: bool = False):
+        self.clock = VirtualClock(start)
+        self.client = RecordingClient(self.clock)
+        self.reminder = reminder = WaterReminder('SIMULATION', chat_ids, db_name=db_name, clock=self.clock)
+        reminder.telegram.close()
+        reminder.telegram = reminder.outbox.client = self.client
+        reminder.share_updates = share_updates
+        reminder.log_message = lambda message, level='info': None
+        reminder.outbox.log = reminder.log_message
+        self.next_update_id = 1
+        self.updates = 0
+        self.resets = 0
+
+        rollover_day = reminder.rollover_day
+
+        def counting_rollover(timezone=None):
+            reset = rollover_day(timezone)
+            self.resets += len(reset)
+            return reset
+        reminder.rollover_day = counting_rollover
+
+    def make_update(self, chat_id: str, text: str) -> dict:
+        update = {
+            "update_id": self.next_update_id,
+            "message": {
+                "message_id": self.next_update_id,
+                "date": int(self.clock.time()),
+                "chat": {"id": int(chat_id) if chat_id.lstrip('-').isdigit() else chat_id, "type": "private"},
+                "text": text,
+            },
+        }
+        self.next_update_id += 1
+        return update
+
+    def run(self, events: list[tuple[float, str, str]], until: float):
+        # Same steps as WaterReminder.run, minus the background threads and
+        # the network: scheduled events, then whatever updates have arrived
+        reminder = self.reminder
+        reminder.scheduler.load()
+        reminder.schedule_chats()
+        pending = 0
+        while self.clock.time() < until:
+            now = self.clock.time()
+            # Both of these dispatch the outbox themselves when they do anything
+            busy = reminder.run_scheduled()
+            while pending < len(events) and events[pending][0] <= now:
+                page = []
+                while pending < len(events) and events[pending][0] <= now and len(page) < PAGE_SIZE:
+                    page.append(self.make_update(events[pending][1], events[pending][2]))
+                    pending += 1
+                reminder.apply_updates(page)
+                self.updates += len(page)
+                busy = True
+            if not busy:
+                reminder.outbox.dispatch()
+
+            candidates = [until]
+            if pending < len(events):
+                candidates.append(events[pending][0])
+            next_due = reminder.scheduler.next_due()
+            if next_due is not None:
+                candidates.append(next_due)
+            send_at = reminder.outbox.next_send_at(now)
+            if send_at is not None:
+                candidates.append(max(send_at, now + OUTBOX_STEP))
+            self.clock.advance_to(max(min(candidates), now + 0.001))
+        reminder.sessions.flush()
+        reminder.scheduler.save()
+
+    def report(self, started: float, wall: float) -> dict:
+        messages = self.client.messages
+        kinds = Counter(kind for _, _, kind in messages)
+        per_day = Counter(datetime.date.fromtimestamp(at).isoformat() for at, _, _ in messages)
+        simulated = self.clock.time() - started
+        return {
+            'simulated_days': simulated / 86400,
+            'wall_s': wall,
+            'speedup': simulated / wall if wall else 0.0,
+            'chats': len(self.reminder.chat_ids),
+            'updates': self.updates,
+            'reminders_sent': kinds['reminder'],
+            'resets': self.resets,
+            'goals_reached': kinds['goal'],
+            'messages': len(messages),
+            'messages_by_kind': dict(kinds),
+            'messages_per_day': dict(sorted(per_day.items())),
+            'outbox': self.reminder.outbox.stats(),
+            'notifications': self.reminder.notifications.stats(),
+        }
+
+    def close(self):
+        self.reminder.sessions.stop()
+        self.reminder.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=1000, help='simulated chats, all receiving reminders')
+    parser.add_argument('--days', type=float, default=3, help='virtual days to simulate')
+    parser.add_argument('--start', help='virtual start time (ISO, default: last local midnight)')
+    parser.add_argument('--entries', type=int, default=8, help='intake entries per chat per day')
+    parser.add_argument('--timezones', help='comma separated timezones assigned round-robin')
+    parser.add_argument('--share', action='store_true', help='send each entry to the other chats as digests')
+    parser.add_argument('--script', help='replay this JSON lines stream instead of generating one')
+    parser.add_argument('--record', help='write the generated stream here as a script')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', default=':memory:', help='database file (default: in memory)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if args.start:
+        start = datetime.datetime.fromisoformat(args.start).timestamp()
+    else:
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 0)).timestamp()
+    until = start + args.days * 86400
+
+    if args.script:
+        events = load_updates(args.script, start)
+        chat_ids = list(dict.fromkeys(chat_id for _, chat_id, _ in events))
+    else:
+        chat_ids = [str(1000 + i) for i in range(args.chats)]
+        timezones = args.timezones.split(',') if args.timezones else None
+        events = generate_updates(chat_ids, start, int(args.days + 0.999), args.entries, timezones, args.seed)
+        if args.record:
+            save_updates(args.record, events, start)
+
+    simulation = Simulation(chat_ids, args.db, start, args.share)
+    wall_started = time.perf_counter()
+    simulation.run(events, until)
+    report = simulation.report(start, time.perf_counter() - wall_started)
+    simulation.close()
+
+    report['config'] = vars(args)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import MetricsRegistry
+
+
+class TelegramAPIError(requests.RequestException):
+    def __init__(self, description: str, error_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(description)
+        self.description = description
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    # Bot API client that keeps connections alive in a shared pool and fans
+    # messages out to many chats concurrently over a bounded worker pool.
+    def __init__(self, bot_token: str, api_base: str = 'https://api.telegram.org',
+                 max_workers: int = 8, timeout: float = 10, metrics: Optional[MetricsRegistry] = None):
+        self.bot_token = bot_token
+        self.metrics = metrics or MetricsRegistry(enabled=False)
+        self.api_base = api_base
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='telegram-send')
+
+    def api_url(self, method: str) -> str:
+        return f"{self.api_base}/bot{self.bot_token}/{method}"
+
+    def call(self, method: str, payload: dict, timeout: Optional[float] = None) -> dict:
+        with self.metrics.time("telegram_request_seconds", method=method):
+            try:
+                return self.request(method, payload, timeout)
+            except TelegramAPIError as e:
+                self.metrics.inc("telegram_errors_total", method=method, code=str(e.error_code))
+                raise
+            except requests.RequestException:
+                self.metrics.inc("telegram_errors_total", method=method, code="network")
+                raise
+
+    def request(self, method: str, payload: dict, timeout: Optional[float] = None) -> dict:
+        response = self.session.post(self.api_url(method), json=payload, timeout=timeout or self.timeout)
+        try:
+            data = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise TelegramAPIError(f"Invalid response from {method}", response.status_code)
+
+        if not data.get("ok"):
+            parameters = data.get("parameters", {})
+            raise TelegramAPIError(
+                data.get("description", f"{method} failed"),
+                data.get("error_code", response.status_code),
+                parameters.get("retry_after")
+            )
+        return data
+
+    def get_updates(self, offset: int, timeout: int = 30) -> list:
+        data = self.call("getUpdates", {"offset": offset, "timeout": timeout}, timeout=timeout + 10)
+        return data.get("result", [])
+
+    def set_webhook(self, url: str, secret_token: Optional[str] = None) -> dict:
+        payload = {"url": url, "allowed_updates": ["message"]}
+        if secret_token:
+            payload["secret_token"] = secret_token
+        return self.call("setWebhook", payload)
+
+    def delete_webhook(self) -> dict:
+        return self.call("deleteWebhook", {})
+
+    def send_message(self, chat_id: str, text: str, parse_mode: Optional[str] = "Markdown") -> dict:
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return self.call("sendMessage", payload)
+
+    def send_batch(self, messages: list[tuple[str, str, Optional[str]]]) -> list:
+        # One result per (chat_id, text, parse_mode) message, in the same
+        # order: either the API response or the exception raised sending it.
+        def send(message):
+            try:
+                return self.send_message(*message)
+            except requests.RequestException as e:
+                return e
+
+        if len(messages) == 1:
+            return [send(messages[0])]
+        return list(self.executor.map(send, messages))
+
+    def send_many(self, chat_ids: list[str], text: str, parse_mode: Optional[str] = "Markdown") -> list:
+        return self.send_batch([(chat_id, text, parse_mode) for chat_id in chat_ids])
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
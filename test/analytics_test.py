@@ -0,0 +1,125 @@
+import csv
+import datetime
+import json
+import os
+import tempfile
+import unittest
+import zoneinfo
+from unittest.mock import patch
+
+import analytics
+from analytics import IntakeAnalytics
+from intake_log import IntakeLog
+from user_settings import UserSettings
+from water_reminder import QUIET_HOURS_END, QUIET_HOURS_START, WaterReminderDB
+
+
+class TestIntakeAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.db')
+        self.db = WaterReminderDB(self.db_name)
+        self.log = IntakeLog(self.db)
+        self.settings = UserSettings(self.db, QUIET_HOURS_START, QUIET_HOURS_END)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def record(self, chat_id, amount, when):
+        self.log.record(chat_id, amount, when, 2.5)
+
+    def test_daily_totals_match_rollups(self):
+        # Spans the US DST change; chat 2's days are New York days
+        self.settings.set_timezone('2', 'America/New_York')
+        new_york = zoneinfo.ZoneInfo('America/New_York')
+        for hour in range(0, 24 * 4, 5):
+            when = datetime.datetime(2025, 3, 7, 23, 30) + datetime.timedelta(hours=hour)
+            self.record('1', 0.3, when)
+            self.record('2', 0.4, when.replace(tzinfo=new_york))
+
+        reader = IntakeAnalytics(self.db_name, chunk_size=7)
+        rows = [(chat_id, day, total, entries) for chat_id, day, total, entries, _, _ in reader.daily_rows()]
+        reader.close()
+        with self.db.lock:
+            expected = self.db.conn.execute(
+                'SELECT chat_id, day, ROUND(total, 3), entries FROM intake_daily ORDER BY chat_id, day'
+            ).fetchall()
+        self.assertEqual(rows, expected)
+
+    def test_summary(self):
+        start = datetime.datetime(2025, 6, 1, 9)
+        for day, amounts in ((0, [1.5, 1.5]), (1, [2.0]), (2, [1.0, 1.5]), (4, [3.0])):
+            for i, amount in enumerate(amounts):
+                self.record('1', amount, start + datetime.timedelta(days=day, hours=i * 5))
+        self.record('2', 2.5, start + datetime.timedelta(days=1))
+
+        reader = IntakeAnalytics(self.db_name)
+        summary = reader.summary()
+        reader.close()
+        chat = summary['chats'][0]
+        self.assertEqual((chat['first_day'], chat['last_day'], chat['days']), ('2025-06-01', '2025-06-05', 5))
+        self.assertEqual((chat['active_days'], chat['entries'], chat['total']), (4, 6, 10.5))
+        # Goal met on days 0, 2 and 4; day 3 had nothing logged
+        self.assertEqual(chat['goal_hit_rate'], 0.6)
+        self.assertEqual((chat['current_streak'], chat['best_streak']), (1, 1))
+        self.assertEqual(chat['rolling_7d'], 2.1)
+        self.assertEqual(chat['best_7d'], 3.0)
+        self.assertEqual(chat['hour_histogram'][9], 4)
+        self.assertEqual(chat['hour_histogram'][14], 2)
+
+        household = summary['household']
+        self.assertEqual((household['chats'], household['entries'], household['total']), (2, 7, 13.0))
+        self.assertEqual(household['goal_hit_rate'], 0.8)
+
+    def test_days_use_the_goal_they_were_logged_with(self):
+        start = datetime.datetime(2025, 6, 1, 9)
+        self.log.record('1', 2.0, start, 2.0)
+        self.log.record('1', 2.5, start + datetime.timedelta(days=1), 3.0)
+        for backend in (analytics.np, None):
+            with patch.object(analytics, 'np', backend):
+                reader = IntakeAnalytics(self.db_name, default_goal=2.5)
+                chat = reader.summary()['chats'][0]
+                goals = [(goal, met) for *_, goal, met in reader.daily_rows()]
+                reader.close()
+            self.assertEqual(goals, [(2.0, True), (3.0, False)])
+            self.assertEqual((chat['goal_hit_rate'], chat['current_streak'], chat['best_streak']), (0.5, 0, 1))
+
+    def test_export(self):
+        for i in range(50):
+            self.record(str(i % 3), 0.25, datetime.datetime(2025, 1, 1, 8) + datetime.timedelta(hours=i))
+
+        events_csv = os.path.join(self.tmpdir.name, 'events.csv')
+        analytics.main(['--db', self.db_name, '--chunk-size', '4', 'export', 'events', '--output', events_csv])
+        with open(events_csv) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], list(analytics.EVENT_FIELDS))
+        self.assertEqual(len(rows), 51)
+        self.assertEqual(rows[1][:1] + rows[1][2:], ['0', '2025-01-01T08:00:00', '0.25'])
+
+        daily_jsonl = os.path.join(self.tmpdir.name, 'daily.jsonl')
+        analytics.main(['--db', self.db_name, 'export', 'daily', '--format', 'jsonl', '--output', daily_jsonl])
+        with open(daily_jsonl) as f:
+            days = [json.loads(line) for line in f]
+        self.assertEqual(sum(day['entries'] for day in days), 50)
+        self.assertEqual(days[0], {'chat_id': '0', 'day': '2025-01-01', 'total': 1.5, 'entries': 6,
+                                   'goal': 2.5, 'goal_met': False})
+
+    @unittest.skipIf(analytics.np is None, 'numpy not installed')
+    def test_list_fallback_matches_numpy(self):
+        for i in range(200):
+            self.record(str(i % 4), 0.1 * (i % 7), datetime.datetime(2025, 2, 1) + datetime.timedelta(hours=i * 3))
+        reader = IntakeAnalytics(self.db_name, chunk_size=16)
+        vectorized = reader.summary()
+        np, analytics.np = analytics.np, None
+        try:
+            fallback = IntakeAnalytics(self.db_name, chunk_size=16).summary()
+        finally:
+            analytics.np = np
+        reader.close()
+        self.assertEqual(vectorized, fallback)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from async_runner import AsyncRunner
+from reminder_case import ReminderTestCase
+
+
+class TestAsyncRunner(ReminderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.runner = AsyncRunner(self.reminder, poll_timeout=1, tick_interval=0.5)
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.runner.run()))
+        self.thread.start()
+
+    def close(self, reminder):
+        # The runner's shutdown() closes everything
+        reminder.shutdown_flag = True
+        self.thread.join(timeout=10)
+
+    def wait_for_text(self, chat_id, fragment, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(fragment in text for text in self.api.messages_for(chat_id)):
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_startup_broadcast(self):
+        self.assertTrue(self.wait_for_text('100', 'Water reminder app started'))
+        self.assertTrue(self.wait_for_text('200', 'Water reminder app started'))
+
+    def test_intake_is_answered_and_shared(self):
+        self.reminder.notifications.window = 0
+        self.api.push_update(100, '0.5')
+        self.assertTrue(self.wait_for_text('100', 'Update: 0.5L added. Total intake: 0.5L'))
+        self.assertTrue(self.wait_for_text('200', 'Update: 0.5L added'))
+
+    def test_updates_keep_order(self):
+        for text in ('0.5', '0.25', '/status'):
+            self.api.push_update(100, text)
+        self.assertTrue(self.wait_for_text('100', 'Current intake: 0.8L'))
+        session = self.reminder.sessions.get_user_session('100')
+        self.assertEqual(session.current_intake, 0.75)
+
+    def test_failed_update_is_skipped(self):
+        original = self.reminder.process_user_input
+
+        def process_user_input(text, chat_id):
+            if text == 'boom':
+                raise RuntimeError("broken")
+            return original(text, chat_id)
+
+        with patch.object(self.reminder, 'process_user_input', side_effect=process_user_input):
+            for text in ('0.5', 'boom', '0.25'):
+                self.api.push_update(100, text)
+            self.assertTrue(self.wait_for_text('100', 'Total intake: 0.8L'))
+            self.api.push_update(100, '1')
+            self.assertTrue(self.wait_for_text('100', 'Total intake: 1.8L'))
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 1.75)
+        self.assertEqual(self.reminder.update_offset, 5)
+
+    def test_retries_without_polling_in_a_loop(self):
+        self.assertTrue(self.wait_for_text('100', 'Water reminder app started'))
+        self.runner.retry_interval = 0.2
+        failing = sqlite3.OperationalError("disk I/O error")
+        with patch.object(self.reminder.intake_log, 'record', side_effect=failing):
+            self.api.push_update(100, '0.5')
+            time.sleep(1.5)
+            calls = self.api.calls['getUpdates']
+            time.sleep(1)
+            # The same update isn't fetched again while it is being retried
+            self.assertLessEqual(self.api.calls['getUpdates'] - calls, 2)
+        self.assertTrue(self.wait_for_text('100', 'Total intake: 0.5L'))
+
+    def test_shutdown_flushes_and_says_goodbye(self):
+        self.api.push_update(200, '1')
+        self.assertTrue(self.wait_for_text('200', 'Total intake: 1.0L'))
+        self.reminder.shutdown_flag = True
+        self.thread.join(timeout=10)
+        self.assertFalse(self.thread.is_alive())
+        self.assertTrue(self.wait_for_text('100', 'shutting down'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import datetime
+import sqlite3
+import time
+import unittest
+from unittest.mock import patch
+
+from reminder_case import ReminderTestCase
+
+
+def make_update(update_id, chat_id, text):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+class TestCheckpoint(ReminderTestCase):
+
+    def stored_intake(self, chat_id):
+        with self.reminder.db.lock:
+            return self.reminder.db.conn.execute(
+                'SELECT current_intake FROM user_sessions WHERE chat_id = ?', (chat_id,)
+            ).fetchone()[0]
+
+    def test_update_is_checkpointed_with_its_writes(self):
+        self.assertEqual(self.reminder.apply_update(make_update(7, 100, "0.5")), 8)
+        # Written through, not left in the write-behind cache
+        self.assertEqual(self.stored_intake('100'), 0.5)
+        self.assertEqual(self.reminder.db.get_state('update_offset'), '8')
+        self.assertEqual(len(self.api.messages_for('100')), 1)
+        self.assertEqual(self.reminder.outbox.stats()['depth'], 0)
+
+        # A redelivered update is not applied twice
+        self.reminder.apply_update(make_update(7, 100, "0.5"))
+        self.assertEqual(self.stored_intake('100'), 0.5)
+        self.assertEqual(len(self.api.messages_for('100')), 1)
+
+    def test_failed_update_rolls_back(self):
+        self.reminder.apply_update(make_update(1, 100, "0.5"))
+        with patch.object(self.reminder.intake_log, 'record', side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                self.reminder.apply_update(make_update(2, 100, "1.0"))
+
+        self.assertEqual(self.stored_intake('100'), 0.5)
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 0.5)
+        self.assertEqual(self.reminder.db.get_state('update_offset'), '2')
+        self.assertEqual(self.reminder.outbox.stats()['depth'], 0)
+
+        # Fetched again after the failure, it applies normally
+        self.reminder.apply_update(make_update(2, 100, "1.0"))
+        self.assertEqual(self.stored_intake('100'), 1.5)
+
+    def intake_events(self, chat_id):
+        with self.reminder.db.lock:
+            return [row[0] for row in self.reminder.db.conn.execute(
+                'SELECT amount FROM intake_events WHERE chat_id = ?', (chat_id,)
+            )]
+
+    def test_rollback_after_threshold_flush(self):
+        # Sessions flushed halfway through the batch are rolled back too
+        self.reminder.sessions.flush_threshold = 2
+        original = self.reminder.process_user_input
+
+        def process_user_input(text, chat_id):
+            if chat_id == '300':
+                raise RuntimeError("broken")
+            return original(text, chat_id)
+
+        page = [make_update(1, 100, "0.5"), make_update(2, 200, "0.5"), make_update(3, 300, "0.5")]
+        with patch.object(self.reminder, 'process_user_input', side_effect=process_user_input):
+            self.reminder.apply_updates(page)
+        for chat_id in ('100', '200'):
+            self.assertEqual(self.reminder.sessions.get_user_session(chat_id).current_intake, 0.5)
+            self.assertEqual(self.stored_intake(chat_id), 0.5)
+            self.assertEqual(self.intake_events(chat_id), [0.5])
+
+    def test_rollback_restores_memory_state(self):
+        self.reminder.startup()
+        scheduler, settings = self.reminder.scheduler, self.reminder.settings
+        reminder_due = scheduler.get('100', 'reminder')
+        with self.assertRaises(RuntimeError):
+            with self.reminder.transaction():
+                scheduler.schedule('100', 'reminder', reminder_due + 60)
+                scheduler.schedule('200', 'digest', reminder_due)
+                scheduler.pop_due(reminder_due)
+                settings.set_timezone('100', 'Asia/Tokyo')
+                settings.is_quiet('100', time.time())
+                raise RuntimeError("broken")
+
+        self.assertEqual(scheduler.get('100', 'reminder'), reminder_due)
+        self.assertIsNone(scheduler.get('200', 'digest'))
+        self.assertEqual(scheduler.next_due(), min(scheduler.due.values()))
+        self.assertFalse(scheduler.dirty)
+        self.assertIsNone(settings.get('100').timezone)
+        self.assertNotIn('100', settings.transitions)
+
+    def test_nested_blocks_are_savepoints(self):
+        db = self.reminder.db
+        with db.transaction():
+            db.set_state('kept', 1)
+            try:
+                with db.lock, db.conn:
+                    db.conn.execute("INSERT INTO bot_state (key, value) VALUES ('dropped', '1')")
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(db.get_state('kept'), '1')
+        self.assertIsNone(db.get_state('dropped'))
+
+    def test_warm_restart_resumes_without_broadcast(self):
+        self.reminder.startup()
+        self.assertEqual(len(self.api.messages_for('200')), 1)
+        self.reminder.apply_update(make_update(41, 100, "0.5"))
+        reminder_due = self.reminder.scheduler.get('100', 'reminder')
+        self.close(self.reminder)
+
+        # Simulated crash: no shutdown(), just a new process on the same database
+        self.reminder = self.make_reminder()
+        self.reminder.startup()
+        self.assertEqual(self.reminder.update_offset, 42)
+        self.assertEqual(self.reminder.scheduler.get('100', 'reminder'), reminder_due)
+        self.assertEqual(len(self.api.messages_for('200')), 1)
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 0.5)
+        # The digest for the 0.5L entry is still on its way
+        self.assertEqual(self.reminder.notifications.stats()['pending'], 1)
+        self.assertIsNotNone(self.reminder.scheduler.get('200', 'digest'))
+
+    def test_page_is_applied_as_one_batch(self):
+        page = [
+            make_update(10, 100, "0.5"),
+            make_update(11, 200, "/status"),
+            make_update(12, 100, "250ml"),
+            make_update(13, 100, "lots"),
+            make_update(14, 100, "2 cups"),
+            make_update(15, 200, "1"),
+        ]
+        self.assertEqual(self.reminder.apply_updates(page), 16)
+        self.assertEqual(self.reminder.db.get_state('update_offset'), '16')
+        self.assertEqual(self.stored_intake('100'), 1.25)
+        self.assertEqual(self.stored_intake('200'), 1.0)
+
+        # One combined reply per chat, in order
+        replies_100 = [m for m in self.api.messages_for('100') if "Please enter" in m]
+        self.assertEqual(len(replies_100), 1)
+        reply = replies_100[0].split("\n\n")
+        self.assertIn("Update: 0.75L added", reply[0])
+        self.assertIn("Update: 0.5L added. Total intake: 1.2L", reply[2])
+        self.assertEqual(len(self.api.messages_for('200')), 1)
+        # Both of chat 100's inputs reach chat 200 as one digest
+        self.assertEqual(self.reminder.notifications.stats()['pending'], 3)
+        self.reminder.notifications.flush_soon(['200'])
+        self.reminder.run_scheduled()
+        self.assertIn("Update: 1.25L added in 2 entries. Total intake: 1.2L", self.api.messages_for('200')[-1])
+        self.assertEqual(self.reminder.intake_log.summary('100', datetime.date.today(), 1)['total'], 1.25)
+
+        # Already applied, so nothing happens the second time
+        self.reminder.apply_updates(page)
+        self.assertEqual(self.stored_intake('100'), 1.25)
+
+    def test_failed_batch_falls_back_to_single_updates(self):
+        original = self.reminder.get_status
+
+        def get_status(chat_id):
+            if chat_id == '200':
+                raise RuntimeError("broken")
+            return original(chat_id)
+
+        page = [make_update(1, 100, "0.5"), make_update(2, 200, "/status"), make_update(3, 100, "0.5")]
+        with patch.object(self.reminder, 'get_status', side_effect=get_status):
+            self.assertEqual(self.reminder.apply_updates(page), 4)
+        # The bad update is skipped, everything around it applied and checkpointed
+        self.assertEqual(self.stored_intake('100'), 1.0)
+        self.assertEqual(self.intake_events('100'), [0.5, 0.5])
+        self.assertEqual(self.reminder.db.get_state('update_offset'), '4')
+
+    def test_database_error_is_retried(self):
+        page = [make_update(1, 100, "0.5"), make_update(2, 100, "/status")]
+        with patch.object(self.reminder.intake_log, 'record', side_effect=sqlite3.OperationalError("disk I/O error")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.reminder.apply_updates(page)
+        # Nothing is skipped; the page applies once the database is back
+        self.assertEqual(self.reminder.update_offset, 0)
+        self.assertEqual(self.reminder.apply_updates(page), 3)
+        self.assertEqual(self.stored_intake('100'), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
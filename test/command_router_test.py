@@ -0,0 +1,80 @@
+import datetime
+import unittest
+
+from command_router import CommandRouter, parse_amounts
+from reminder_case import ReminderTestCase
+
+
+class TestParseAmounts(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_amounts("0.5"), [0.5])
+        self.assertEqual(parse_amounts("500ml"), [0.5])
+        self.assertEqual(parse_amounts("2 cups"), [0.5])
+        self.assertEqual(parse_amounts("1 L"), [1.0])
+        self.assertEqual(parse_amounts("0,5"), [0.5])
+        self.assertAlmostEqual(parse_amounts("8oz")[0], 0.2366, places=4)
+
+    def test_bulk_entries(self):
+        self.assertEqual(parse_amounts("0.5, 250ml + 1 cup"), [0.5, 0.25, 0.25])
+        self.assertEqual(parse_amounts("1l and 500 ml"), [1.0, 0.5])
+        self.assertEqual(parse_amounts("0.5 and 0.25"), [0.5, 0.25])
+        self.assertEqual(parse_amounts("2 AND 3"), [2.0, 3.0])
+        self.assertEqual(parse_amounts("0.5 and 2 cups"), [0.5, 0.5])
+        self.assertEqual(parse_amounts("0.5 0.25"), [0.5, 0.25])
+
+    def test_invalid(self):
+        for text in ("", "abc", "nan", "2 bottles", "0.5,250ml", "500ml of tea"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_amounts(text)
+        self.assertEqual(parse_amounts("-1"), [-1.0])
+
+
+class TestCommandRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        self.router = CommandRouter(lambda chat_id: self.loaded.append(chat_id) or {'chat_id': chat_id})
+        self.router.register('/start', lambda chat_id, args: 'welcome')
+        self.router.register('/history', lambda chat_id, args: f'history {args}')
+        self.router.register('/status', lambda chat_id, args, session: f"status {session['chat_id']}",
+                             needs_session=True)
+        self.router.set_fallback(lambda chat_id, text, session: f'intake {text}', needs_session=True)
+
+    def test_sessions_only_loaded_when_needed(self):
+        self.assertEqual(self.router.handle('/start', '1'), 'welcome')
+        self.assertEqual(self.router.handle('/history 3', '1'), 'history 3')
+        self.assertEqual(self.loaded, [])
+        self.assertEqual(self.router.handle('/status', '1'), 'status 1')
+        self.assertEqual(self.router.handle('0.5', '1'), 'intake 0.5')
+        self.assertEqual(self.loaded, ['1', '1'])
+
+    def test_resolve(self):
+        self.assertEqual(self.router.handle(' /START ', '1'), 'welcome')
+        self.assertEqual(self.router.handle('/start@WaterBot', '1'), 'welcome')
+        command, args = self.router.resolve('/nope')
+        self.assertIs(command, self.router.fallback)
+        self.assertEqual(self.router.label(command, '/nope'), 'unknown')
+        self.assertEqual(self.router.label(*self.router.resolve('/history 3')), 'history')
+        self.assertEqual(self.router.label(*self.router.resolve('2 cups')), 'intake')
+
+
+class TestWaterReminderCommands(ReminderTestCase):
+    CHAT_IDS = ['100']
+
+    def test_commands_without_session_skip_the_store(self):
+        for text in ('/start', '/history', '/stats', '/metrics'):
+            self.reminder.process_user_input(text, '100')
+        self.assertEqual(self.reminder.sessions.stats()['misses'], 0)
+        self.assertEqual(self.reminder.sessions.stats()['hits'], 0)
+
+    def test_intake_with_units(self):
+        result = self.reminder.process_user_input("500ml + 2 cups", '100')
+        self.assertIn("Update: 1.0L added", result)
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 1.0)
+        history = self.reminder.intake_log.daily_totals('100', datetime.date.today(), 1)
+        self.assertEqual(history[0][1], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
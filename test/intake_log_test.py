@@ -0,0 +1,71 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from intake_log import IntakeLog, week_key
+from water_reminder import WaterReminderDB
+
+
+class TestIntakeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = WaterReminderDB(os.path.join(self.tmpdir.name, 'test.db'))
+        self.log = IntakeLog(self.db)
+        self.today = datetime.date(2026, 10, 17)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def at(self, days_ago, hour=12):
+        day = self.today - datetime.timedelta(days=days_ago)
+        return datetime.datetime.combine(day, datetime.time(hour))
+
+    def test_rollups_follow_events(self):
+        self.log.record('1', 0.5, self.at(0, 9), 2.5)
+        self.log.record('1', 1.0, self.at(0, 15), 2.5)
+        self.log.record('1', 3.0, self.at(1), 2.5)
+        self.log.record('2', 9.0, self.at(0), 2.5)
+
+        self.assertEqual(self.log.daily_totals('1', self.today, 7), [
+            ('2026-10-16', 3.0, 2.5),
+            ('2026-10-17', 1.5, 2.5),
+        ])
+        self.assertEqual(self.log.weekly_totals('1', 4), [(week_key(self.today), 4.5)])
+        self.assertEqual(self.db.conn.execute('SELECT COUNT(*) FROM intake_events').fetchone()[0], 4)
+
+    def test_summary(self):
+        self.log.record('1', 3.0, self.at(0), 2.5)
+        self.log.record('1', 1.0, self.at(3), 2.5)
+        self.log.record('1', 2.0, self.at(10), 2.5)
+        summary = self.log.summary('1', self.today, 7)
+        self.assertEqual(summary['total'], 4.0)
+        self.assertAlmostEqual(summary['average'], 4.0 / 7)
+        self.assertEqual(summary['goal_days'], 1)
+        self.assertEqual(summary['active_days'], 2)
+
+    def test_streaks(self):
+        for days_ago in (5, 3, 2, 1):
+            self.log.record('1', 1.5, self.at(days_ago, 9), 2.5)
+            self.log.record('1', 1.5, self.at(days_ago, 18), 2.5)
+            self.log.record('1', 1.5, self.at(days_ago, 20), 2.5)
+        self.assertEqual(self.log.streak('1', self.today), (3, 3))
+        # Two days without reaching the goal breaks it
+        self.assertEqual(self.log.streak('1', self.today + datetime.timedelta(days=1)), (0, 3))
+        self.assertEqual(self.log.streak('2', self.today), (0, 0))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for days_ago in range(19, -1, -1):
+            self.log.record('1', 0.75 * (days_ago % 5), self.at(days_ago), 2.5)
+            self.log.record('2', 2.5, self.at(days_ago, 8), 2.5)
+        tables = ('intake_daily', 'intake_weekly', 'intake_streaks')
+        before = {t: self.db.conn.execute(f'SELECT * FROM {t} ORDER BY 1, 2').fetchall() for t in tables}
+        self.log.rebuild_rollups(2.5)
+        after = {t: self.db.conn.execute(f'SELECT * FROM {t} ORDER BY 1, 2').fetchall() for t in tables}
+        self.assertEqual(before, after)
+
+
+if __name__ == '__main__':
+    unittest.main()
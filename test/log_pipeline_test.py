@@ -0,0 +1,102 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from log_pipeline import LogPipeline
+
+
+class TestLogPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'test.log')
+        self.logger = logging.getLogger('water_reminder.test')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_lines(self, path=None):
+        with open(path or self.filename, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_records_are_written_as_json_lines(self):
+        pipeline = LogPipeline(self.filename, flush_interval=60).start('water_reminder.test')
+        self.logger.info("hello")
+        self.logger.error("went wrong %s", 42)
+        self.assertTrue(pipeline.flush(timeout=5))
+
+        lines = self.read_lines()
+        self.assertEqual([line['message'] for line in lines], ["hello", "went wrong 42"])
+        self.assertEqual([line['level'] for line in lines], ["INFO", "ERROR"])
+        self.assertIn('time', lines[0])
+        pipeline.stop()
+
+    def test_stop_drains_the_queue(self):
+        pipeline = LogPipeline(self.filename, flush_interval=60).start('water_reminder.test')
+        for i in range(1000):
+            self.logger.info("record %d", i)
+        pipeline.stop()
+
+        self.assertEqual(len(self.read_lines()), 1000)
+        self.assertEqual(pipeline.stats()['written'], 1000)
+        # Nothing reaches the file once the pipeline is detached
+        self.logger.info("after stop")
+        self.assertEqual(len(self.read_lines()), 1000)
+
+    def test_rotates_and_compresses_by_size(self):
+        pipeline = LogPipeline(
+            self.filename, max_bytes=2000, backup_count=3, batch_size=10, flush_interval=60
+        ).start('water_reminder.test')
+        for i in range(200):
+            self.logger.info("record %d %s", i, "x" * 50)
+        pipeline.stop()
+
+        backups = glob.glob(self.filename + '.*')
+        self.assertGreater(pipeline.stats()['rotations'], 3)
+        self.assertEqual(len(backups), 3)
+        self.assertTrue(all(path.endswith('.gz') for path in backups))
+        with gzip.open(sorted(backups)[-1], 'rt', encoding='utf-8') as f:
+            self.assertTrue(all(json.loads(line)['message'].startswith("record") for line in f))
+
+    def test_rotates_by_age(self):
+        pipeline = LogPipeline(
+            self.filename, max_bytes=0, rotate_interval=0.01, compress=False, flush_interval=60
+        ).start('water_reminder.test')
+        self.logger.info("first")
+        pipeline.flush(timeout=5)
+        time.sleep(0.05)
+        self.logger.info("second")
+        pipeline.stop()
+
+        backups = glob.glob(self.filename + '.*')
+        self.assertEqual(len(backups), 1)
+        self.assertEqual(self.read_lines(backups[0])[0]['message'], "first")
+        self.assertEqual(self.read_lines()[0]['message'], "second")
+
+    def test_overflow_is_counted_and_reported(self):
+        pipeline = LogPipeline(self.filename, max_queue=10, flush_interval=60)
+        pipeline.open()
+        self.logger.addHandler(pipeline.handler)
+        try:
+            # Writer thread not running yet, so the queue fills up
+            for i in range(25):
+                self.logger.warning("record %d", i)
+        finally:
+            self.logger.removeHandler(pipeline.handler)
+        self.assertEqual(pipeline.stats()['dropped'], 15)
+
+        pipeline.file.close()
+        pipeline.start('water_reminder.test')
+        pipeline.stop()
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 11)
+        self.assertIn("dropped 15 records", lines[-1]['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
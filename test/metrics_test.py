@@ -0,0 +1,91 @@
+import unittest
+import urllib.request
+
+from metrics import MetricsRegistry, MetricsServer
+from reminder_case import ReminderTestCase
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry(buckets=(0.1, 1.0))
+
+    def test_render_counters_and_histograms(self):
+        self.metrics.describe('requests_total', 'Requests')
+        self.metrics.inc('requests_total', method='get')
+        self.metrics.inc('requests_total', 2, method='get')
+        self.metrics.observe('latency_seconds', 0.05, method='get')
+        self.metrics.observe('latency_seconds', 0.5, method='get')
+        self.metrics.observe('latency_seconds', 5, method='get')
+        self.metrics.gauge('queue_depth', lambda: 7)
+
+        text = self.metrics.render()
+        self.assertIn('# HELP requests_total Requests\n# TYPE requests_total counter\n', text)
+        self.assertIn('requests_total{method="get"} 3\n', text)
+        self.assertIn('latency_seconds_bucket{method="get",le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{method="get",le="1.0"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{method="get",le="+Inf"} 3\n', text)
+        self.assertIn('latency_seconds_sum{method="get"} 5.55\n', text)
+        self.assertIn('latency_seconds_count{method="get"} 3\n', text)
+        self.assertIn('# TYPE queue_depth gauge\nqueue_depth 7\n', text)
+
+    def test_time_and_instrument(self):
+        class Store:
+            def load(self):
+                return 'loaded'
+
+        store = Store()
+        self.metrics.instrument(store, ['load'], 'store_seconds')
+        self.assertEqual(store.load(), 'loaded')
+        with self.metrics.time('block_seconds'):
+            pass
+        self.assertEqual(self.metrics.histograms['store_seconds'][(('method', 'load'),)].count, 1)
+        self.assertEqual(self.metrics.histograms['block_seconds'][()].count, 1)
+
+    def test_disabled_registry_records_nothing(self):
+        metrics = MetricsRegistry(enabled=False)
+        metrics.inc('requests_total')
+        with metrics.time('latency_seconds'):
+            pass
+        self.assertEqual(metrics.render(), '\n')
+
+    def test_server(self):
+        self.metrics.inc('requests_total')
+        server = MetricsServer(self.metrics, port=0).start()
+        try:
+            host, port = server.address
+            with urllib.request.urlopen(f'http://{host}:{port}/metrics') as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn(b'requests_total 1', response.read())
+        finally:
+            server.stop()
+
+
+class TestReminderMetrics(ReminderTestCase):
+    CHAT_IDS = ['1', '2']
+
+    def setUp(self):
+        super().setUp()
+        self.reminder.admin_chat_ids = ['1']
+
+    def test_handlers_api_and_db_are_timed(self):
+        self.reminder.process_user_input('0.5', '1')
+        self.reminder.process_user_input('/status', '1')
+        self.reminder.process_user_input('/bogus', '1')
+        self.reminder.process_user_input('/clear', '1')
+        text = self.reminder.metrics.render()
+        self.assertIn('handler_seconds_count{command="intake"} 1', text)
+        self.assertIn('handler_seconds_count{command="status"} 1', text)
+        self.assertIn('handler_seconds_count{command="unknown"} 1', text)
+        self.assertIn('telegram_request_seconds_count{method="sendMessage"}', text)
+        self.assertIn('db_operation_seconds_count{method="get_user_session"}', text)
+        self.assertIn('outbox_depth 0', text)
+
+    def test_metrics_command_is_admin_only(self):
+        self.reminder.process_user_input('0.5', '1')
+        self.assertIn('handler_seconds[intake]: n=1', self.reminder.process_user_input('/metrics', '1'))
+        self.assertIn('only available to admins', self.reminder.process_user_input('/metrics', '3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import time
+import unittest
+
+from notifications import NotificationAggregator
+from reminder_case import ReminderTestCase
+
+
+class TestNotificationAggregator(ReminderTestCase):
+    CHAT_IDS = ['1', '2', '3']
+
+    def setUp(self):
+        super().setUp()
+        self.notifications = self.reminder.notifications
+        self.scheduler = self.reminder.scheduler
+
+    def age_pending(self, seconds):
+        with self.reminder.db.lock, self.reminder.db.conn:
+            self.reminder.db.conn.execute('UPDATE pending_notifications SET created_at = created_at - ?', (seconds,))
+
+    def test_entries_are_debounced(self):
+        self.notifications.window = 60
+        self.notifications.max_delay = 100
+        self.notifications.add(['2'], '1', 0.1, 0.1, 2.5)
+        first = self.scheduler.get('2', 'digest')
+        self.assertAlmostEqual(first, time.time() + 60, delta=1)
+
+        # Each new entry pushes the digest back, but never past max_delay
+        self.age_pending(50)
+        self.notifications.add(['2'], '1', 0.1, 0.2, 2.5)
+        self.assertAlmostEqual(self.scheduler.get('2', 'digest'), first - 60 + 50, delta=1)
+
+    def test_max_delay_survives_restart(self):
+        self.notifications.window = 60
+        self.notifications.max_delay = 100
+        self.notifications.add(['2'], '1', 0.1, 0.1, 2.5)
+        self.age_pending(80)
+
+        # A fresh aggregator still counts max_delay from the first entry
+        notifications = NotificationAggregator(self.reminder.db, self.scheduler, window=60, max_delay=100)
+        notifications.add(['2'], '1', 0.1, 0.2, 2.5)
+        self.assertAlmostEqual(self.scheduler.get('2', 'digest'), time.time() + 20, delta=1)
+
+    def test_digest_per_recipient(self):
+        for _ in range(3):
+            self.reminder.process_user_input('0.1', '1')
+        self.reminder.process_user_input('2 cups', '2')
+        self.assertEqual(self.api.messages_for('3'), [])
+
+        self.notifications.flush_soon(['2', '3'])
+        self.reminder.run_scheduled()
+        self.assertEqual(self.api.messages_for('2')[-1],
+                         "Update: 0.3L added in 3 entries. Total intake: 0.3L. Remaining: 2.2L")
+        digest = self.api.messages_for('3')
+        self.assertEqual(len(digest), 1)
+        self.assertIn("Chat 1: Update: 0.3L added in 3 entries", digest[0])
+        self.assertIn("Chat 2: Update: 0.5L added. Total intake: 0.5L", digest[0])
+
+        stats = self.notifications.stats()
+        # Chat 1's digest about chat 2 is still pending
+        self.assertEqual((stats['entries'], stats['pending'], stats['digests']), (8, 1, 2))
+        self.assertEqual(stats['reduction'], 3.5)
+
+    def test_goal_reached_is_not_delayed(self):
+        self.reminder.process_user_input('1', '1')
+        self.reminder.process_user_input('2', '1')
+        self.assertTrue(any("Congratulations" in m for m in self.api.messages_for('1')))
+        self.assertLessEqual(self.scheduler.get('2', 'digest'), time.time())
+        self.reminder.run_scheduled()
+        self.assertIn("Update: 3.0L added in 2 entries", self.api.messages_for('2')[-1])
+        self.assertIn("Exceeded goal by: 0.5L", self.api.messages_for('2')[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
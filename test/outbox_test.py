@@ -0,0 +1,141 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from clock import VirtualClock
+from fake_bot_api import FakeBotAPI
+from outbox import Outbox, TokenBucket
+from telegram_client import TelegramClient
+from water_reminder import WaterReminder, WaterReminderDB
+
+
+class RejectingBotAPI(FakeBotAPI):
+    # Chat 429 is rate limited, chat 403 has blocked the bot
+    def handle(self, method, params):
+        chat_id = str(params.get("chat_id"))
+        if method == "sendMessage" and chat_id == "429":
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                         "parameters": {"retry_after": 30}}
+        if method == "sendMessage" and chat_id == "403":
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked"}
+        return super().handle(method, params)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        for _ in range(2):
+            self.assertEqual(bucket.delay(100.0), 0)
+            bucket.take(100.0)
+        self.assertAlmostEqual(bucket.delay(100.0), 0.5)
+        self.assertEqual(bucket.delay(100.5), 0)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        bucket.pause(100.0, 10)
+        self.assertAlmostEqual(bucket.delay(100.0), 10)
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = WaterReminderDB(os.path.join(self.tmpdir.name, 'test.db'))
+        self.api = RejectingBotAPI().start()
+        self.client = TelegramClient('TEST_TOKEN', self.api.base_url)
+        self.outbox = Outbox(self.db, self.client, global_rate=100, per_chat_rate=1, per_chat_burst=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def pending(self):
+        return self.db.conn.execute(
+            'SELECT chat_id, attempts, not_before FROM outbox ORDER BY id'
+        ).fetchall()
+
+    def test_dispatch_sends_and_removes(self):
+        ids = self.outbox.enqueue(['1', '2'], 'hello')
+        results = self.outbox.dispatch()
+        self.assertEqual(sorted(results), ids)
+        self.assertEqual(self.pending(), [])
+        self.assertEqual(self.outbox.stats()['sent'], 2)
+
+    def test_per_chat_limit_holds_back_in_order(self):
+        for i in range(4):
+            self.outbox.enqueue(['1'], f'message {i}')
+        # One message per chat per pass, until the chat's burst is used up
+        self.outbox.dispatch()
+        self.assertEqual(self.outbox.next_delay(), 0.01)
+        self.outbox.dispatch()
+        self.outbox.dispatch()
+        self.assertEqual(self.api.messages_for('1'), ['message 0', 'message 1'])
+        self.assertEqual(self.outbox.stats()['depth'], 2)
+        self.assertGreater(self.outbox.next_delay(), 0.5)
+
+    def test_retry_after_is_honored(self):
+        self.outbox.enqueue(['429'], 'hi')
+        before = time.time()
+        self.outbox.dispatch()
+        (chat_id, attempts, not_before), = self.pending()
+        self.assertEqual(attempts, 1)
+        self.assertGreaterEqual(not_before, before + 30)
+        self.assertEqual(self.outbox.dispatch(), {})
+
+    def test_permanent_errors_are_dropped(self):
+        self.outbox.enqueue(['403'], 'hi')
+        self.outbox.dispatch()
+        self.assertEqual(self.pending(), [])
+        self.assertEqual(self.outbox.stats()['failed'], 1)
+
+    def test_deferred_messages_wait(self):
+        self.outbox.enqueue(['1'], 'later', not_before=time.time() + 3600)
+        self.assertEqual(self.outbox.dispatch(), {})
+        self.assertEqual(self.outbox.stats()['depth'], 1)
+        self.assertEqual(self.outbox.stats()['due'], 0)
+
+    def test_retry_keeps_chat_order(self):
+        clock = VirtualClock(1000.0)
+        outbox = Outbox(self.db, self.client, global_rate=100, per_chat_rate=1, per_chat_burst=2, clock=clock)
+        self.api.inject_error(500)
+        outbox.enqueue(['1'], 'first')
+        outbox.dispatch()
+        outbox.enqueue(['1'], 'second')
+        # The second message waits behind the first one's retry
+        clock.advance(1)
+        self.assertEqual(outbox.dispatch(), {})
+        clock.advance(1)
+        outbox.dispatch()
+        outbox.dispatch()
+        self.assertEqual(self.api.messages_for('1'), ['first', 'second'])
+
+    def test_deferred_message_does_not_hold_back_chat(self):
+        self.outbox.enqueue(['1'], 'after quiet hours', not_before=time.time() + 3600)
+        self.outbox.enqueue(['1'], 'reply')
+        self.outbox.dispatch()
+        self.assertEqual(self.api.messages_for('1'), ['reply'])
+
+
+class TestQuietHoursDeferral(unittest.TestCase):
+
+    def test_quiet_hours_message_is_queued_not_dropped(self):
+        with tempfile.TemporaryDirectory() as tmp, FakeBotAPI() as api:
+            reminder = WaterReminder('TEST_TOKEN', ['1'], db_name=os.path.join(tmp, 'test.db'),
+                                     api_base=api.base_url)
+            with patch.object(reminder, 'is_quiet_hours', return_value=True):
+                self.assertEqual(reminder.send_telegram_message('Reminder'), [])
+            row = reminder.db.conn.execute('SELECT text, not_before FROM outbox').fetchone()
+            self.assertEqual(row[0], 'Reminder')
+            self.assertAlmostEqual(row[1], reminder.quiet_hours_end().timestamp(), delta=1)
+            self.assertEqual(api.sent, [])
+            reminder.telegram.close()
+            reminder.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+
+from fake_bot_api import FakeBotAPI
+from water_reminder import WaterReminder
+
+
+class ReminderTestCase(unittest.TestCase):
+    # A WaterReminder for CHAT_IDS on a fresh database in a temp dir, talking
+    # to a FakeBotAPI. Subclasses that extend setUp/tearDown call super()
+    # first in setUp and last in tearDown.
+    CHAT_IDS = ['100', '200']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.db')
+        self.api = FakeBotAPI().start()
+        self.reminder = self.make_reminder()
+
+    def tearDown(self):
+        # None once a test has shut the reminder down itself
+        if self.reminder is not None:
+            self.close(self.reminder)
+        self.api.stop()
+        self.tmpdir.cleanup()
+
+    def make_reminder(self) -> WaterReminder:
+        return WaterReminder('TEST_TOKEN', self.CHAT_IDS, db_name=self.db_name, api_base=self.api.base_url)
+
+    def close(self, reminder: WaterReminder):
+        # Stops background threads and closes up, without shutdown()'s goodbye message
+        reminder.outbox.stop()
+        reminder.sessions.stop()
+        reminder.telegram.close()
+        reminder.db.close()
@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from reminder_case import ReminderTestCase
+
+
+class TestDayRollover(ReminderTestCase):
+    CHAT_IDS = ['1', '2']
+
+    def setUp(self):
+        super().setUp()
+        self.yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+
+    def log_intake(self, chat_id, amount, when):
+        session = self.reminder.sessions.get_user_session(chat_id)
+        session.current_intake = amount
+        session.last_update_time = when
+        self.reminder.sessions.save_user_session(session)
+
+    def test_stale_sessions_are_reset(self):
+        self.log_intake('1', 2.75, self.yesterday)
+        self.log_intake('2', 1.0, datetime.datetime.now())
+        self.log_intake('3', 0.5, self.yesterday)
+
+        reset = self.reminder.rollover_day()
+
+        self.assertEqual(sorted(reset), ['1', '3'])
+        self.assertEqual(self.reminder.sessions.get_user_session('1').current_intake, 0)
+        self.assertEqual(self.reminder.sessions.get_user_session('2').current_intake, 1.0)
+        self.assertEqual(self.reminder.sessions.get_user_session('3').current_intake, 0)
+
+    def test_rollover_notifies_configured_chats_once(self):
+        self.log_intake('1', 1.0, self.yesterday)
+        self.log_intake('3', 1.0, self.yesterday)
+        self.reminder.rollover_day()
+        self.assertEqual(self.api.messages_for('1'), ["New day started! Your water intake has been reset to 0L."])
+        self.assertEqual(self.api.messages_for('3'), [])
+        self.assertEqual(self.reminder.rollover_day(), [])
+        self.assertEqual(len(self.api.sent), 1)
+
+    def test_goal_notification_flag_is_cleared(self):
+        self.log_intake('1', 3.0, self.yesterday)
+        session = self.reminder.sessions.get_user_session('1')
+        session.goal_reached_notified = True
+        self.reminder.sessions.save_user_session(session)
+        self.reminder.rollover_day()
+        self.assertFalse(self.reminder.sessions.get_user_session('1').goal_reached_notified)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from reminder_case import ReminderTestCase
+from scheduler import ReminderScheduler
+from water_reminder import WaterReminderDB
+
+
+class TestReminderScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = WaterReminderDB(os.path.join(self.tmpdir.name, 'test.db'))
+        self.scheduler = ReminderScheduler(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_pop_due_returns_only_due_events_in_order(self):
+        self.scheduler.schedule('1', 'reminder', 30.0)
+        self.scheduler.schedule('2', 'reminder', 10.0)
+        self.scheduler.schedule('3', 'reminder', 50.0)
+        self.assertEqual(self.scheduler.pop_due(40.0), [('2', 'reminder', 10.0), ('1', 'reminder', 30.0)])
+        self.assertEqual(self.scheduler.next_due(), 50.0)
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_reschedule_and_cancel_skip_stale_entries(self):
+        self.scheduler.schedule('1', 'reminder', 10.0)
+        self.scheduler.schedule('1', 'reminder', 100.0)
+        self.scheduler.schedule('2', 'reset', 20.0)
+        self.scheduler.cancel('2', 'reset')
+        self.assertEqual(self.scheduler.pop_due(50.0), [])
+        self.assertEqual(self.scheduler.next_due(), 100.0)
+
+    def test_save_and_load_round_trip(self):
+        self.scheduler.schedule('1', 'reminder', 10.0)
+        self.scheduler.schedule('1', 'reset', 20.0)
+        self.scheduler.schedule('2', 'reminder', 30.0)
+        self.scheduler.save()
+        self.scheduler.pop_due(15.0)
+        self.scheduler.save()
+
+        restored = ReminderScheduler(self.db)
+        restored.load()
+        self.assertIsNone(restored.get('1', 'reminder'))
+        self.assertEqual(restored.get('1', 'reset'), 20.0)
+        self.assertEqual(restored.pop_due(100.0), [('1', 'reset', 20.0), ('2', 'reminder', 30.0)])
+
+
+class TestScheduledReminders(ReminderTestCase):
+    CHAT_IDS = ['1']
+
+    def setUp(self):
+        super().setUp()
+        self.reminder.schedule_chats()
+        self.reminder.scheduler.schedule('1', 'reminder', time.time() - 1)
+
+    def test_due_reminder_is_sent_and_rescheduled(self):
+        with patch.object(self.reminder, 'is_quiet_hours', return_value=False):
+            self.assertEqual(self.reminder.run_scheduled(), 2)
+        self.assertIn('You still need to drink 2.5L', self.api.messages_for('1')[0])
+        self.assertAlmostEqual(self.reminder.scheduler.get('1', 'reminder'), time.time() + 3600, delta=5)
+        self.assertEqual(self.reminder.scheduler.get('*', 'rollover'), self.reminder.next_midnight().timestamp())
+
+    def test_quiet_hours_push_reminder_to_window_end(self):
+        with patch.object(self.reminder, 'is_quiet_hours', return_value=True):
+            self.reminder.run_scheduled()
+        self.assertEqual(self.api.sent, [])
+        self.assertEqual(self.reminder.scheduler.get('1', 'reminder'),
+                         self.reminder.quiet_hours_end().timestamp())
+
+    def test_goal_reached_parks_reminder_until_midnight(self):
+        session = self.reminder.sessions.get_user_session('1')
+        session.current_intake = 3.0
+        self.reminder.run_scheduled()
+        self.assertEqual(self.api.sent, [])
+        self.assertEqual(self.reminder.scheduler.get('1', 'reminder'),
+                         self.reminder.next_midnight().timestamp())
+
+    def test_failed_event_stays_due(self):
+        scheduler = self.reminder.scheduler
+        rollover_due = scheduler.get('*', 'rollover')
+        original = self.reminder.rollover_day
+        failures = [RuntimeError("broken")]
+
+        def rollover_day(timezone=None):
+            if failures:
+                raise failures.pop()
+            return original(timezone)
+
+        with patch.object(self.reminder, 'rollover_day', side_effect=rollover_day):
+            with self.assertRaises(RuntimeError):
+                self.reminder.run_scheduled()
+            # Still due in memory and in the table, so the next tick runs it
+            self.assertEqual(scheduler.get('*', 'rollover'), rollover_due)
+            with self.reminder.db.lock:
+                rows = self.reminder.db.conn.execute('SELECT chat_id, kind FROM schedule ORDER BY kind').fetchall()
+            self.assertEqual(rows, [('1', 'reminder'), ('*', 'rollover')])
+            with patch.object(self.reminder, 'is_quiet_hours', return_value=False):
+                self.assertEqual(self.reminder.run_scheduled(), 2)
+        self.assertEqual(scheduler.get('*', 'rollover'), self.reminder.next_midnight().timestamp())
+
+
+if __name__ == '__main__':
+    unittest.main()
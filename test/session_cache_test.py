@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from session_cache import SessionCache
+from water_reminder import WaterReminderDB
+
+
+class TestSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = WaterReminderDB(os.path.join(self.tmpdir.name, 'test.db'))
+        self.cache = SessionCache(self.db, max_size=3, flush_interval=3600, flush_threshold=10)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def stored_intake(self, chat_id):
+        row = self.db.conn.execute(
+            'SELECT current_intake FROM user_sessions WHERE chat_id = ?', (chat_id,)
+        ).fetchone()
+        return row[0]
+
+    def test_get_serves_from_memory_after_first_load(self):
+        first = self.cache.get_user_session('1')
+        second = self.cache.get_user_session('1')
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_save_is_written_behind_until_flush(self):
+        session = self.cache.get_user_session('1')
+        session.current_intake = 1.5
+        self.cache.save_user_session(session)
+        self.assertEqual(self.stored_intake('1'), 0.0)
+
+        self.assertEqual(self.cache.flush(), 1)
+        self.assertEqual(self.stored_intake('1'), 1.5)
+        self.assertEqual(self.cache.stats()['dirty'], 0)
+
+    def test_dirty_threshold_triggers_flush(self):
+        self.cache.max_size = 20
+        for i in range(10):
+            session = self.cache.get_user_session(str(i))
+            session.current_intake = 0.5
+            self.cache.save_user_session(session)
+        self.assertEqual(self.cache.stats()['flushes'], 1)
+        self.assertEqual(self.stored_intake('9'), 0.5)
+
+    def test_lru_eviction_writes_dirty_session(self):
+        session = self.cache.get_user_session('1')
+        session.current_intake = 2.0
+        self.cache.save_user_session(session)
+        for chat_id in ('2', '3', '4'):
+            self.cache.get_user_session(chat_id)
+
+        self.assertNotIn('1', self.cache.sessions)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.stored_intake('1'), 2.0)
+
+    def test_reset_user_session(self):
+        session = self.cache.get_user_session('1')
+        session.current_intake = 2.0
+        session.goal_reached_notified = True
+        self.cache.save_user_session(session)
+
+        session = self.cache.reset_user_session('1')
+        self.assertEqual(session.current_intake, 0)
+        self.assertFalse(session.goal_reached_notified)
+        self.cache.stop()
+        self.assertEqual(self.stored_intake('1'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+from fake_bot_api import FakeBotAPI
+from sharding import ShardedRunner, run_shard, shard_db_name, shard_for
+from water_reminder import WaterReminder
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_shard_for(self):
+        # Stable across runs, and every shard gets a fair share
+        self.assertEqual(shard_for('100', 4), shard_for(100, 4))
+        self.assertEqual([shard_for(str(chat_id), 4) for chat_id in (100, 200, 300)], [2, 3, 0])
+        counts = Counter(shard_for(str(chat_id), 4) for chat_id in range(10000))
+        self.assertEqual(sorted(counts), [0, 1, 2, 3])
+        self.assertTrue(all(2200 < count < 2800 for count in counts.values()))
+
+    def test_shard_db_name(self):
+        self.assertEqual(shard_db_name('/data/water_reminder.db', 2), '/data/water_reminder.shard2.db')
+
+
+class TestShardedRunner(unittest.TestCase):
+    CHAT_IDS = ['100', '200', '300', '400']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmpdir.name, 'test.db')
+        self.api = FakeBotAPI().start()
+
+    def tearDown(self):
+        self.api.stop()
+        self.tmpdir.cleanup()
+
+    def start_runner(self):
+        runner = ShardedRunner('TEST_TOKEN', self.CHAT_IDS, 2, db_name=self.db_name,
+                               api_base=self.api.base_url, poll_timeout=1, tick_interval=0.2)
+        thread = threading.Thread(target=runner.run)
+        thread.start()
+        return runner, thread
+
+    def stop_runner(self, runner, thread):
+        runner.shutdown_flag = True
+        thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+
+    def wait_for_text(self, chat_id, fragment, timeout=20.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(fragment in text for text in self.api.messages_for(chat_id)):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def sessions(self, shard):
+        with sqlite3.connect(shard_db_name(self.db_name, shard)) as conn:
+            return dict(conn.execute('SELECT chat_id, current_intake FROM user_sessions').fetchall())
+
+    def test_routes_by_chat_and_restarts_warm(self):
+        runner, thread = self.start_runner()
+        try:
+            for chat_id in self.CHAT_IDS:
+                self.assertTrue(self.wait_for_text(chat_id, 'Water reminder app started'))
+            for text in ('0.5', '0.25', '/status'):
+                for chat_id in (100, 200, 300):
+                    self.api.push_update(chat_id, text)
+            for chat_id in ('100', '200', '300'):
+                self.assertTrue(self.wait_for_text(chat_id, 'Current intake: 0.8L'))
+        finally:
+            self.stop_runner(runner, thread)
+        self.assertEqual(runner.applied, 9)
+
+        # Each chat lives only in its own shard's database
+        for shard in (0, 1):
+            sessions = self.sessions(shard)
+            self.assertTrue(sessions)
+            for chat_id, intake in sessions.items():
+                self.assertEqual(shard_for(chat_id, 2), shard)
+                self.assertEqual(intake, 0.75 if chat_id != '400' else 0.0)
+
+        # The restart neither greets again nor applies anything twice
+        runner, thread = self.start_runner()
+        self.api.push_update(400, '1')
+        try:
+            self.assertTrue(self.wait_for_text('400', 'Total intake: 1.0L'))
+        finally:
+            self.stop_runner(runner, thread)
+        starts = [text for text in self.api.messages_for('100') if 'Water reminder app started' in text]
+        self.assertEqual(len(starts), 1)
+        self.assertEqual({**self.sessions(0), **self.sessions(1)},
+                         {'100': 0.75, '200': 0.75, '300': 0.75, '400': 1.0})
+
+    def test_worker_stops_while_retrying(self):
+        # A database that keeps failing must not keep the worker from stopping
+        updates, acks = queue.Queue(), queue.Queue()
+        updates.put([{"update_id": 1, "message": {"chat": {"id": 100}, "text": "0.5"}}])
+        updates.put(None)
+        failing = sqlite3.OperationalError("database is locked")
+        with patch('sharding.signal.signal'), patch.object(WaterReminder, 'apply_updates', side_effect=failing):
+            started = time.monotonic()
+            run_shard(0, 1, 'TEST_TOKEN', ['100'], self.db_name, self.api.base_url, 30, 0.2,
+                      updates, acks, None, retry_interval=30)
+        self.assertLess(time.monotonic() - started, 10)
+        # Only the startup checkpoint; the update is left for the next start
+        self.assertEqual(acks.get_nowait(), (0, 0))
+        self.assertTrue(acks.empty())
+        self.assertTrue(self.wait_for_text('100', 'shutting down'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from clock import VirtualClock
+from simulation import Simulation, generate_updates, load_updates, save_updates
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.start = datetime.datetime(2026, 1, 5).timestamp()
+        self.simulation = Simulation(['1', '2', '3'], os.path.join(self.tmpdir.name, 'sim.db'), self.start)
+
+    def tearDown(self):
+        self.simulation.close()
+        self.tmpdir.cleanup()
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(100.0)
+        clock.sleep(60)
+        clock.advance_to(50)
+        self.assertEqual(clock.time(), 160.0)
+        self.assertEqual(clock.now(), datetime.datetime.fromtimestamp(160.0))
+
+    def test_days_of_reminders_and_resets(self):
+        self.simulation.run([], self.start + 2 * 86400)
+        report = self.simulation.report(self.start, 1.0)
+
+        self.assertEqual(report['simulated_days'], 2)
+        # Nobody drinks, so everyone is reminded every hour outside quiet hours
+        # and reset at the one midnight in between
+        self.assertEqual(report['resets'], 3)
+        self.assertGreater(report['reminders_sent'], 3 * 2 * 15)
+        for at, _, kind in self.simulation.client.messages:
+            if kind == 'reminder':
+                self.assertGreaterEqual(datetime.datetime.fromtimestamp(at).time(), datetime.time(7, 30))
+
+    def test_replays_script(self):
+        path = os.path.join(self.tmpdir.name, 'script.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({"at": 9 * 3600, "chat_id": "1", "text": "2l"}) + '\n')
+            f.write(json.dumps({"update_id": 5, "message": {
+                "message_id": 5, "date": 1000, "chat": {"id": 1}, "text": "500ml"}}) + '\n')
+        events = load_updates(path, self.start)
+        self.assertEqual([(at - self.start, text) for at, _, text in events], [(0, '500ml'), (9 * 3600, '2l')])
+
+        self.simulation.run(events, self.start + 86400)
+        report = self.simulation.report(self.start, 1.0)
+        self.assertEqual(report['updates'], 2)
+        self.assertEqual(report['goals_reached'], 1)
+        # Chat 1 hit its goal at 09:00 and isn't reminded again that day
+        reminded = [at for at, chat_id, kind in self.simulation.client.messages
+                    if kind == 'reminder' and chat_id == '1']
+        self.assertTrue(reminded)
+        self.assertTrue(all(at < self.start + 9 * 3600 for at in reminded))
+
+    def test_recorded_stream_round_trips(self):
+        events = generate_updates(['1', '2'], self.start, days=2, entries_per_day=4)
+        self.assertEqual(len(events), 16)
+        path = os.path.join(self.tmpdir.name, 'recorded.jsonl')
+        save_updates(path, events, self.start)
+        loaded = load_updates(path, self.start)
+        self.assertEqual([(chat_id, text) for _, chat_id, text in loaded],
+                         [(chat_id, text) for _, chat_id, text in events])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from fake_bot_api import FakeBotAPI
+from telegram_client import TelegramAPIError, TelegramClient
+
+
+class FlakyBotAPI(FakeBotAPI):
+    # Rejects every message for chat 13 with a 429
+    def handle(self, method, params):
+        if method == "sendMessage" and str(params.get("chat_id")) == "13":
+            return 429, {"ok": False, "error_code": 429,
+                         "description": "Too Many Requests: retry after 7",
+                         "parameters": {"retry_after": 7}}
+        return super().handle(method, params)
+
+
+class TestTelegramClient(unittest.TestCase):
+
+    def setUp(self):
+        self.api = FlakyBotAPI().start()
+        self.client = TelegramClient('TEST_TOKEN', self.api.base_url, max_workers=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def test_send_message_posts_body(self):
+        response = self.client.send_message('42', 'hello *world*')
+        self.assertTrue(response["ok"])
+        self.assertEqual(self.api.messages_for('42'), ['hello *world*'])
+
+    def test_send_many_keeps_recipient_order(self):
+        chat_ids = [str(i) for i in range(20, 40)]
+        results = self.client.send_many(chat_ids, 'fan-out')
+        self.assertEqual([str(r["result"]["chat"]["id"]) for r in results], chat_ids)
+        self.assertEqual(len(self.api.sent), 20)
+
+    def test_send_many_returns_errors_in_place(self):
+        results = self.client.send_many(['12', '13', '14'], 'hi')
+        self.assertTrue(results[0]["ok"])
+        self.assertIsInstance(results[1], TelegramAPIError)
+        self.assertEqual(results[1].error_code, 429)
+        self.assertEqual(results[1].retry_after, 7)
+        self.assertTrue(results[2]["ok"])
+
+    def test_get_updates(self):
+        self.api.push_update(5, '0.5')
+        updates = self.client.get_updates(0, timeout=0)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0]["message"]["text"], '0.5')
+        self.assertEqual(self.client.get_updates(updates[0]["update_id"] + 1, timeout=0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
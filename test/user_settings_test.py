@@ -0,0 +1,123 @@
+import datetime
+import time
+import unittest
+from zoneinfo import ZoneInfo
+
+from reminder_case import ReminderTestCase
+from user_settings import Transitions, parse_quiet_window, parse_timezone
+from water_reminder import ROLLOVER_KEY
+
+
+def at(timezone, *args):
+    return datetime.datetime(*args, tzinfo=ZoneInfo(timezone)).timestamp()
+
+
+class TestTransitions(ReminderTestCase):
+    CHAT_IDS = ['1', '2']
+
+    def setUp(self):
+        super().setUp()
+        self.settings = self.reminder.settings
+
+    def test_parsing(self):
+        self.assertEqual(parse_quiet_window("22:30-07:00"), (datetime.time(22, 30), datetime.time(7, 0)))
+        self.assertEqual(parse_quiet_window("off"), (datetime.time(0, 0), datetime.time(0, 0)))
+        self.assertEqual(parse_timezone("europe/athens"), "Europe/Athens")
+        for text in ("25:00-07:00", "late", ""):
+            with self.assertRaises(ValueError):
+                parse_quiet_window(text)
+        with self.assertRaises(ValueError):
+            parse_timezone("Mars/Olympus")
+
+    def test_window_across_midnight(self):
+        settings = self.settings.set_timezone('1', 'Asia/Tokyo')
+        settings = self.settings.set_quiet_hours('1', datetime.time(22, 0), datetime.time(7, 0))
+
+        evening = Transitions(settings, at('Asia/Tokyo', 2026, 3, 1, 21, 0))
+        self.assertFalse(evening.quiet)
+        self.assertEqual(evening.quiet_start, at('Asia/Tokyo', 2026, 3, 1, 22, 0))
+        self.assertEqual(evening.valid_until, evening.quiet_start)
+
+        night = Transitions(settings, at('Asia/Tokyo', 2026, 3, 1, 23, 0))
+        self.assertTrue(night.quiet)
+        self.assertEqual(night.midnight, at('Asia/Tokyo', 2026, 3, 2, 0, 0))
+        self.assertEqual(night.quiet_end, at('Asia/Tokyo', 2026, 3, 2, 7, 0))
+
+        morning = Transitions(settings, at('Asia/Tokyo', 2026, 3, 2, 7, 0))
+        self.assertFalse(morning.quiet)
+
+    def test_midnight_follows_dst(self):
+        settings = self.settings.set_timezone('1', 'Europe/Athens')
+        # Clocks go back on 25 October 2026, so that day is 25 hours long
+        transitions = Transitions(settings, at('Europe/Athens', 2026, 10, 25, 0, 30))
+        self.assertEqual(transitions.midnight - at('Europe/Athens', 2026, 10, 25, 0, 0), 25 * 3600)
+
+    def test_checks_use_cached_transitions(self):
+        self.settings.set_timezone('1', 'America/New_York')
+        now = at('America/New_York', 2026, 6, 1, 3, 0)
+        self.assertTrue(self.settings.is_quiet('1', now))
+        cached = self.settings.transitions['1']
+        self.assertTrue(self.settings.is_quiet('1', now + 60))
+        self.assertIs(self.settings.transitions['1'], cached)
+        # Past the end of the window the entry is recomputed
+        self.assertFalse(self.settings.is_quiet('1', cached.quiet_end))
+        self.assertIsNot(self.settings.transitions['1'], cached)
+
+    def test_settings_are_persisted(self):
+        self.settings.set_timezone('1', 'Asia/Tokyo')
+        self.settings.set_quiet_hours('1', datetime.time(23, 0), datetime.time(6, 0))
+        self.settings.settings.clear()
+        settings = self.settings.get('1')
+        self.assertEqual(settings.timezone, 'Asia/Tokyo')
+        self.assertEqual((settings.quiet_start, settings.quiet_end), (datetime.time(23, 0), datetime.time(6, 0)))
+        self.assertEqual(self.settings.get('2').timezone, None)
+        self.assertEqual(self.settings.timezones(), ['Asia/Tokyo'])
+
+    def test_commands(self):
+        self.assertIn("Europe/Athens", self.reminder.process_user_input("/timezone europe/athens", '1'))
+        self.assertIn("Unknown timezone", self.reminder.process_user_input("/timezone Nowhere", '1'))
+        self.assertIn("22:00 - 06:30", self.reminder.process_user_input("/quiet 22:00-06:30", '1'))
+        self.assertIn("Usage", self.reminder.process_user_input("/quiet soon", '1'))
+        self.assertIn("3.0L", self.reminder.process_user_input("/goal 3000ml", '1'))
+        self.assertIn("Usage", self.reminder.process_user_input("/goal lots", '1'))
+        self.assertEqual(self.reminder.sessions.get_user_session('1').daily_goal, 3.0)
+
+        settings = self.reminder.process_user_input("/settings", '1')
+        self.assertIn("Timezone: Europe/Athens", settings)
+        self.assertIn("Quiet hours: 22:00 - 06:30", settings)
+        self.assertIn("Daily goal: 3.0L", settings)
+        self.assertIsNotNone(self.reminder.scheduler.get(ROLLOVER_KEY + 'Europe/Athens', 'rollover'))
+
+    def test_quiet_chats_are_deferred_individually(self):
+        self.reminder.process_user_input("/quiet off", '1')
+        now = datetime.datetime.now()
+        start = (now - datetime.timedelta(hours=1)).time()
+        end = (now + datetime.timedelta(hours=1)).time()
+        self.settings.set_quiet_hours('2', start, end)
+
+        self.reminder.send_telegram_message("Drink up")
+        self.assertEqual(self.api.messages_for('1'), ["Drink up"])
+        self.assertEqual(self.api.messages_for('2'), [])
+        with self.reminder.db.lock:
+            not_before = self.reminder.db.conn.execute(
+                "SELECT not_before FROM outbox WHERE chat_id = '2'"
+            ).fetchone()[0]
+        self.assertAlmostEqual(not_before, time.time() + 3600, delta=120)
+
+    def test_rollover_per_timezone(self):
+        # A chat far ahead of the Pi is reset by its own timezone's rollover only
+        self.settings.set_timezone('1', 'Pacific/Kiritimati')
+        for chat_id in ('1', '2'):
+            session = self.reminder.sessions.get_user_session(chat_id)
+            session.current_intake = 1.0
+            session.last_update_time = datetime.datetime.now() - datetime.timedelta(days=1)
+            self.reminder.sessions.save_user_session(session)
+
+        self.assertEqual(self.reminder.rollover_day(), ['2'])
+        self.assertEqual(self.reminder.sessions.get_user_session('1').current_intake, 1.0)
+        self.assertEqual(self.reminder.rollover_day('Pacific/Kiritimati'), ['1'])
+        self.assertEqual(self.reminder.sessions.get_user_session('1').current_intake, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
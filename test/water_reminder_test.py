@@ -1,173 +1,160 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import datetime
-from water_reminder import (
-    send_telegram_message,
-    get_telegram_updates,
-    process_user_input,
-    check_daily_reset,
-    clear_chat,
-    reset_daily_intake,
-    water_reminder
-)
-
-class TestWaterReminderApp(unittest.TestCase):
-
-    def setUp(self):
-        # Reset global variables before each test
-        global current_intake, last_update_time, daily_goal_liters
-        current_intake = 0
-        last_update_time = None
-        daily_goal_liters = 2.5
-
-    @patch('water_reminder.requests.get')
-    def test_send_telegram_message(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"ok": True}
-        mock_get.return_value = mock_response
-
-        result = send_telegram_message("Test message")
-        self.assertEqual(result, {"ok": True})
-        mock_get.assert_called_once()
-
-    @patch('water_reminder.requests.get')
-    def test_get_telegram_updates(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"ok": True, "result": []}
-        mock_get.return_value = mock_response
-
-        result = get_telegram_updates(0)
-        self.assertEqual(result, {"ok": True, "result": []})
-        mock_get.assert_called_once()
+import signal
+import threading
+
+from reminder_case import ReminderTestCase
+from water_reminder import WaterReminder, install_signal_handlers
+
+class TestWaterReminderApp(ReminderTestCase):
+
+    def set_intake(self, chat_id, amount, last_update_time=None):
+        session = self.reminder.sessions.get_user_session(chat_id)
+        session.current_intake = amount
+        if last_update_time is not None:
+            session.last_update_time = last_update_time
+        self.reminder.sessions.save_user_session(session)
+
+    @patch.object(WaterReminder, 'is_quiet_hours', return_value=False)
+    def test_send_telegram_message(self, mock_quiet_hours):
+        result = self.reminder.send_telegram_message("Test message")
+        self.assertEqual(len(result), 2)
+        self.assertTrue(all(response["ok"] for response in result))
+        self.assertEqual(self.api.messages_for('100'), ["Test message"])
+        self.assertEqual(self.api.messages_for('200'), ["Test message"])
+
+    def test_send_telegram_message_error_is_retried(self):
+        self.api.inject_error(500)
+        result = self.reminder.send_telegram_message("Test message", '100', respect_quiet_hours=False)
+        self.assertEqual(result, [])
+        self.assertEqual(self.reminder.outbox.stats()['depth'], 1)
+        self.assertEqual(self.reminder.outbox.stats()['retried'], 1)
+
+    def test_get_telegram_updates(self):
+        self.api.push_update(100, "0.5")
+        result = self.reminder.get_updates(0, timeout=0)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]["message"]["text"], "0.5")
 
     def test_process_user_input_valid(self):
-        result = process_user_input("0.5")
-        self.assertIn("Added 0.5L", result)
+        result = self.reminder.process_user_input("0.5", '100')
+        self.assertIn("Update: 0.5L added", result)
         self.assertIn("Total intake: 0.5L", result)
         self.assertIn("Remaining: 2.0L", result)
+        # The other chat gets it as a digest once the debounce window passes
+        self.assertEqual(self.api.messages_for('200'), [])
+        self.reminder.notifications.flush_soon(['200'])
+        self.reminder.run_scheduled()
+        self.assertEqual(self.api.messages_for('200'), [result])
 
     def test_process_user_input_invalid(self):
-        result = process_user_input("not a number")
+        result = self.reminder.process_user_input("not a number", '100')
         self.assertIn("Please enter a valid number", result)
+        result = self.reminder.process_user_input("-1", '100')
+        self.assertIn("Please enter a positive number", result)
 
     def test_process_user_input_clear_command(self):
-        with patch('water_reminder.clear_chat', return_value="Chat history cleared."):
-            result = process_user_input("/clear")
+        with patch.object(self.reminder, 'clear_chat', return_value="Chat history cleared.") as mock_clear:
+            result = self.reminder.process_user_input("/clear", '100')
             self.assertEqual(result, "Chat history cleared.")
+            mock_clear.assert_called_once_with('100')
 
     def test_process_user_input_reset_command(self):
-        global current_intake
-        current_intake = 1.5
-        result = process_user_input("/reset")
-        self.assertIn("Daily intake reset to 0L", result)
-        self.assertEqual(current_intake, 0)
-
-    def test_check_daily_reset_same_day(self):
-        global last_update_time
-        last_update_time = datetime.datetime.now()
-        self.assertFalse(check_daily_reset())
-
-    def test_check_daily_reset_next_day(self):
-        global last_update_time, current_intake
-        last_update_time = datetime.datetime.now() - datetime.timedelta(days=1)
-        current_intake = 1.5
-        self.assertTrue(check_daily_reset())
-        self.assertEqual(current_intake, 0)
-
-    @patch('water_reminder.requests.get')
-    def test_clear_chat(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"ok": True}
-        mock_get.return_value = mock_response
-
-        result = clear_chat()
-        self.assertEqual(result, "Chat history cleared.")
-        self.assertEqual(mock_get.call_count, 1000)
+        self.set_intake('100', 1.5)
+        result = self.reminder.process_user_input("/reset", '100')
+        self.assertIn("Daily intake has been reset to 0L", result)
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 0)
+
+    def test_process_user_input_goal_reached(self):
+        self.reminder.process_user_input("2", '100')
+        self.reminder.process_user_input("1", '100')
+        self.reminder.process_user_input("1", '100')
+        congratulations = [m for m in self.api.messages_for('100') if "Congratulations" in m]
+        self.assertEqual(len(congratulations), 1)
+        self.assertTrue(self.reminder.sessions.get_user_session('100').goal_reached_notified)
+
+    def test_rollover_day_same_day(self):
+        self.set_intake('100', 1.5, datetime.datetime.now())
+        self.assertEqual(self.reminder.rollover_day(), [])
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 1.5)
+
+    def test_rollover_day_next_day(self):
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        self.set_intake('100', 1.5, yesterday)
+        self.assertEqual(self.reminder.rollover_day(), ['100'])
+        self.assertEqual(self.reminder.sessions.get_user_session('100').current_intake, 0)
+
+    def test_clear_chat(self):
+        result = self.reminder.clear_chat('100')
+        self.assertEqual(result, "Chat cleared. What would you like to do next?")
+        self.assertEqual(len(self.api.messages_for('100')), 1)
 
     def test_reset_daily_intake(self):
-        global current_intake, last_update_time
-        current_intake = 1.5
-        last_update_time = datetime.datetime.now() - datetime.timedelta(hours=1)
-        
-        result = reset_daily_intake()
-        self.assertIn("Daily intake reset to 0L", result)
-        self.assertEqual(current_intake, 0)
-        self.assertIsNotNone(last_update_time)
-        self.assertGreater(last_update_time, datetime.datetime.now() - datetime.timedelta(seconds=1))
-
-    @patch('water_reminder.send_telegram_message')
-    @patch('water_reminder.get_telegram_updates')
-    @patch('water_reminder.time.sleep', return_value=None)
-    def test_water_reminder(self, mock_sleep, mock_get_updates, mock_send_message):
-        mock_get_updates.return_value = {
-            "ok": True,
-            "result": [
-                {"update_id": 1, "message": {"text": "0.5"}},
-                {"update_id": 2, "message": {"text": "not a number"}},
-                {"update_id": 3, "message": {"text": "/reset"}},
-                {"update_id": 4, "message": {"text": "/clear"}}
-            ]
-        }
-        
-        # Run the water_reminder function for a short time
-        def stop_loop():
-            water_reminder.stop = True
-        
-        import threading
-        timer = threading.Timer(0.1, stop_loop)
-        timer.start()
-        
-        water_reminder()
-        
-        # Check that messages were sent and updates were processed
-        self.assertTrue(mock_send_message.called)
-        self.assertTrue(mock_get_updates.called)
+        self.set_intake('100', 1.5, datetime.datetime.now() - datetime.timedelta(hours=1))
+
+        result = self.reminder.reset_daily_intake('100')
+        self.assertIn("Daily intake has been reset to 0L", result)
+        session = self.reminder.sessions.get_user_session('100')
+        self.assertEqual(session.current_intake, 0)
+        self.assertGreater(session.last_update_time, datetime.datetime.now() - datetime.timedelta(seconds=1))
+
+    def test_history_and_stats(self):
+        self.reminder.process_user_input("1.5", '100')
+        history = self.reminder.process_user_input("/history 3", '100')
+        self.assertEqual(len(history.splitlines()), 4)
+        self.assertTrue(history.endswith("1.5L"))
+        self.assertIn("Usage", self.reminder.process_user_input("/history lots", '100'))
+        stats = self.reminder.process_user_input("/stats", '100')
+        self.assertIn("Last 7 days: 1.5L total", stats)
+
+    def test_water_reminder(self):
+        self.reminder.max_poll_timeout = 1
+        for text in ("0.5", "not a number", "/reset", "/clear"):
+            self.api.push_update(100, text)
+
+        thread = threading.Thread(target=self.reminder.run)
+        thread.start()
+        try:
+            # Startup broadcast, 1 combined reply, /reset and /clear confirmations
+            self.assertTrue(self.api.wait_for_messages(5, timeout=10))
+        finally:
+            self.reminder.shutdown_flag = True
+            thread.join(timeout=10)
+
+        self.assertFalse(thread.is_alive())
+        # run() ends with shutdown(), which closes everything
+        self.reminder = None
+        replies = self.api.messages_for('100')
+        self.assertTrue(any("Update: 0.5L added" in m for m in replies))
+        self.assertTrue(any("Please enter a valid number" in m for m in replies))
+        self.assertTrue(any("shutting down" in m for m in self.api.messages_for('200')))
+        self.assertEqual(self.api.stats()['pending_updates'], 0)
+    def test_signal_handler_only_sets_the_flag(self):
+        with patch('water_reminder.signal.signal') as set_handler:
+            install_signal_handlers(self.reminder)
+        handler = set_handler.call_args_list[0].args[1]
+
+        # A flush thread holding the session lock must not block the handler
+        held, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with self.reminder.sessions.lock:
+                held.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        held.wait(5)
+        caller = threading.Thread(target=handler, args=(signal.SIGTERM, None))
+        caller.start()
+        caller.join(timeout=2)
+        returned = not caller.is_alive()
+        release.set()
+        holder.join()
+        caller.join()
+        self.assertTrue(returned)
+        self.assertTrue(self.reminder.shutdown_flag)
 
 if __name__ == '__main__':
     unittest.main()
-
-```
-
-These unit tests cover all the methods in our water reminder app. Here's a breakdown of what each test does:
-
-1. `test_send_telegram_message`: Ensures that the function calls the Telegram API correctly.
-
-2. `test_get_telegram_updates`: Verifies that the function retrieves updates from the Telegram API.
-
-3. `test_process_user_input_valid`: Checks if the function correctly processes a valid water intake input.
-
-4. `test_process_user_input_invalid`: Ensures the function handles invalid input appropriately.
-
-5. `test_process_user_input_clear_command`: Verifies that the "/clear" command is processed correctly.
-
-6. `test_process_user_input_reset_command`: Checks if the "/reset" command resets the daily intake.
-
-7. `test_check_daily_reset_same_day`: Ensures the daily reset doesn't occur on the same day.
-
-8. `test_check_daily_reset_next_day`: Verifies that the daily reset occurs correctly when a new day starts.
-
-9. `test_clear_chat`: Checks if the clear_chat function attempts to delete messages.
-
-10. `test_reset_daily_intake`: Ensures the reset_daily_intake function works correctly.
-
-11. `test_water_reminder`: A more complex test that simulates the main loop of the app, checking if it sends messages and processes updates correctly.
-
-To run these tests:
-
-1. Save this code in a file named `test_water_reminder.py` in the same directory as your `water_reminder.py` file.
-
-2. Run the tests using the following command:
-   ```
-   python -m unittest test_water_reminder.py
-   ```
-
-These tests use mocking to simulate external dependencies (like the Telegram API), allowing us to test our functions in isolation. The `setUp` method ensures that our global variables are reset before each test, preventing tests from interfering with each other.
-
-To make these tests work with your actual `water_reminder.py` file, you might need to make some small adjustments:
-
-1. Ensure that your main `water_reminder.py` file is structured in a way that allows importing individual functions.
-2. You may need to add a `water_reminder.stop = False` at the beginning of your `water_reminder()` function, and check this value in the main loop to allow stopping the function in the test.
-
-These tests provide rich examples of various scenarios, including valid and invalid inputs, command processing, daily resets, and the main app loop. They should help ensure that your water reminder app functions correctly across a wide range of use cases.
-
-Would you like me to explain any of these tests in more detail, or discuss how to integrate them more closely with your existing code?
\ No newline at end of file
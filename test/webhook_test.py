@@ -0,0 +1,79 @@
+import json
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from reminder_case import ReminderTestCase
+from webhook import WebhookServer
+
+
+def make_update(update_id, chat_id, text):
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": text}}
+
+
+class TestWebhookServer(ReminderTestCase):
+    CHAT_IDS = ['1', '2']
+
+    def setUp(self):
+        super().setUp()
+        self.server = WebhookServer(self.reminder, host='127.0.0.1', port=0, secret_token='s3cret',
+                                    workers=2).start()
+        host, port = self.server.address
+        self.url = f"http://{host}:{port}/webhook"
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    def post(self, update, secret='s3cret', path=None):
+        request = urllib.request.Request(
+            path or self.url, data=json.dumps(update).encode(), method='POST',
+            headers={'Content-Type': 'application/json', WebhookServer.SECRET_HEADER: secret}
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def wait_processed(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.server.stats()['processed'] < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.server.stats()['processed']
+
+    def test_update_is_processed_and_answered(self):
+        self.assertEqual(self.post(make_update(1, 1, '0.5')), 200)
+        self.assertEqual(self.wait_processed(1), 1)
+        self.assertTrue(self.api.wait_for_messages(1))
+        self.assertIn('Update: 0.5L added', self.api.messages_for('1')[0])
+        self.assertGreater(self.server.stats()['latency_p50'], 0)
+
+    def test_wrong_secret_is_rejected(self):
+        self.assertEqual(self.post(make_update(1, 1, '0.5'), secret='nope'), 403)
+        self.assertEqual(self.post(make_update(1, 1, '0.5'), path=self.url + 'x'), 404)
+        self.assertEqual(self.server.stats()['received'], 0)
+
+    def test_duplicate_deliveries_are_processed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.post(make_update(7, 1, '1')), 200)
+        self.wait_processed(1)
+        time.sleep(0.1)
+        self.assertEqual(self.server.stats()['duplicates'], 2)
+        self.assertEqual(self.reminder.sessions.get_user_session('1').current_intake, 1.0)
+
+    def test_per_chat_order_is_preserved(self):
+        update_id = 100
+        for amount in ('0.5', '0.25', '0.25', '/reset', '0.5'):
+            for chat_id in (1, 2):
+                self.post(make_update(update_id, chat_id, amount))
+                update_id += 1
+        self.assertEqual(self.wait_processed(10), 10)
+        self.assertEqual(self.reminder.sessions.get_user_session('1').current_intake, 0.5)
+        self.assertEqual(self.reminder.sessions.get_user_session('2').current_intake, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
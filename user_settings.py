@@ -0,0 +1,220 @@
+import datetime
+import math
+import re
+import threading
+import zoneinfo
+from typing import Optional
+
+from clock import SYSTEM_CLOCK
+
+QUIET_WINDOW_RE = re.compile(r'^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$')
+NO_QUIET_HOURS = (datetime.time(0, 0), datetime.time(0, 0))
+TIMEZONE_NAMES = {}
+
+
+def parse_quiet_window(text: str) -> tuple[datetime.time, datetime.time]:
+    # "22:30-07:00", or "off" for no quiet hours
+    if text.strip().lower() == 'off':
+        return NO_QUIET_HOURS
+    match = QUIET_WINDOW_RE.match(text.strip())
+    if match is None:
+        raise ValueError(f"Invalid quiet window: {text!r}")
+    start_hour, start_minute, end_hour, end_minute = (int(part) for part in match.groups())
+    return datetime.time(start_hour, start_minute), datetime.time(end_hour, end_minute)
+
+
+def parse_timezone(name: str) -> str:
+    # Case-insensitive IANA name, returned in its canonical spelling
+    if not TIMEZONE_NAMES:
+        TIMEZONE_NAMES.update((zone.lower(), zone) for zone in zoneinfo.available_timezones())
+    zone = TIMEZONE_NAMES.get(name.strip().lower())
+    if zone is None:
+        raise ValueError(f"Unknown timezone: {name!r}")
+    return zone
+
+
+def get_zone(name: Optional[str]) -> Optional[zoneinfo.ZoneInfo]:
+    # None means the Pi's local time
+    return zoneinfo.ZoneInfo(name) if name else None
+
+
+def next_local(local: datetime.datetime, at: datetime.time) -> float:
+    # Timestamp of the next wall-clock `at` strictly after `local`
+    candidate = datetime.datetime.combine(local.date(), at, tzinfo=local.tzinfo)
+    if candidate <= local:
+        candidate = datetime.datetime.combine(local.date() + datetime.timedelta(days=1), at, tzinfo=local.tzinfo)
+    return candidate.timestamp()
+
+
+def midnight_after(timezone: Optional[str], now: float) -> float:
+    return next_local(datetime.datetime.fromtimestamp(now, get_zone(timezone)), datetime.time(0, 0))
+
+
+class ChatSettings:
+    __slots__ = ('chat_id', 'timezone', 'zone', 'quiet_start', 'quiet_end')
+
+    def __init__(self, chat_id: Optional[str], timezone: Optional[str],
+                 quiet_start: datetime.time, quiet_end: datetime.time):
+        self.chat_id = chat_id
+        self.timezone = timezone
+        self.zone = get_zone(timezone)
+        self.quiet_start = quiet_start
+        self.quiet_end = quiet_end
+
+    @property
+    def has_quiet_hours(self) -> bool:
+        return self.quiet_start != self.quiet_end
+
+
+class Transitions:
+    # Next quiet start/end and midnight for one chat as timestamps. Nothing
+    # changes before valid_until, so until then a check is one comparison.
+    __slots__ = ('quiet', 'quiet_start', 'quiet_end', 'midnight', 'valid_until')
+
+    def __init__(self, settings: ChatSettings, now: float):
+        local = datetime.datetime.fromtimestamp(now, settings.zone)
+        self.midnight = next_local(local, datetime.time(0, 0))
+        if settings.has_quiet_hours:
+            self.quiet_start = next_local(local, settings.quiet_start)
+            self.quiet_end = next_local(local, settings.quiet_end)
+            # Inside the window the end comes before the next start
+            self.quiet = self.quiet_end < self.quiet_start
+        else:
+            self.quiet_start = self.quiet_end = math.inf
+            self.quiet = False
+        self.valid_until = min(self.quiet_start, self.quiet_end, self.midnight)
+
+
+class UserSettings:
+    # Per-chat timezone and quiet window, kept next to user_sessions (which
+    # holds the goal). Chats without a row use the Pi's local time and the
+    # default quiet window.
+    def __init__(self, db, quiet_start: datetime.time, quiet_end: datetime.time, clock=SYSTEM_CLOCK):
+        self.db = db
+        self.clock = clock
+        self.default_quiet_start = quiet_start
+        self.default_quiet_end = quiet_end
+        self.lock = threading.Lock()
+        self.settings = {}
+        self.transitions = {}
+        self.changed = None
+        self.init_table()
+
+    def init_table(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    chat_id TEXT PRIMARY KEY,
+                    timezone TEXT,
+                    quiet_start TEXT,
+                    quiet_end TEXT
+                ) WITHOUT ROWID
+            ''')
+
+    def make_settings(self, chat_id: Optional[str], timezone: Optional[str] = None,
+                      quiet_start: Optional[str] = None, quiet_end: Optional[str] = None) -> ChatSettings:
+        return ChatSettings(
+            chat_id,
+            timezone,
+            datetime.time.fromisoformat(quiet_start) if quiet_start else self.default_quiet_start,
+            datetime.time.fromisoformat(quiet_end) if quiet_end else self.default_quiet_end
+        )
+
+    def get(self, chat_id: Optional[str]) -> ChatSettings:
+        settings = self.settings.get(chat_id)
+        if settings is not None:
+            return settings
+        row = None
+        if chat_id is not None:
+            with self.db.lock:
+                row = self.db.conn.execute(
+                    'SELECT timezone, quiet_start, quiet_end FROM user_settings WHERE chat_id = ?', (chat_id,)
+                ).fetchone()
+        settings = self.make_settings(chat_id, *(row or ()))
+        with self.lock:
+            return self.settings.setdefault(chat_id, settings)
+
+    def load(self) -> int:
+        # Warm the cache for every chat that has settings in one query
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT chat_id, timezone, quiet_start, quiet_end FROM user_settings'
+            ).fetchall()
+        with self.lock:
+            for row in rows:
+                self.settings[row[0]] = self.make_settings(*row)
+        return len(rows)
+
+    def begin(self):
+        # Track the chats updated until commit() or rollback()
+        self.changed = set()
+
+    def commit(self):
+        self.changed = None
+
+    def rollback(self):
+        # Their rows were rolled back; reload them on next use
+        changed, self.changed = self.changed or set(), None
+        with self.lock:
+            for chat_id in changed:
+                self.settings.pop(chat_id, None)
+                self.transitions.pop(chat_id, None)
+
+    def update(self, chat_id: str, **changes) -> ChatSettings:
+        current = self.get(chat_id)
+        values = {
+            'timezone': current.timezone,
+            'quiet_start': current.quiet_start.strftime('%H:%M'),
+            'quiet_end': current.quiet_end.strftime('%H:%M'),
+        }
+        values.update(changes)
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute(
+                'INSERT OR REPLACE INTO user_settings (chat_id, timezone, quiet_start, quiet_end) '
+                'VALUES (?, ?, ?, ?)',
+                (chat_id, values['timezone'], values['quiet_start'], values['quiet_end'])
+            )
+        settings = self.make_settings(chat_id, **values)
+        with self.lock:
+            if self.changed is not None:
+                self.changed.add(chat_id)
+            self.settings[chat_id] = settings
+            self.transitions.pop(chat_id, None)
+        return settings
+
+    def set_timezone(self, chat_id: str, timezone: str) -> ChatSettings:
+        return self.update(chat_id, timezone=parse_timezone(timezone))
+
+    def set_quiet_hours(self, chat_id: str, start: datetime.time, end: datetime.time) -> ChatSettings:
+        return self.update(chat_id, quiet_start=start.strftime('%H:%M'), quiet_end=end.strftime('%H:%M'))
+
+    def timezones(self) -> list[str]:
+        with self.db.lock:
+            return [row[0] for row in self.db.conn.execute(
+                'SELECT DISTINCT timezone FROM user_settings WHERE timezone IS NOT NULL'
+            )]
+
+    def chat_filter_sql(self, timezone: Optional[str]) -> tuple[str, tuple]:
+        # SQL condition selecting the user_sessions rows of one timezone group
+        if timezone is None:
+            return 'chat_id NOT IN (SELECT chat_id FROM user_settings WHERE timezone IS NOT NULL)', ()
+        return 'chat_id IN (SELECT chat_id FROM user_settings WHERE timezone = ?)', (timezone,)
+
+    def get_transitions(self, chat_id: Optional[str], now: float) -> Transitions:
+        transitions = self.transitions.get(chat_id)
+        if transitions is None or now >= transitions.valid_until:
+            transitions = Transitions(self.get(chat_id), now)
+            self.transitions[chat_id] = transitions
+        return transitions
+
+    def is_quiet(self, chat_id: Optional[str], now: float) -> bool:
+        return self.get_transitions(chat_id, now).quiet
+
+    def quiet_end(self, chat_id: Optional[str], now: float) -> float:
+        return self.get_transitions(chat_id, now).quiet_end
+
+    def next_midnight(self, chat_id: Optional[str], now: float) -> float:
+        return self.get_transitions(chat_id, now).midnight
+
+    def localtime(self, chat_id: Optional[str], now: Optional[float] = None) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.clock.time() if now is None else now, self.get(chat_id).zone)
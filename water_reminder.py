@@ -1,3 +1,7 @@
+import asyncio
+import contextlib
+import math
+import sys
 import time
 import requests
 import datetime
@@ -5,8 +9,26 @@ import os
 import signal
 import logging
 import sqlite3
+import threading
 from dataclasses import dataclass
 from typing import Optional
+from zoneinfo import ZoneInfo
+
+from async_runner import AsyncRunner
+from clock import SYSTEM_CLOCK
+from command_router import CommandRouter, parse_amounts
+from intake_log import IntakeLog
+from log_pipeline import LogPipeline
+from metrics import MetricsRegistry, MetricsServer
+from notifications import NotificationAggregator
+from outbox import Outbox
+from rollover import DayRollover
+from scheduler import ReminderScheduler
+from session_cache import SessionCache
+from sharding import ShardedRunner
+from telegram_client import TelegramClient
+from user_settings import UserSettings, midnight_after, parse_quiet_window
+from webhook import WebhookServer
 
 # Telegram bot details
 bot_token = 'BOT_TOKEN'
@@ -14,16 +36,67 @@ bot_token = 'BOT_TOKEN'
 chat_ids = ['CHAT_ID', 'CHAT_ID']  # Add the secondary user's chat ID here
 
 # Configuration
+TELEGRAM_API_BASE = 'https://api.telegram.org'
 QUIET_HOURS_START = datetime.time(0, 0)  # 12:00 AM
 QUIET_HOURS_END = datetime.time(7, 30)    # 7:30 AM
 DEFAULT_DAILY_GOAL = 2.5  # Default daily goal in liters
-
-# Set up logging
-logging.basicConfig(
-    filename='water_reminder.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+REMINDER_INTERVAL = 3600  # Seconds between hourly reminders
+POLL_TIMEOUT = 30  # Longest getUpdates long-poll in seconds
+ROLLOVER_KEY = '*'  # Scheduler key for the shared day rollover
+HISTORY_MAX_DAYS = 90  # Longest range /history will show
+WEBHOOK_URL = ''  # Public HTTPS URL Telegram should POST updates to
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_SECRET = ''  # Checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = 4
+METRICS_HOST = '127.0.0.1'  # Prometheus text endpoint at http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_PORT = 9108  # Set to None to disable the endpoint
+ADMIN_CHAT_IDS = []  # Chats allowed to use /metrics
+TELEGRAM_SEND_WORKERS = 8  # Concurrent sendMessage calls for fan-outs
+OUTBOX_GLOBAL_RATE = 30  # Messages per second across all chats (Telegram limit)
+OUTBOX_PER_CHAT_RATE = 1  # Messages per second to a single chat
+OUTBOX_PER_CHAT_BURST = 3  # Messages a chat may receive back to back
+SQLITE_CACHED_STATEMENTS = 256  # Prepared statements kept per connection
+SESSION_CACHE_SIZE = 10000  # Sessions kept in memory before LRU eviction
+SESSION_FLUSH_INTERVAL = 5  # Seconds between write-behind flushes
+SESSION_FLUSH_THRESHOLD = 100  # Dirty sessions that force an early flush
+NOTIFY_DIGEST_WINDOW = 60  # Seconds of quiet before other chats get a digest of new entries
+NOTIFY_DIGEST_MAX_DELAY = 300  # Longest a digest waits while entries keep coming
+SHARE_UPDATES = True  # Send the other chats in chat_ids a digest of each entry
+LOG_FILE = 'water_reminder.log'  # JSON lines, written by a background thread
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate once the log reaches this size
+LOG_ROTATE_INTERVAL = 86400  # ...or this many seconds
+LOG_BACKUP_COUNT = 7  # Rotated logs kept
+LOG_COMPRESS = True  # Gzip rotated logs
+LOG_FLUSH_INTERVAL = 5  # Seconds between writes to the SD card
+LOG_QUEUE_SIZE = 10000  # Records buffered before new ones are dropped
+LOG_TO_CONSOLE = True  # Also echo log records to stdout
+SHARD_WORKERS = os.cpu_count() or 1  # Worker processes in --sharded mode
+
+# Logging is wired up by start_logging(); until then records are discarded
+logger = logging.getLogger('water_reminder')
+logger.addHandler(logging.NullHandler())
+
+class NestedConnection:
+    # Stands in for the connection inside WaterReminderDB.transaction(), so
+    # the usual `with db.conn:` blocks become savepoints of the outer
+    # transaction instead of committing it.
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def __enter__(self):
+        self.conn.execute('SAVEPOINT nested')
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.conn.execute('ROLLBACK TO nested')
+        self.conn.execute('RELEASE nested')
+        return False
 
 @dataclass
 class UserSession:
@@ -34,14 +107,43 @@ class UserSession:
     goal_reached_notified: bool
 
 class WaterReminderDB:
-    def __init__(self, db_name='water_reminder.db'):
+    SELECT_SESSION_SQL = 'SELECT * FROM user_sessions WHERE chat_id = ?'
+    SAVE_SESSION_SQL = '''
+        INSERT OR REPLACE INTO user_sessions
+        (chat_id, current_intake, daily_goal, last_update_time, goal_reached_notified)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+
+    def __init__(self, db_name='water_reminder.db', clock=SYSTEM_CLOCK):
         self.db_name = db_name
+        self.clock = clock
+        # One long-lived connection shared by every caller; the lock keeps it
+        # safe to use from worker threads as well as the main loop.
+        self.lock = threading.RLock()
+        self.conn = self.connect()
+        self.transaction_owner = None
         self.init_database()
 
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_name,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS
+        )
+        # WAL avoids rewriting the whole journal on every commit, and NORMAL
+        # only fsyncs at checkpoints, which is what keeps SD cards alive.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
     def init_database(self):
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        with self.lock, self.conn:
+            self.conn.execute('''
                 CREATE TABLE IF NOT EXISTS user_sessions (
                     chat_id TEXT PRIMARY KEY,
                     current_intake REAL,
@@ -50,29 +152,64 @@ class WaterReminderDB:
                     goal_reached_notified INTEGER
                 )
             ''')
-            conn.commit()
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                ) WITHOUT ROWID
+            ''')
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.transaction_owner == threading.get_ident()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Everything written inside commits or rolls back as one unit
+        with self.lock:
+            if self.in_transaction:
+                yield
+                return
+            conn = self.conn
+            conn.execute('BEGIN')
+            self.conn = NestedConnection(conn)
+            self.transaction_owner = threading.get_ident()
+            try:
+                yield
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self.conn = conn
+                self.transaction_owner = None
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM bot_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)', (key, str(value)))
 
     def get_user_session(self, chat_id: str) -> UserSession:
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT * FROM user_sessions WHERE chat_id = ?',
-                (chat_id,)
-            )
-            row = cursor.fetchone()
-            
+        with self.lock:
+            row = self.conn.execute(self.SELECT_SESSION_SQL, (chat_id,)).fetchone()
+
             if row is None:
                 # Create new session if doesn't exist
                 session = UserSession(
                     chat_id=chat_id,
                     current_intake=0.0,
                     daily_goal=DEFAULT_DAILY_GOAL,
-                    last_update_time=datetime.datetime.now(),
+                    last_update_time=self.clock.now(),
                     goal_reached_notified=False
                 )
                 self.save_user_session(session)
                 return session
-            
+
             return UserSession(
                 chat_id=row[0],
                 current_intake=row[1],
@@ -82,81 +219,178 @@ class WaterReminderDB:
             )
 
     def save_user_session(self, session: UserSession):
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_sessions 
-                (chat_id, current_intake, daily_goal, last_update_time, goal_reached_notified)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+        with self.lock, self.conn:
+            self.conn.execute(self.SAVE_SESSION_SQL, (
                 session.chat_id,
                 session.current_intake,
                 session.daily_goal,
                 session.last_update_time.isoformat(),
                 int(session.goal_reached_notified)
             ))
-            conn.commit()
+
+    def save_user_sessions(self, sessions: list[UserSession]):
+        with self.lock, self.conn:
+            self.conn.executemany(self.SAVE_SESSION_SQL, [(
+                session.chat_id,
+                session.current_intake,
+                session.daily_goal,
+                session.last_update_time.isoformat(),
+                int(session.goal_reached_notified)
+            ) for session in sessions])
 
     def reset_user_session(self, chat_id: str):
-        session = self.get_user_session(chat_id)
-        session.current_intake = 0
-        session.goal_reached_notified = False
-        session.last_update_time = datetime.datetime.now()
-        self.save_user_session(session)
-        return session
+        with self.lock:
+            session = self.get_user_session(chat_id)
+            session.current_intake = 0
+            session.goal_reached_notified = False
+            session.last_update_time = self.clock.now()
+            self.save_user_session(session)
+            return session
 
 class WaterReminder:
-    def __init__(self, bot_token: str, chat_ids: list[str]):
+    def __init__(self, bot_token: str, chat_ids: list[str], db_name: str = 'water_reminder.db',
+                 api_base: str = TELEGRAM_API_BASE, clock=None):
         self.bot_token = bot_token
         self.chat_ids = chat_ids
-        self.db = WaterReminderDB()
+        # Chats that see each other's entries; a shard only reminds its own
+        # chat_ids but shares with the whole household
+        self.household = chat_ids
+        self.share_updates = SHARE_UPDATES
+        # Everything reads the time from here, so a VirtualClock can replay
+        # days of activity without waiting for them
+        self.clock = clock or SYSTEM_CLOCK
+        self.api_base = api_base
+        self.max_poll_timeout = POLL_TIMEOUT
+        self.metrics = MetricsRegistry()
+        self.metrics_port = METRICS_PORT
+        self.metrics_server = None
+        self.admin_chat_ids = ADMIN_CHAT_IDS
+        self.telegram = TelegramClient(bot_token, api_base, max_workers=TELEGRAM_SEND_WORKERS,
+                                       metrics=self.metrics)
+        self.db = WaterReminderDB(db_name, self.clock)
+        self.metrics.instrument(
+            self.db,
+            ['get_user_session', 'save_user_session', 'save_user_sessions', 'reset_user_session'],
+            'db_operation_seconds'
+        )
+        self.sessions = SessionCache(
+            self.db,
+            max_size=SESSION_CACHE_SIZE,
+            flush_interval=SESSION_FLUSH_INTERVAL,
+            flush_threshold=SESSION_FLUSH_THRESHOLD
+        )
+        self.outbox = Outbox(
+            self.db,
+            self.telegram,
+            global_rate=OUTBOX_GLOBAL_RATE,
+            per_chat_rate=OUTBOX_PER_CHAT_RATE,
+            per_chat_burst=OUTBOX_PER_CHAT_BURST,
+            log=self.log_message,
+            clock=self.clock
+        )
+        self.scheduler = ReminderScheduler(self.db)
+        self.settings = UserSettings(self.db, QUIET_HOURS_START, QUIET_HOURS_END, self.clock)
+        self.rollover = DayRollover(self.db, self.sessions, self.settings)
+        self.intake_log = IntakeLog(self.db)
+        self.notifications = NotificationAggregator(
+            self.db,
+            self.scheduler,
+            window=NOTIFY_DIGEST_WINDOW,
+            max_delay=NOTIFY_DIGEST_MAX_DELAY,
+            clock=self.clock
+        )
+        self.router = CommandRouter(
+            self.sessions.get_user_session,
+            timer=lambda label: self.metrics.time('handler_seconds', command=label)
+        )
+        self.register_commands()
+        self.update_offset = 0
         self.shutdown_flag = False
+        self.register_metrics()
+
+    def register_commands(self):
+        router = self.router
+        router.register('/clear', lambda chat_id, args: self.clear_chat(chat_id))
+        router.register('/reset', lambda chat_id, args: self.reset_daily_intake(chat_id))
+        router.register('/start', lambda chat_id, args: self.get_welcome(chat_id))
+        router.register('/status', lambda chat_id, args: self.get_status(chat_id))
+        router.register('/history', lambda chat_id, args: self.get_history(chat_id, args))
+        router.register('/stats', lambda chat_id, args: self.get_stats(chat_id))
+        router.register('/metrics', lambda chat_id, args: self.get_metrics(chat_id))
+        router.register('/timezone', self.set_timezone)
+        router.register('/quiet', self.set_quiet_hours)
+        router.register('/goal', self.set_goal, needs_session=True)
+        router.register('/settings', self.get_settings, needs_session=True)
+        router.set_fallback(self.log_intake, needs_session=True)
+
+    def register_metrics(self):
+        metrics = self.metrics
+        metrics.describe('telegram_request_seconds', 'Bot API request latency by method')
+        metrics.describe('telegram_errors_total', 'Failed Bot API requests by method and error code')
+        metrics.describe('db_operation_seconds', 'WaterReminderDB call latency by method')
+        metrics.describe('handler_seconds', 'process_user_input latency by command')
+        metrics.describe('loop_iteration_seconds', 'Main loop iteration time, including the long poll')
+        metrics.gauge('outbox_depth', lambda: self.outbox.stats()['depth'])
+        metrics.gauge('session_cache_size', lambda: len(self.sessions.sessions))
+        metrics.gauge('session_cache_hit_rate', lambda: self.sessions.stats()['hit_rate'])
+        metrics.gauge('scheduled_events', lambda: len(self.scheduler))
+        metrics.gauge('notification_reduction_factor', lambda: self.notifications.stats()['reduction'])
 
     def log_message(self, message: str, level: str = 'info'):
-        print(f"{datetime.datetime.now()} - {message}")
         if level == 'info':
-            logging.info(message)
+            logger.info(message)
         elif level == 'warning':
-            logging.warning(message)
+            logger.warning(message)
         elif level == 'error':
-            logging.error(message)
+            logger.error(message)
+
+    # Without a chat id these use the Pi's local time and the default quiet window
+    def is_quiet_hours(self, chat_id: Optional[str] = None) -> bool:
+        return self.settings.is_quiet(chat_id, self.clock.time())
+
+    def quiet_hours_end(self, chat_id: Optional[str] = None) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.settings.quiet_end(chat_id, self.clock.time()))
 
-    def is_quiet_hours(self) -> bool:
-        current_time = datetime.datetime.now().time()
-        if QUIET_HOURS_START <= QUIET_HOURS_END:
-            return QUIET_HOURS_START <= current_time <= QUIET_HOURS_END
-        return current_time >= QUIET_HOURS_START or current_time <= QUIET_HOURS_END
+    def next_midnight(self, chat_id: Optional[str] = None) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.settings.next_midnight(chat_id, self.clock.time()))
 
     def should_send_reminder(self, session: UserSession) -> bool:
         if session.current_intake >= session.daily_goal:
             return False
-        return not self.is_quiet_hours()
-
-    def send_telegram_message(self, message: str, specific_chat_id: Optional[str] = None, 
-                            respect_quiet_hours: bool = True) -> list:
-        if respect_quiet_hours and self.is_quiet_hours():
-            self.log_message("Message delayed due to quiet hours: " + message)
+        return not self.is_quiet_hours(session.chat_id)
+
+    def send_telegram_message(self, message: str, specific_chat_id: Optional[str] = None,
+                            respect_quiet_hours: bool = True,
+                            recipients: Optional[list[str]] = None) -> list:
+        if recipients is None:
+            recipients = [specific_chat_id] if specific_chat_id else self.chat_ids
+
+        if respect_quiet_hours:
+            # Chats in their quiet hours get the message when their window ends
+            deferred = {}
+            for chat_id in recipients:
+                if self.is_quiet_hours(chat_id):
+                    deferred.setdefault(self.quiet_hours_end(chat_id), []).append(chat_id)
+            for resume_at, chat_ids in deferred.items():
+                self.outbox.enqueue(chat_ids, message, not_before=resume_at.timestamp())
+                self.log_message(f"Message deferred until {resume_at:%H:%M} for {len(chat_ids)} chats "
+                                 "due to quiet hours: " + message)
+            if deferred:
+                quiet = {chat_id for chat_ids in deferred.values() for chat_id in chat_ids}
+                recipients = [chat_id for chat_id in recipients if chat_id not in quiet]
+                if not recipients:
+                    return []
+
+        # Queue first so nothing is lost, then try to deliver right away; any
+        # message held back by rate limits or errors goes out from the
+        # dispatcher thread later. Inside a transaction the rows only exist
+        # once it commits, so delivery waits until then.
+        message_ids = self.outbox.enqueue(recipients, message)
+        if self.db.in_transaction:
             return []
-
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        recipients = [specific_chat_id] if specific_chat_id else self.chat_ids
-        
-        responses = []
-        for chat_id in recipients:
-            params = {
-                "chat_id": chat_id,
-                "text": message,
-                "parse_mode": "Markdown"
-            }
-            try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                self.log_message(f"Sent message to {chat_id}: {message}")
-                responses.append(response.json())
-            except requests.RequestException as e:
-                self.log_message(f"Error sending message to {chat_id}: {e}", 'error')
-        
-        return responses
+        results = self.outbox.dispatch()
+        return [results[message_id] for message_id in message_ids
+                if message_id in results and not isinstance(results[message_id], Exception)]
 
     def check_and_notify_goal_reached(self, session: UserSession) -> bool:
         if session.current_intake >= session.daily_goal and not session.goal_reached_notified:
@@ -167,69 +401,75 @@ class WaterReminder:
             )
             self.send_telegram_message(congratulations_message, session.chat_id, respect_quiet_hours=False)
             session.goal_reached_notified = True
-            self.db.save_user_session(session)
+            self.sessions.save_user_session(session)
             return True
         return False
 
     def process_user_input(self, text: str, from_chat_id: str) -> str:
-        session = self.db.get_user_session(from_chat_id)
-        
-        if text.lower() == "/clear":
-            return self.clear_chat(from_chat_id)
-        elif text.lower() == "/reset":
-            return self.reset_daily_intake(from_chat_id)
-        elif text.lower() == "/start":
-            return ("Welcome to the Water Reminder bot! You'll receive notifications about water intake "
-                    f"(except during quiet hours: {QUIET_HOURS_START.strftime('%I:%M %p')} - "
-                    f"{QUIET_HOURS_END.strftime('%I:%M %p')} and after reaching your daily goal). "
-                    "Use numbers to log water intake in liters, /clear to clear chat, "
-                    "or /reset to reset daily intake.")
-        elif text.lower() == "/status":
-            return self.get_status(from_chat_id)
-        
+        return self.router.handle(text, from_chat_id)
+
+    def get_welcome(self, chat_id: Optional[str] = None) -> str:
+        settings = self.settings.get(chat_id)
+        return ("Welcome to the Water Reminder bot! You'll receive notifications about water intake "
+                f"(except during quiet hours: {settings.quiet_start.strftime('%I:%M %p')} - "
+                f"{settings.quiet_end.strftime('%I:%M %p')} and after reaching your daily goal). "
+                "Log water intake in liters (0.5) or with units (500ml, 2 cups, 8oz, or several "
+                "at once: 0.5 + 250ml), /clear to clear chat, "
+                "/reset to reset daily intake, /history to see recent days "
+                "or /stats for averages and streaks. "
+                "Use /timezone, /quiet and /goal to change your settings.")
+
+    def log_intake(self, from_chat_id: str, text: str, session: UserSession) -> str:
         try:
-            amount = float(text)
-            if amount < 0:
-                return "Please enter a positive number for your water intake."
-            
-            session.current_intake += amount
-            session.last_update_time = datetime.datetime.now()
-            remaining = max(0, session.daily_goal - session.current_intake)
-            
-            self.log_message(
-                f"User {from_chat_id} processed input: {amount}L. "
-                f"Total: {session.current_intake:.1f}L. Remaining: {remaining:.1f}L"
-            )
-            
-            # Save updated session
-            self.db.save_user_session(session)
-            
-            # Prepare the update message
-            update_message = f"Update: {amount}L added. Total intake: {session.current_intake:.1f}L"
-            if remaining > 0:
-                update_message += f". Remaining: {remaining:.1f}L"
-            else:
-                update_message += f". Exceeded goal by: {-remaining:.1f}L"
-            
-            # Notify other users about the update
-            for chat_id in self.chat_ids:
-                if chat_id != from_chat_id:
-                    self.send_telegram_message(update_message, chat_id, respect_quiet_hours=False)
-            
-            # Check if goal has been reached
-            self.check_and_notify_goal_reached(session)
-            
-            return update_message
-            
+            amounts = parse_amounts(text)
         except ValueError:
             self.log_message(f"Invalid input received: {text}", 'warning')
-            return ("Please enter a valid number for your water intake in liters, or use:\n"
+            return ("Please enter a valid number for your water intake in liters "
+                    "(or with units: 500ml, 2 cups, 8oz), or use:\n"
                     "/clear - clear chat\n"
                     "/reset - reset daily intake\n"
-                    "/status - check current status")
+                    "/status - check current status\n"
+                    "/history [days] - daily totals\n"
+                    "/stats - averages and streaks")
+        if any(amount < 0 for amount in amounts):
+            return "Please enter a positive number for your water intake."
+
+        amount = round(sum(amounts), 3)
+        session.current_intake += amount
+        session.last_update_time = self.clock.now()
+        remaining = max(0, session.daily_goal - session.current_intake)
+
+        self.log_message(
+            f"User {from_chat_id} processed input: {amount}L. "
+            f"Total: {session.current_intake:.1f}L. Remaining: {remaining:.1f}L"
+        )
+
+        # Save updated session and log each entry on the chat's own calendar
+        self.sessions.save_user_session(session)
+        local_time = self.settings.localtime(from_chat_id, session.last_update_time.timestamp())
+        for entry in amounts:
+            self.intake_log.record(from_chat_id, entry, local_time, session.daily_goal)
+
+        # Prepare the update message
+        update_message = f"Update: {amount}L added. Total intake: {session.current_intake:.1f}L"
+        if remaining > 0:
+            update_message += f". Remaining: {remaining:.1f}L"
+        else:
+            update_message += f". Exceeded goal by: {-remaining:.1f}L"
+
+        # Other users get a digest of the update once the chat goes quiet
+        others = [chat_id for chat_id in self.household if chat_id != from_chat_id] if self.share_updates else []
+        if others:
+            self.notifications.add(others, from_chat_id, amount, session.current_intake, session.daily_goal)
+
+        # Check if goal has been reached; that news doesn't wait for the digest
+        if self.check_and_notify_goal_reached(session):
+            self.notifications.flush_soon(others)
+
+        return update_message
 
     def get_status(self, chat_id: str) -> str:
-        session = self.db.get_user_session(chat_id)
+        session = self.sessions.get_user_session(chat_id)
         remaining = max(0, session.daily_goal - session.current_intake)
         if session.current_intake >= session.daily_goal:
             return (f"🎉 Goal reached! Current intake: {session.current_intake:.1f}L\n"
@@ -238,14 +478,103 @@ class WaterReminder:
             return (f"Current intake: {session.current_intake:.1f}L\n"
                     f"Remaining to goal: {remaining:.1f}L")
 
-    def check_daily_reset(self, chat_id: str) -> bool:
-        session = self.db.get_user_session(chat_id)
-        now = datetime.datetime.now()
-        if now.date() > session.last_update_time.date():
-            session = self.db.reset_user_session(chat_id)
-            self.log_message(f"Daily reset performed for user {chat_id}")
-            return True
-        return False
+    def get_history(self, chat_id: str, args: str = "") -> str:
+        days = 7
+        if args:
+            if not args.isdigit() or not 1 <= int(args) <= HISTORY_MAX_DAYS:
+                return f"Usage: /history [days], with days between 1 and {HISTORY_MAX_DAYS}."
+            days = int(args)
+
+        today = self.settings.localtime(chat_id).date()
+        totals = {day: (total, goal) for day, total, goal in self.intake_log.daily_totals(chat_id, today, days)}
+        lines = [f"💧 Last {days} days:"]
+        for offset in range(days - 1, -1, -1):
+            day = today - datetime.timedelta(days=offset)
+            total, goal = totals.get(day.isoformat(), (0.0, None))
+            mark = " ✅" if goal is not None and total >= goal else ""
+            lines.append(f"{day.strftime('%a %d %b')}: {total:.1f}L{mark}")
+        return "\n".join(lines)
+
+    def get_stats(self, chat_id: str) -> str:
+        today = self.settings.localtime(chat_id).date()
+        lines = ["📊 Your hydration stats"]
+        for days in (7, 30):
+            summary = self.intake_log.summary(chat_id, today, days)
+            lines.append(
+                f"Last {days} days: {summary['total']:.1f}L total, {summary['average']:.1f}L/day average, "
+                f"goal met {summary['goal_days']}/{days} days"
+            )
+        current, best = self.intake_log.streak(chat_id, today)
+        lines.append(f"Current streak: {current} days (best: {best})")
+        return "\n".join(lines)
+
+    def get_metrics(self, chat_id: str) -> str:
+        if chat_id not in self.admin_chat_ids:
+            return "Sorry, /metrics is only available to admins."
+        lines = self.metrics.summary()
+        return "\n".join(["📈 Metrics"] + (lines or ["No data yet."]))
+
+    def get_settings(self, chat_id: str, args: str, session: UserSession) -> str:
+        settings = self.settings.get(chat_id)
+        if settings.has_quiet_hours:
+            quiet = f"{settings.quiet_start:%H:%M} - {settings.quiet_end:%H:%M}"
+        else:
+            quiet = "off"
+        return (f"⚙️ Your settings\n"
+                f"Timezone: {settings.timezone or 'bot default'} "
+                f"(your time: {self.settings.localtime(chat_id):%H:%M})\n"
+                f"Quiet hours: {quiet}\n"
+                f"Daily goal: {session.daily_goal}L")
+
+    def set_timezone(self, chat_id: str, args: str) -> str:
+        if not args:
+            return "Usage: /timezone Area/City, e.g. /timezone Europe/Athens"
+        try:
+            settings = self.settings.set_timezone(chat_id, args)
+        except ValueError:
+            return f"Unknown timezone {args!r}. Use a name like Europe/Athens or America/New_York."
+        # Make sure this timezone gets its own midnight reset
+        key = ROLLOVER_KEY + settings.timezone
+        if self.scheduler.get(key, 'rollover') is None:
+            self.scheduler.schedule(key, 'rollover', midnight_after(settings.timezone, self.clock.time()))
+        self.log_message(f"Timezone for user {chat_id} set to {settings.timezone}")
+        return f"Timezone set to {settings.timezone}. Your time is {self.settings.localtime(chat_id):%H:%M}."
+
+    def set_quiet_hours(self, chat_id: str, args: str) -> str:
+        try:
+            start, end = parse_quiet_window(args)
+        except ValueError:
+            return "Usage: /quiet HH:MM-HH:MM (e.g. /quiet 22:30-07:00) or /quiet off"
+        self.settings.set_quiet_hours(chat_id, start, end)
+        self.log_message(f"Quiet hours for user {chat_id} set to {args}")
+        if start == end:
+            return "Quiet hours turned off."
+        return f"Quiet hours set to {start:%H:%M} - {end:%H:%M}."
+
+    def set_goal(self, chat_id: str, args: str, session: UserSession) -> str:
+        try:
+            amounts = parse_amounts(args)
+        except ValueError:
+            amounts = []
+        if len(amounts) != 1 or not 0 < amounts[0] <= 20:
+            return "Usage: /goal amount, e.g. /goal 2.5 or /goal 2000ml"
+        session.daily_goal = round(amounts[0], 3)
+        # Raising the goal past today's intake brings the reminders back
+        if session.current_intake < session.daily_goal and session.goal_reached_notified:
+            session.goal_reached_notified = False
+            self.resume_reminders(chat_id)
+        self.sessions.save_user_session(session)
+        self.log_message(f"Daily goal for user {chat_id} set to {session.daily_goal}L")
+        self.check_and_notify_goal_reached(session)
+        return f"Daily goal set to {session.daily_goal}L."
+
+    def resume_reminders(self, chat_id: str):
+        if chat_id in self.chat_ids:
+            # Reminders may have been parked until midnight after the goal was reached
+            next_reminder = self.clock.time() + REMINDER_INTERVAL
+            scheduled = self.scheduler.get(chat_id, 'reminder')
+            if scheduled is None or scheduled > next_reminder:
+                self.scheduler.schedule(chat_id, 'reminder', next_reminder)
 
     def clear_chat(self, chat_id: str) -> str:
         self.log_message(f"Chat cleared for user {chat_id}")
@@ -257,17 +586,246 @@ class WaterReminder:
         return "Chat cleared. What would you like to do next?"
 
     def reset_daily_intake(self, chat_id: str) -> str:
-        session = self.db.reset_user_session(chat_id)
+        session = self.sessions.reset_user_session(chat_id)
+        self.resume_reminders(chat_id)
         self.log_message(f"Daily intake reset for user {chat_id}")
         message = f"Daily intake has been reset to 0L. Your goal is still {session.daily_goal}L."
         self.send_telegram_message(message, chat_id, respect_quiet_hours=False)
         return message
 
-    def run(self):
-        update_offset = 0
-        last_reminder_times = {chat_id: datetime.datetime.now() for chat_id in self.chat_ids}
-        last_processed_update_id = 0
+    def get_updates(self, offset: int, timeout: int = 30) -> list:
+        return self.telegram.get_updates(offset, timeout)
+
+    def process_update(self, update: dict) -> Optional[tuple[str, str]]:
+        message = update.get("message", {})
+        if "text" not in message:
+            return None
+        from_chat_id = str(message["chat"]["id"])
+        self.log_message(f"Received message from {from_chat_id}: {message['text']}")
+        return from_chat_id, self.process_user_input(message["text"], from_chat_id)
+
+    def schedule_chats(self):
+        now = self.clock.time()
+        for chat_id in self.chat_ids:
+            if self.scheduler.get(chat_id, 'reminder') is None:
+                self.scheduler.schedule(chat_id, 'reminder', now + REMINDER_INTERVAL)
+        # One rollover per timezone in use; '*' alone is the Pi's local time.
+        # Due right away so a reset missed while we were down still happens.
+        for timezone in [''] + self.settings.timezones():
+            if self.scheduler.get(ROLLOVER_KEY + timezone, 'rollover') is None:
+                self.scheduler.schedule(ROLLOVER_KEY + timezone, 'rollover', now)
+        self.scheduler.save()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Session, intake, outbox and schedule writes made inside commit
+        # together. Locks are taken in the same order the subsystems use
+        # (cache and scheduler before the database). On rollback the
+        # subsystems also put back what they keep in memory.
+        with self.sessions.lock, self.scheduler.lock:
+            if self.db.in_transaction:
+                yield
+                return
+            self.sessions.flush()
+            journaled = (self.sessions, self.scheduler, self.settings)
+            for subsystem in journaled:
+                subsystem.begin()
+            try:
+                with self.db.transaction():
+                    yield
+                    self.sessions.flush()
+                    self.scheduler.save()
+            except BaseException:
+                for subsystem in journaled:
+                    subsystem.rollback()
+                raise
+            for subsystem in journaled:
+                subsystem.commit()
+
+    def apply_update(self, update: dict) -> int:
+        # Applies one update exactly once: its writes and the new offset are
+        # checkpointed in one transaction, so after a crash it is either done
+        # or fetched again. Returns the offset to poll from next.
+        update_id = update["update_id"]
+        if update_id < self.update_offset:
+            return self.update_offset
+        with self.transaction():
+            reply = self.process_update(update)
+            if reply is not None:
+                self.send_telegram_message(reply[1], reply[0], respect_quiet_hours=False)
+            self.db.set_state('update_offset', update_id + 1)
+        self.update_offset = update_id + 1
+        self.outbox.dispatch()
+        return self.update_offset
+
+    def apply_updates(self, updates: list) -> int:
+        # Applies a whole getUpdates page in one transaction: updates are
+        # grouped by chat, a chat's consecutive intake entries are merged
+        # into one, and each chat gets a single combined reply. Returns the
+        # offset to poll from next. Database errors are raised, and the
+        # caller retries from the checkpoint; an update whose handling fails
+        # for any other reason is skipped so it can't hold up the rest.
+        updates = [update for update in updates if update["update_id"] >= self.update_offset]
+        if len(updates) > 1:
+            offset = max(update["update_id"] for update in updates) + 1
+            try:
+                with self.transaction():
+                    for chat_id, texts in self.group_updates(updates).items():
+                        replies = [self.process_user_input(text, chat_id) for text in self.merge_intake(texts)]
+                        replies = [reply for reply in replies if reply]
+                        if replies:
+                            self.send_telegram_message("\n\n".join(replies), chat_id, respect_quiet_hours=False)
+                    self.db.set_state('update_offset', offset)
+            except sqlite3.Error:
+                raise
+            except Exception as e:
+                # Find the update that fails instead of retrying the page forever
+                self.log_message(f"Batch of {len(updates)} updates failed, applying them one by one: {e}", 'error')
+            else:
+                self.update_offset = offset
+                self.outbox.dispatch()
+                return offset
+
+        for update in updates:
+            try:
+                self.apply_update(update)
+            except sqlite3.Error:
+                raise
+            except Exception as e:
+                self.skip_update(update, e)
+        return self.update_offset
+
+    def skip_update(self, update: dict, error: Exception):
+        # Checkpoints past an update that can't be applied, so it isn't
+        # fetched and retried forever
+        update_id = update["update_id"]
+        text = update.get("message", {}).get("text")
+        self.log_message(f"Skipping update {update_id} ({text!r}) that failed: {error}", 'error')
+        self.db.set_state('update_offset', update_id + 1)
+        self.update_offset = update_id + 1
+
+    def group_updates(self, updates: list) -> dict[str, list[str]]:
+        chats = {}
+        for update in updates:
+            message = update.get("message", {})
+            if "text" not in message:
+                continue
+            from_chat_id = str(message["chat"]["id"])
+            self.log_message(f"Received message from {from_chat_id}: {message['text']}")
+            chats.setdefault(from_chat_id, []).append(message["text"])
+        return chats
+
+    def merge_intake(self, texts: list[str]) -> list[str]:
+        # "0.5", "250ml" -> "0.5 250ml": one session update, fan-out and reply
+        merged, run = [], []
+        for text in texts:
+            if not text.lstrip().startswith('/'):
+                try:
+                    if all(amount >= 0 for amount in parse_amounts(text)):
+                        run.append(text.strip())
+                        continue
+                except ValueError:
+                    pass
+            if run:
+                merged.append(' '.join(run))
+                run = []
+            merged.append(text)
+        if run:
+            merged.append(' '.join(run))
+        return merged
+
+    def run_scheduled(self) -> int:
+        if self.seconds_until_next_due() != 0:
+            return 0
+        # Popped inside the transaction, so events that fail are due again
+        with self.transaction():
+            events = self.scheduler.pop_due(self.clock.time())
+            # The rollover goes first so a reminder due at midnight sees the new day
+            events.sort(key=lambda event: event[1] != 'rollover')
+            for chat_id, kind, due in events:
+                if kind == 'rollover':
+                    timezone = chat_id[len(ROLLOVER_KEY):] or None
+                    self.rollover_day(timezone)
+                    if timezone is None or timezone in self.settings.timezones():
+                        self.scheduler.schedule(chat_id, 'rollover', midnight_after(timezone, self.clock.time()))
+                elif kind == 'reminder':
+                    self.send_reminder(chat_id)
+                elif kind == 'digest':
+                    digest = self.notifications.flush(chat_id)
+                    if digest is not None:
+                        self.send_telegram_message(digest, chat_id, respect_quiet_hours=False)
+        if not events:
+            return 0
+        self.outbox.dispatch()
+        return len(events)
+
+    def rollover_day(self, timezone: Optional[str] = None) -> list[str]:
+        now = self.clock.now()
+        today = now.astimezone(ZoneInfo(timezone)).date() if timezone else now.date()
+        reset = self.rollover.run(today, now, timezone)
+        if not reset:
+            return []
+        self.log_message(f"Daily reset performed for {len(reset)} users")
+        reset_ids = set(reset)
+        recipients = [chat_id for chat_id in self.chat_ids if chat_id in reset_ids]
+        if recipients:
+            self.send_telegram_message(
+                "New day started! Your water intake has been reset to 0L.",
+                respect_quiet_hours=False,
+                recipients=recipients
+            )
+        return reset
 
+    def send_reminder(self, chat_id: str):
+        session = self.sessions.get_user_session(chat_id)
+        if session.current_intake >= session.daily_goal:
+            # Nothing to remind about until the next daily reset
+            self.scheduler.schedule(chat_id, 'reminder', self.settings.next_midnight(chat_id, self.clock.time()))
+        elif self.is_quiet_hours(chat_id):
+            self.scheduler.schedule(chat_id, 'reminder', self.settings.quiet_end(chat_id, self.clock.time()))
+        else:
+            remaining = max(0, session.daily_goal - session.current_intake)
+            message = (f"Reminder: You still need to drink {remaining:.1f}L of water today. "
+                       "How much have you had since last update?")
+            self.send_telegram_message(message, chat_id)
+            self.scheduler.schedule(chat_id, 'reminder', self.clock.time() + REMINDER_INTERVAL)
+            self.log_message(f"Sent hourly reminder to user {chat_id}")
+
+    def seconds_until_next_due(self) -> Optional[float]:
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            return None
+        return max(0.0, next_due - self.clock.time())
+
+    def poll_timeout(self) -> int:
+        # Long-poll until the next scheduled deadline, never longer than max_poll_timeout
+        delay = self.seconds_until_next_due()
+        if delay is None:
+            return self.max_poll_timeout
+        return min(self.max_poll_timeout, math.ceil(delay))
+
+    def start_metrics_server(self):
+        if self.metrics_port is None:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, METRICS_HOST, self.metrics_port).start()
+            self.log_message(f"Metrics available at http://{METRICS_HOST}:{self.metrics_port}/metrics")
+        except OSError as e:
+            self.log_message(f"Could not start metrics endpoint: {e}", 'error')
+
+    def startup(self):
+        self.start_metrics_server()
+        self.sessions.start()
+        self.outbox.start()
+        self.scheduler.load()
+        self.schedule_chats()
+        offset = self.db.get_state('update_offset')
+        if offset is not None:
+            # Warm restart: carry on from the checkpoint without greeting everyone again
+            self.update_offset = int(offset)
+            self.log_message(f"Water reminder restarted, resuming from update {self.update_offset}")
+            return
+        self.db.set_state('update_offset', self.update_offset)
         self.log_message("Water reminder started")
         self.send_telegram_message(
             "Water reminder app started. What's your current water intake in liters? "
@@ -275,73 +833,135 @@ class WaterReminder:
             respect_quiet_hours=False
         )
 
+    def shutdown(self):
+        self.log_message("Water reminder shutting down")
+        self.send_telegram_message("Water reminder app is shutting down. Goodbye!", respect_quiet_hours=False)
+        self.scheduler.save()
+        self.outbox.stop()
+        self.sessions.stop()
+        self.log_message(f"Session cache stats: {self.sessions.stats()}")
+        self.log_message(f"Outbox stats: {self.outbox.stats()}")
+        self.log_message(f"Notification stats: {self.notifications.stats()}")
+        self.telegram.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.db.close()
+
+    def run(self):
+        self.startup()
+
         while not self.shutdown_flag:
+            iteration_started = time.perf_counter()
             try:
-                # Check daily reset for all users
-                for chat_id in self.chat_ids:
-                    if self.check_daily_reset(chat_id):
-                        self.send_telegram_message(
-                            "New day started! Your water intake has been reset to 0L.",
-                            chat_id,
-                            respect_quiet_hours=False
-                        )
-
-                # Send reminders if needed
-                now = datetime.datetime.now()
-                for chat_id in self.chat_ids:
-                    session = self.db.get_user_session(chat_id)
-                    if ((now - last_reminder_times[chat_id]).total_seconds() >= 3600 and 
-                            self.should_send_reminder(session)):
-                        remaining = max(0, session.daily_goal - session.current_intake)
-                        message = (f"Reminder: You still need to drink {remaining:.1f}L of water today. "
-                                 "How much have you had since last update?")
-                        self.send_telegram_message(message, chat_id)
-                        last_reminder_times[chat_id] = now
-                        self.log_message(f"Sent hourly reminder to user {chat_id}")
-
-                # Process updates
-                url = f"https://api.telegram.org/bot{self.bot_token}/getUpdates"
-                params = {"offset": update_offset, "timeout": 30}
+                # Send reminders and daily resets that are due
+                self.run_scheduled()
+
+                # Process updates, long-polling no later than the next deadline
                 try:
-                    response = requests.get(url, params=params)
-                    response.raise_for_status()
-                    updates = response.json()
-                    
-                    for update in updates.get("result", []):
-                        update_id = update["update_id"]
-                        if update_id > last_processed_update_id:
-                            message = update.get("message", {})
-                            if "text" in message:
-                                from_chat_id = str(message["chat"]["id"])
-                                self.log_message(f"Received message from {from_chat_id}: {message['text']}")
-                                response = self.process_user_input(message["text"], from_chat_id)
-                                self.send_telegram_message(response, from_chat_id, respect_quiet_hours=False)
-                            last_processed_update_id = update_id
-                        update_offset = update_id + 1
+                    self.apply_updates(self.get_updates(self.update_offset, self.poll_timeout()))
 
                 except requests.RequestException as e:
                     self.log_message(f"Error getting updates: {e}", 'error')
+                    self.clock.sleep(10)  # Back off before polling again
 
-                time.sleep(10)  # Check for updates every 10 seconds
-                
             except Exception as e:
                 self.log_message(f"Error in main loop: {e}", 'error')
-                time.sleep(60)  # Wait a minute before retrying if there's an error
-
-        self.log_message("Water reminder shutting down")
-        self.send_telegram_message("Water reminder app is shutting down. Goodbye!", respect_quiet_hours=False)
-
-def main():
-    reminder = WaterReminder(bot_token, chat_ids)
-    
+                self.clock.sleep(60)  # Wait a minute before retrying if there's an error
+            self.metrics.observe('loop_iteration_seconds', time.perf_counter() - iteration_started)
+
+        self.shutdown()
+
+def start_logging() -> LogPipeline:
+    return LogPipeline(
+        LOG_FILE,
+        max_queue=LOG_QUEUE_SIZE,
+        max_bytes=LOG_MAX_BYTES,
+        rotate_interval=LOG_ROTATE_INTERVAL,
+        backup_count=LOG_BACKUP_COUNT,
+        compress=LOG_COMPRESS,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        console=LOG_TO_CONSOLE
+    ).start()
+
+def install_signal_handlers(reminder: WaterReminder, log_pipeline: Optional[LogPipeline] = None):
     def signal_handler(signum, frame):
         reminder.shutdown_flag = True
         reminder.log_message("Shutdown signal received", 'warning')
+        # Sessions are flushed by shutdown() once the loop unwinds; flushing
+        # here could wait on a lock the interrupted code is holding. Log
+        # records are pushed out now in case we get killed before that.
+        if log_pipeline is not None:
+            log_pipeline.flush(timeout=2)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
-    reminder.run()
+
+def main():
+    log_pipeline = start_logging()
+    try:
+        reminder = WaterReminder(bot_token, chat_ids)
+        install_signal_handlers(reminder, log_pipeline)
+        reminder.run()
+    finally:
+        log_pipeline.stop()
+
+def main_async():
+    log_pipeline = start_logging()
+    try:
+        reminder = WaterReminder(bot_token, chat_ids)
+        install_signal_handlers(reminder, log_pipeline)
+        asyncio.run(AsyncRunner(reminder).run())
+    finally:
+        log_pipeline.stop()
+
+def main_webhook():
+    log_pipeline = start_logging()
+    try:
+        reminder = WaterReminder(bot_token, chat_ids)
+        install_signal_handlers(reminder, log_pipeline)
+        server = WebhookServer(
+            reminder,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            workers=WEBHOOK_WORKERS
+        )
+        server.run(WEBHOOK_URL or None)
+    finally:
+        log_pipeline.stop()
+
+def main_sharded():
+    log_pipeline = start_logging()
+    try:
+        runner = ShardedRunner(
+            bot_token,
+            chat_ids,
+            SHARD_WORKERS,
+            api_base=TELEGRAM_API_BASE,
+            poll_timeout=POLL_TIMEOUT,
+            outbox_rate=OUTBOX_GLOBAL_RATE,
+            log_handler=log_pipeline.handler
+        )
+
+        def signal_handler(signum, frame):
+            # Workers ignore signals; the runner stops them once polling ends
+            runner.shutdown_flag = True
+            logger.warning("Shutdown signal received")
+            log_pipeline.flush(timeout=2)
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        runner.run()
+    finally:
+        log_pipeline.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--async' in sys.argv[1:]:
+        main_async()
+    elif '--webhook' in sys.argv[1:]:
+        main_webhook()
+    elif '--sharded' in sys.argv[1:]:
+        main_sharded()
+    else:
+        main()
\ No newline at end of file
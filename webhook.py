@@ -0,0 +1,186 @@
+import hmac
+import json
+import queue
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def update_chat_id(update: dict) -> Optional[str]:
+    chat = update.get("message", {}).get("chat")
+    return str(chat["id"]) if chat else None
+
+
+class WebhookServer:
+    # Embedded HTTP endpoint for Telegram webhook deliveries. Updates are
+    # validated, deduplicated by update_id and routed by chat to one of a
+    # fixed set of workers, so each chat is handled in order while different
+    # chats are handled in parallel.
+    SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+    def __init__(self, reminder, host: str = '0.0.0.0', port: int = 8443, path: str = '/webhook',
+                 secret_token: Optional[str] = None, workers: int = 4, queue_size: int = 1000,
+                 dedup_size: int = 10000):
+        self.reminder = reminder
+        self.path = path
+        self.secret_token = secret_token
+        self.dedup_size = dedup_size
+        self.seen = OrderedDict()
+        self.seen_lock = threading.Lock()
+        self.queues = [queue.Queue(max(1, queue_size // workers)) for _ in range(workers)]
+        self.workers = []
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.server_thread = None
+
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=1000)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def start(self):
+        for index, work_queue in enumerate(self.queues):
+            worker = threading.Thread(target=self.work, args=(work_queue,), name=f'webhook-worker-{index}',
+                                      daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name='webhook-server',
+                                              daemon=True)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        # Stop accepting deliveries, then let the workers drain their queues
+        self.server.shutdown()
+        self.server.server_close()
+        for work_queue in self.queues:
+            work_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def run(self, webhook_url: Optional[str] = None):
+        reminder = self.reminder
+        reminder.startup()
+        if webhook_url:
+            reminder.telegram.set_webhook(webhook_url, self.secret_token)
+        self.start()
+        reminder.log_message(f"Webhook listening on {self.address[0]}:{self.address[1]}{self.path}")
+        try:
+            while not reminder.shutdown_flag:
+                try:
+                    reminder.run_scheduled()
+                except Exception as e:
+                    reminder.log_message(f"Error in scheduler: {e}", 'error')
+                delay = reminder.seconds_until_next_due()
+                time.sleep(1 if delay is None else min(delay, 1))
+        finally:
+            self.stop()
+            if webhook_url:
+                reminder.telegram.delete_webhook()
+            reminder.log_message(f"Webhook stats: {self.stats()}")
+            reminder.shutdown()
+
+    def is_authorized(self, header: Optional[str]) -> bool:
+        if not self.secret_token:
+            return True
+        return header is not None and hmac.compare_digest(header, self.secret_token)
+
+    def is_duplicate(self, update_id: int) -> bool:
+        with self.seen_lock:
+            if update_id in self.seen:
+                return True
+            self.seen[update_id] = None
+            if len(self.seen) > self.dedup_size:
+                self.seen.popitem(last=False)
+            return False
+
+    def submit(self, update: dict) -> int:
+        # Returns the HTTP status to answer the delivery with. A full queue
+        # answers 503 so Telegram delivers the update again later.
+        if not isinstance(update, dict) or not isinstance(update.get("update_id"), int):
+            return 400
+        self.received += 1
+        if self.is_duplicate(update["update_id"]):
+            self.duplicates += 1
+            return 200
+
+        chat_id = update_chat_id(update) or ''
+        work_queue = self.queues[zlib.crc32(chat_id.encode()) % len(self.queues)]
+        try:
+            work_queue.put_nowait((update, time.monotonic()))
+        except queue.Full:
+            self.rejected += 1
+            with self.seen_lock:
+                self.seen.pop(update["update_id"], None)
+            return 503
+        return 200
+
+    def work(self, work_queue: queue.Queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            update, received_at = item
+            try:
+                reply = self.reminder.process_update(update)
+                if reply is not None:
+                    self.reminder.send_telegram_message(reply[1], reply[0], respect_quiet_hours=False)
+                self.processed += 1
+                self.latencies.append(time.monotonic() - received_at)
+            except Exception as e:
+                self.errors += 1
+                self.reminder.log_message(f"Error handling update {update.get('update_id')}: {e}", 'error')
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'errors': self.errors,
+            'queued': sum(work_queue.qsize() for work_queue in self.queues),
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    def make_handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                if self.path != webhook.path:
+                    return self.respond(404)
+                if not webhook.is_authorized(self.headers.get(webhook.SECRET_HEADER)):
+                    return self.respond(403)
+                try:
+                    update = json.loads(body)
+                except ValueError:
+                    return self.respond(400)
+                self.respond(webhook.submit(update))
+
+            def respond(self, status: int):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler